@@ -0,0 +1,434 @@
+"""
+Benchmark del chat (/chat y /chat/stream) sin red.
+
+Levanta stub_openai_server como reemplazo de OpenAI y la app en un
+uvicorn local (sin lifespan: ni el loop autónomo ni los precálculos
+compiten por la CPU), carga pedidos sintéticos en data_adapter y recorre
+conversaciones de varios turnos con varias tools por turno. Reporta por
+turno y en resumen:
+
+- tiempo al primer token (/chat/stream) y latencia total (ambos endpoints);
+- desglose de tiempo por tool (ai_engine.ESTADISTICAS_TOOLS);
+- aciertos de cachés: respuestas, memo de tools, contexto de negocio y
+  tokens de prompt cacheados (simulados por el stub), vía /chat/metricas.
+
+Nada sale de la máquina: el stub escucha en 127.0.0.1, clima y bencina
+se precargan en sus cachés, la memoria SQLite va a un directorio temporal.
+
+    python benchmark_chat.py --salida bench_chat.json
+    python benchmark_chat.py --salida bench_chat.json --comparar bench_chat_anterior.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import httpx
+import numpy as np
+import uvicorn
+
+from stub_openai_server import servidor_stub
+
+TOLERANCIA_TIEMPO = 0.20  # +20% en la mediana cuenta como regresión
+
+ZONAS = [("puente alto", -33.57, -70.58), ("la florida", -33.52, -70.59), ("macul", -33.49, -70.60)]
+
+CONVERSACIONES = [
+    [
+        {
+            "pregunta": "¿Cómo van las ventas y qué clientes están en riesgo?",
+            "rondas": [[
+                {"name": "get_kpis", "arguments": {}},
+                {"name": "get_customer_risk", "arguments": {}},
+                {"name": "get_customer_segments", "arguments": {"segment": "todos"}},
+            ]],
+            "respuesta": (
+                "**Diagnóstico:** Las ventas del mes van en línea con el anterior, pero hay clientes "
+                "frecuentes que superaron su cadencia personal. **Causa:** Menos recompra en la zona "
+                "más lejana. **Acción:** Contactar hoy a los 10 clientes de mayor valor en juego. "
+                "**Impacto:** Recuperar su gasto promedio mensual."
+            ),
+        },
+        {
+            "pregunta": "¿Y cómo se reparte eso por zona?",
+            "rondas": [[
+                {"name": "get_zone_analysis", "arguments": {"zone": "todas"}},
+                {"name": "get_route_intelligence", "arguments": {}},
+                {"name": "get_next_orders", "arguments": {"dias": 7}},
+            ]],
+            "respuesta": (
+                "**Diagnóstico:** Puente Alto concentra la mayoría de los pedidos. **Causa:** Es la "
+                "zona más cercana al local. **Acción:** Agrupar despachos de La Florida por bloque "
+                "horario. **Impacto:** Menos kilómetros por bidón entregado."
+            ),
+        },
+    ],
+    [
+        {
+            "pregunta": "Redacta una campaña para reactivar clientes en riesgo",
+            "rondas": [
+                [{"name": "analyze_campaign", "arguments": {"segment": "en_riesgo", "tipo_campana": "reactivacion", "oferta": "10% descuento"}}],
+                [{"name": "draft_campaign_message", "arguments": {"segment": "en_riesgo", "offer": "10% descuento"}}],
+            ],
+            "respuesta": (
+                "**Diagnóstico:** El segmento en riesgo tiene revenue recuperable. **Causa:** Pasaron "
+                "su cadencia habitual. **Acción:** Enviar el mensaje de WhatsApp hoy. **Impacto:** "
+                "ROI positivo desde el primer mes."
+            ),
+        },
+    ],
+    [
+        {
+            "pregunta": "¿Cómo van las ventas y qué clientes están en riesgo?",
+            "rondas": [[
+                {"name": "get_kpis", "arguments": {}},
+                {"name": "get_customer_risk", "arguments": {}},
+                {"name": "get_customer_segments", "arguments": {"segment": "todos"}},
+            ]],
+            "respuesta": "**Diagnóstico:** Igual que la consulta anterior.",
+        },
+    ],
+]
+
+
+def generar_pedidos_sinteticos(clientes: int, meses: int, semilla: int = 7) -> List[Dict]:
+    """Pedidos con el formato de data_adapter (usuario, fecha, precio,
+    dirección por zona, hora...) hasta ayer: cada cliente con su propia
+    cadencia y tamaño de pedido."""
+    rng = np.random.default_rng(semilla)
+    fin = date.today() - timedelta(days=1)
+    inicio = fin - timedelta(days=int(meses * 30.4))
+    pedidos = []
+    for c in range(clientes):
+        zona, lat, lon = ZONAS[rng.choice(3, p=[0.6, 0.3, 0.1])]
+        cadencia = float(rng.uniform(7, 45))
+        bidones = int(rng.choice([1, 2, 3], p=[0.3, 0.5, 0.2]))
+        fecha = inicio + timedelta(days=int(rng.uniform(0, cadencia)))
+        # Una parte de los clientes deja de comprar antes del final
+        corte = fin if rng.random() > 0.25 else inicio + timedelta(days=int(rng.uniform(0, (fin - inicio).days)))
+        while fecha <= corte:
+            pedidos.append({
+                "id": f"{c}-{len(pedidos)}",
+                "idpedido": f"{c}-{len(pedidos)}",
+                "usuario": f"cliente{c:04d}@sintetico.cl",
+                "telefonou": f"9{c:08d}",
+                "dire": f"calle {c} {100 + c}, {zona}",
+                "lat": str(lat + rng.normal(0, 0.01)),
+                "lon": str(lon + rng.normal(0, 0.01)),
+                "precio": str(2000 * bidones),
+                "fecha": fecha.strftime("%d-%m-%Y"),
+                "hora": f"{int(rng.integers(9, 20)):02d}:{int(rng.integers(0, 60)):02d}:00",
+                "ordenpedido": str(bidones),
+                "metodopago": str(rng.choice(["efectivo", "transferencia"])),
+                "status": "entregado",
+                "retirolocal": "no",
+                "nombrelocal": "Aguas Ancud",
+            })
+            fecha += timedelta(days=max(1, int(round(rng.normal(cadencia, cadencia * 0.25)))))
+    pedidos.sort(key=lambda p: datetime.strptime(p["fecha"], "%d-%m-%Y"))
+    return pedidos
+
+
+def guion_desde_conversaciones(conversaciones: List[List[Dict]]) -> Dict:
+    return {
+        turno["pregunta"]: {"rondas": turno["rondas"], "respuesta": turno["respuesta"]}
+        for conversacion in conversaciones for turno in conversacion
+    }
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def _entorno_sin_red(pedidos: List[Dict], base_url: str):
+    """Apunta OpenAI al stub y deja datos, clima, bencina y memoria listos
+    sin tocar la red; al salir restaura todo."""
+    import main
+    from data_adapter import data_adapter
+    from services import (
+        chat_cache_service, context_cache_service, conversation_summary_service,
+        fuel_service, memo_service, memory_service, weather_service,
+    )
+
+    entorno_previo = {k: os.environ.get(k) for k in ("OPENAI_API_KEY", "OPENAI_BASE_URL")}
+    previos = {
+        "pedidos": data_adapter.pedidos_antiguos_cache, "timestamp": data_adapter.cache_timestamp,
+        "db": memory_service.DB_PATH, "clima": dict(weather_service._cache), "bencina": dict(fuel_service._cache),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["OPENAI_API_KEY"] = "stub"
+        os.environ["OPENAI_BASE_URL"] = base_url
+        data_adapter.pedidos_antiguos_cache = pedidos
+        data_adapter.cache_timestamp = time.time()
+        data_adapter._indexar_pedidos(pedidos)
+        weather_service._cache.update(data={
+            "temp_actual": 18.0, "descripcion": "despejado", "humedad": 50, "lluvia_hoy_mm": 0,
+            "multiplicador_demanda_hoy": 1.16, "impacto_demanda_pct": 16.0,
+            "forecast_5_dias": [], "fuente": "benchmark", "timestamp": datetime.now().isoformat(),
+        }, timestamp=datetime.now().timestamp())
+        fuel_service._cache.update(data={
+            "precio_litro": 1250, "precio_litro_anterior": 1250, "variacion_pct": 0.0, "octanaje": 93,
+            "estacion": "Copec", "fuente": "benchmark", "timestamp": datetime.now().isoformat(), "cached": False,
+        }, timestamp=datetime.now().timestamp())
+        memory_service.DB_PATH = os.path.join(tmp, "agent_memory.db")
+        memory_service.inicializar_db()
+        chat_cache_service.limpiar_cache_chat()
+        memo_service.limpiar_memo()
+        context_cache_service.invalidar_contexto()
+        conversation_summary_service.limpiar_resumenes()
+        try:
+            yield main.app
+        finally:
+            for clave, valor in entorno_previo.items():
+                if valor is None:
+                    os.environ.pop(clave, None)
+                else:
+                    os.environ[clave] = valor
+            data_adapter.pedidos_antiguos_cache = previos["pedidos"]
+            data_adapter.cache_timestamp = previos["timestamp"]
+            data_adapter._indexar_pedidos(previos["pedidos"] or [])
+            if previos["pedidos"] is None:
+                data_adapter.version_datos = None
+            memory_service.DB_PATH = previos["db"]
+            weather_service._cache.update(previos["clima"])
+            fuel_service._cache.update(previos["bencina"])
+            # Lo calculado con los pedidos sintéticos no debe servirse después
+            chat_cache_service.limpiar_cache_chat()
+            memo_service.limpiar_memo()
+            context_cache_service.invalidar_contexto()
+            conversation_summary_service.limpiar_resumenes()
+
+
+@contextmanager
+def _servidor_app(app):
+    puerto = _puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=puerto, lifespan="off", log_level="warning"))
+    hilo = threading.Thread(target=servidor.run, name="benchmark-app", daemon=True)
+    hilo.start()
+    while not servidor.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{puerto}"
+    finally:
+        servidor.should_exit = True
+        hilo.join(timeout=5)
+
+
+def _turno_chat(cliente: httpx.Client, pregunta: str, historial: List[Dict]) -> Dict:
+    inicio = time.perf_counter()
+    resp = cliente.post("/chat", json={"message": pregunta, "history": historial})
+    total = time.perf_counter() - inicio
+    datos = resp.json()
+    return {"segundos_total": round(total, 4), "respuesta": datos.get("response")}
+
+
+def _turno_stream(cliente: httpx.Client, pregunta: str, historial: List[Dict]) -> Dict:
+    inicio = time.perf_counter()
+    primer_token = sugeridas = None
+    tokens, tools = [], []
+    with cliente.stream("POST", "/chat/stream", json={"message": pregunta, "history": historial}) as resp:
+        for linea in resp.iter_lines():
+            if not linea.startswith("data: ") or linea == "data: [DONE]":
+                continue
+            evento = json.loads(linea[6:])
+            if "token" in evento:
+                primer_token = primer_token or time.perf_counter() - inicio
+                tokens.append(evento["token"])
+            elif "tool" in evento:
+                tools.append(evento["tool"])
+            elif "suggested_questions" in evento:
+                sugeridas = time.perf_counter() - inicio
+    total = time.perf_counter() - inicio
+    return {
+        "segundos_primer_token": round(primer_token, 4) if primer_token is not None else None,
+        "segundos_sugeridas": round(sugeridas, 4) if sugeridas is not None else None,
+        "segundos_total": round(total, 4),
+        "tools": tools,
+        "respuesta": "".join(tokens),
+    }
+
+
+def _percentiles(valores: List[float]) -> Dict:
+    valores = [v for v in valores if v is not None]
+    if not valores:
+        return {}
+    return {
+        "p50": round(float(np.percentile(valores, 50)), 4),
+        "p95": round(float(np.percentile(valores, 95)), 4),
+        "max": round(max(valores), 4),
+    }
+
+
+def _delta_tools(antes: Dict, despues: Dict) -> Dict:
+    desglose = {}
+    for nombre, stats in despues.items():
+        previo = antes.get(nombre, {"llamadas": 0, "segundos_total": 0.0, "timeouts": 0})
+        llamadas = stats["llamadas"] - previo["llamadas"]
+        if llamadas <= 0:
+            continue
+        segundos = stats["segundos_total"] - previo["segundos_total"]
+        desglose[nombre] = {
+            "llamadas": llamadas,
+            "ms_promedio": round(segundos / llamadas * 1000, 1),
+            "ms_total": round(segundos * 1000, 1),
+            "timeouts": stats["timeouts"] - previo["timeouts"],
+            "compartidas": stats.get("compartidas", 0) - previo.get("compartidas", 0),
+        }
+    return dict(sorted(desglose.items(), key=lambda kv: -kv[1]["ms_total"]))
+
+
+def _tasa(aciertos: int, total: int):
+    return round(aciertos / total, 3) if total else None
+
+
+def correr_benchmark(
+    clientes: int = 300,
+    meses: int = 12,
+    repeticiones: int = 3,
+    latencia_respuesta: float = 0.25,
+    latencia_primer_token: float = 0.2,
+    latencia_token: float = 0.01,
+    conversaciones: List[List[Dict]] = None,
+) -> Dict:
+    from services import ai_engine
+
+    conversaciones = conversaciones or CONVERSACIONES
+    pedidos = generar_pedidos_sinteticos(clientes, meses)
+    latencias = {
+        "latencia_respuesta": latencia_respuesta,
+        "latencia_primer_token": latencia_primer_token,
+        "latencia_token": latencia_token,
+    }
+    turnos = []
+    with servidor_stub(guion_desde_conversaciones(conversaciones), **latencias) as (stub, base_url), \
+            _entorno_sin_red(pedidos, base_url) as app, \
+            _servidor_app(app) as url_app, \
+            httpx.Client(base_url=url_app, timeout=120, trust_env=False) as cliente:
+        # Tools que quedaron corriendo de antes (p.ej. una vencida) no deben
+        # sumarse al desglose de estas conversaciones
+        ai_engine.esperar_tools_en_curso(timeout=120)
+        tools_antes = {k: dict(v) for k, v in ai_engine.ESTADISTICAS_TOOLS.items()}
+        for repeticion in range(repeticiones):
+            for indice, conversacion in enumerate(conversaciones):
+                for endpoint, medir in (("/chat", _turno_chat), ("/chat/stream", _turno_stream)):
+                    historial = []
+                    for numero, turno in enumerate(conversacion):
+                        medicion = medir(cliente, turno["pregunta"], historial)
+                        historial += [
+                            {"role": "user", "content": turno["pregunta"]},
+                            {"role": "agent", "content": str(medicion.pop("respuesta"))},
+                        ]
+                        turnos.append({
+                            "repeticion": repeticion, "conversacion": indice, "turno": numero,
+                            "endpoint": endpoint, **medicion,
+                        })
+                        print(
+                            f"rep {repeticion} conv {indice} turno {numero} {endpoint}: "
+                            f"{medicion['segundos_total']:.3f}s",
+                            file=sys.stderr,
+                        )
+        metricas = cliente.get("/chat/metricas").json()
+        ai_engine.esperar_tools_en_curso(timeout=120)
+        tools = _delta_tools(tools_antes, ai_engine.ESTADISTICAS_TOOLS)
+        solicitudes_llm = stub.solicitudes
+
+    def filtrar(endpoint, campo):
+        return [t.get(campo) for t in turnos if t["endpoint"] == endpoint]
+
+    prompt = metricas.get("prompt", {})
+    respuestas, memo, contexto = (
+        metricas.get("cache_respuestas", {}), metricas.get("memo_tools", {}), metricas.get("contexto_negocio", {})
+    )
+    return {
+        "generado_en": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(), "cpus": os.cpu_count(), "plataforma": platform.platform(),
+        },
+        "config": {
+            "clientes": clientes, "meses": meses, "pedidos": len(pedidos),
+            "repeticiones": repeticiones, **latencias,
+        },
+        "resumen": {
+            "/chat": {"segundos_total": _percentiles(filtrar("/chat", "segundos_total"))},
+            "/chat/stream": {
+                "segundos_primer_token": _percentiles(filtrar("/chat/stream", "segundos_primer_token")),
+                "segundos_sugeridas": _percentiles(filtrar("/chat/stream", "segundos_sugeridas")),
+                "segundos_total": _percentiles(filtrar("/chat/stream", "segundos_total")),
+            },
+            "solicitudes_llm": solicitudes_llm,
+            "tasa_aciertos": {
+                "respuestas": _tasa(respuestas.get("aciertos", 0), respuestas.get("aciertos", 0) + respuestas.get("fallos", 0)),
+                "memo_tools": _tasa(memo.get("aciertos", 0), memo.get("aciertos", 0) + memo.get("fallos", 0)),
+                "contexto_negocio": _tasa(
+                    contexto.get("aciertos", 0), contexto.get("aciertos", 0) + contexto.get("construcciones", 0)
+                ),
+            },
+            "tasa_tokens_prompt_cacheados": {
+                tipo: _tasa(s.get("cached_tokens", 0), s.get("prompt_tokens", 0))
+                for tipo, s in prompt.items()
+            },
+        },
+        "tools": tools,
+        "metricas": metricas,
+        "turnos": turnos,
+    }
+
+
+def comparar_resultados(anterior: Dict, actual: Dict) -> List[Dict]:
+    """Regresiones en la mediana (p50) de cada métrica de tiempo del resumen."""
+    regresiones = []
+    for endpoint in ("/chat", "/chat/stream"):
+        for metrica, valores in actual["resumen"].get(endpoint, {}).items():
+            previo = anterior.get("resumen", {}).get(endpoint, {}).get(metrica, {}).get("p50")
+            ahora = valores.get("p50")
+            if previo and ahora and ahora > previo * (1 + TOLERANCIA_TIEMPO):
+                regresiones.append({"endpoint": endpoint, "metrica": metrica, "antes": previo, "ahora": ahora})
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--clientes', type=int, default=300, help='Clientes sintéticos')
+    parser.add_argument('--meses', type=int, default=12, help='Meses de historial sintético')
+    parser.add_argument('--repeticiones', type=int, default=3, help='Pasadas por todas las conversaciones')
+    parser.add_argument('--latencia-respuesta', type=float, default=0.25, help='Segundos por respuesta sin stream del LLM')
+    parser.add_argument('--latencia-primer-token', type=float, default=0.2, help='Segundos hasta el primer token del stream')
+    parser.add_argument('--latencia-token', type=float, default=0.01, help='Segundos entre tokens del stream')
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, stdout)')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para detectar regresiones')
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    reporte = correr_benchmark(
+        args.clientes, args.meses, args.repeticiones,
+        args.latencia_respuesta, args.latencia_primer_token, args.latencia_token,
+    )
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            reporte['regresiones'] = comparar_resultados(json.load(f), reporte)
+
+    texto = json.dumps(reporte, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    else:
+        print(texto)
+    if reporte.get('regresiones'):
+        print(f"{len(reporte['regresiones'])} regresiones respecto de {args.comparar}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""
+Benchmark del motor de pronóstico de demanda — costo vs precisión.
+
+Corre demand_forecast_service sobre historiales sintéticos (1, 3 y 10 años
+por defecto, con volumen diario configurable) y, para cada configuración
+(n_estimators, horizonte, cantidad de folds, multi-cuantil vs tres
+modelos), mide tiempo de pared y memoria pico de cada etapa y la precisión
+(MAPE) que se obtiene. Todo corre en frío: modelos y folds van a un
+directorio temporal, nunca se usan los cachés reales.
+
+La salida es JSON para poder comparar versiones:
+
+    python benchmark_pronostico.py --salida bench_nuevo.json
+    python benchmark_pronostico.py --salida bench_nuevo.json --comparar bench_anterior.json
+
+La memoria pico es la de Python (tracemalloc): incluye pandas/numpy pero no
+la memoria nativa de XGBoost. Los folds de validar_precision se calculan en
+serie: los procesos del pool (spawn) re-importan el módulo y no verían la
+configuración aplicada aquí.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+import xgboost
+
+from services import demand_forecast_service as dfs
+
+CONFIG_BASE = {'n_estimators': 150, 'horizonte': 30, 'folds': 30, 'modo': 'multi'}
+VARIANTES = {
+    'n_estimators': [50, 300],
+    'horizonte': [7],
+    'folds': [10],
+    'modo': ['tres'],
+}
+TOLERANCIA_TIEMPO = 0.20   # +20% de tiempo cuenta como regresión
+TOLERANCIA_MAPE_PTS = 1.0  # +1 punto de MAPE cuenta como regresión
+
+
+def generar_historial_sintetico(anos: float, pedidos_por_dia: float, semilla: int = 42) -> List[Dict]:
+    """Pedidos sintéticos hasta ayer: estacionalidad semanal (fines de
+    semana más altos) y anual (verano más alto), leve tendencia y ruido
+    Poisson — lo suficiente para que el modelo tenga algo que aprender."""
+    rng = np.random.default_rng(semilla)
+    dias = int(round(anos * 365))
+    fin = date.today() - timedelta(days=1)
+    pedidos = []
+    for i in range(dias):
+        fecha = fin - timedelta(days=dias - 1 - i)
+        semanal = 1.3 if fecha.weekday() >= 5 else 1.0
+        anual = 1.0 + 0.25 * np.cos(2 * np.pi * (fecha.timetuple().tm_yday - 15) / 365)
+        tendencia = 1.0 + 0.1 * i / max(dias, 1)
+        cantidad = rng.poisson(pedidos_por_dia * semanal * anual * tendencia)
+        pedidos.extend({'fecha': fecha.strftime('%d-%m-%Y'), 'nombrelocal': 'Aguas Ancud'} for _ in range(cantidad))
+    return pedidos
+
+
+def configuraciones(grid_completo: bool = False) -> List[Dict]:
+    """Una variación a la vez sobre CONFIG_BASE, o el producto completo."""
+    if grid_completo:
+        ejes = {k: [CONFIG_BASE[k]] + v for k, v in VARIANTES.items()}
+        return [dict(zip(ejes, valores)) for valores in itertools.product(*ejes.values())]
+    configs = [dict(CONFIG_BASE)]
+    for clave, valores in VARIANTES.items():
+        configs.extend({**CONFIG_BASE, clave: valor} for valor in valores)
+    return configs
+
+
+@contextmanager
+def _motor_en_frio(config: Dict):
+    """Aplica la configuración al motor y aísla sus cachés en un directorio
+    temporal; al salir restaura todo."""
+    originales = {
+        'PARAMETROS_MODELO': dfs.PARAMETROS_MODELO, 'MODO_CUANTILES': dfs.MODO_CUANTILES,
+        'RUTA_MODELOS': dfs.RUTA_MODELOS, 'RUTA_FOLDS': dfs.RUTA_FOLDS,
+        'MIN_FOLDS_PARALELO': dfs.MIN_FOLDS_PARALELO, '_modelos_en_memoria': dfs._modelos_en_memoria, '_folds': dfs._folds,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        dfs.PARAMETROS_MODELO = {**dfs.PARAMETROS_MODELO, 'n_estimators': config['n_estimators']}
+        dfs.MODO_CUANTILES = config['modo']
+        dfs.RUTA_MODELOS = os.path.join(tmp, 'modelos')
+        dfs.RUTA_FOLDS = os.path.join(tmp, 'folds.json')
+        dfs.MIN_FOLDS_PARALELO = float('inf')
+        dfs._modelos_en_memoria = {}
+        dfs._folds = None
+        try:
+            yield
+        finally:
+            for nombre, valor in originales.items():
+                setattr(dfs, nombre, valor)
+
+
+def _medir(funcion, *args, **kwargs):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, {'segundos': round(segundos, 4), 'memoria_pico_mb': round(pico / 1e6, 2)}
+
+
+def _mape(pronostico: List[Dict], reales: Dict[str, int]) -> float:
+    errores = [abs(d['p50'] - reales[d['fecha']]) / max(reales[d['fecha']], 1) for d in pronostico if d['fecha'] in reales]
+    return round(float(np.mean(errores)) * 100, 1) if errores else None
+
+
+def medir_configuracion(pedidos: List[Dict], config: Dict) -> Dict:
+    """Tiempos y memoria por etapa, más dos medidas de precisión: MAPE del
+    pronóstico recursivo sobre los últimos `horizonte` días reservados
+    (holdout) y el MAPE walk-forward de validar_precision con `folds`."""
+    with _motor_en_frio(config):
+        etapas = {}
+        serie, etapas['construir_serie_diaria'] = _medir(dfs.construir_serie_diaria, pedidos)
+        features, etapas['agregar_features'] = _medir(dfs.agregar_features, serie)
+        _, etapas['entrenar_modelos'] = _medir(dfs.entrenar_modelos, features, config['modo'])
+
+        corte = serie['fecha'].iloc[-config['horizonte']]
+        fecha_corte = corte.strftime('%d-%m-%Y')
+        entrenamiento = [p for p in pedidos if datetime.strptime(p['fecha'], '%d-%m-%Y').date() < corte]
+        pronostico, etapas['predecir_proximos_dias'] = _medir(
+            dfs.predecir_proximos_dias, entrenamiento, dias=config['horizonte']
+        )
+        validacion, etapas['validar_precision'] = _medir(dfs.validar_precision, pedidos, dias_test=config['folds'])
+
+    reales = {str(f): int(n) for f, n in zip(serie['fecha'], serie['pedidos'])}
+    return {
+        'config': config,
+        'dias_historial': len(serie),
+        'corte_holdout': fecha_corte,
+        'etapas': etapas,
+        'segundos_total': round(sum(e['segundos'] for e in etapas.values()), 4),
+        'mape_holdout_pct': _mape(pronostico, reales),
+        'mape_walk_forward_pct': validacion['mape_pct'],
+    }
+
+
+def correr_benchmark(anos: List[float], pedidos_por_dia: float, grid_completo: bool = False) -> Dict:
+    resultados = []
+    for anos_historial in anos:
+        pedidos = generar_historial_sintetico(anos_historial, pedidos_por_dia)
+        for config in configuraciones(grid_completo):
+            medicion = medir_configuracion(pedidos, config)
+            resultados.append({'anos_historial': anos_historial, 'pedidos_por_dia': pedidos_por_dia, **medicion})
+            print(
+                f"{anos_historial:>4} años {json.dumps(config)}: {medicion['segundos_total']:.2f}s, "
+                f"MAPE holdout {medicion['mape_holdout_pct']}%, walk-forward {medicion['mape_walk_forward_pct']}%",
+                file=sys.stderr,
+            )
+    return {
+        'generado_en': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(), 'xgboost': xgboost.__version__,
+            'cpus': os.cpu_count(), 'plataforma': platform.platform(),
+        },
+        'resultados': resultados,
+    }
+
+
+def _clave_resultado(r: Dict) -> str:
+    return json.dumps([r['anos_historial'], r['pedidos_por_dia'], r['config']], sort_keys=True)
+
+
+def comparar_resultados(anterior: Dict, actual: Dict) -> List[Dict]:
+    """Regresiones de `actual` contra `anterior` para las mismas
+    combinaciones (historial, volumen, configuración): tiempo total más de
+    TOLERANCIA_TIEMPO peor o MAPE más de TOLERANCIA_MAPE_PTS puntos peor."""
+    previos = {_clave_resultado(r): r for r in anterior.get('resultados', [])}
+    regresiones = []
+    for r in actual.get('resultados', []):
+        previo = previos.get(_clave_resultado(r))
+        if previo is None:
+            continue
+        if r['segundos_total'] > previo['segundos_total'] * (1 + TOLERANCIA_TIEMPO):
+            regresiones.append({'clave': _clave_resultado(r), 'metrica': 'segundos_total',
+                                'antes': previo['segundos_total'], 'ahora': r['segundos_total']})
+        for metrica in ('mape_holdout_pct', 'mape_walk_forward_pct'):
+            if r[metrica] is not None and previo[metrica] is not None and \
+                    r[metrica] > previo[metrica] + TOLERANCIA_MAPE_PTS:
+                regresiones.append({'clave': _clave_resultado(r), 'metrica': metrica,
+                                    'antes': previo[metrica], 'ahora': r[metrica]})
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--anos', type=float, nargs='+', default=[1, 3, 10], help='Años de historial sintético')
+    parser.add_argument('--pedidos-por-dia', type=float, default=20, help='Volumen diario promedio')
+    parser.add_argument('--grid-completo', action='store_true', help='Producto de todas las variantes')
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, stdout)')
+    parser.add_argument('--comparar', help='JSON de una corrida anterior para detectar regresiones')
+    args = parser.parse_args()
+
+    reporte = correr_benchmark(args.anos, args.pedidos_por_dia, args.grid_completo)
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            reporte['regresiones'] = comparar_resultados(json.load(f), reporte)
+
+    texto = json.dumps(reporte, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    else:
+        print(texto)
+    if reporte.get('regresiones'):
+        print(f"{len(reporte['regresiones'])} regresiones respecto de {args.comparar}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
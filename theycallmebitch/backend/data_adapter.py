@@ -4,6 +4,7 @@ Mantiene compatibilidad total con el frontend existente
 """
 
 import os
+import hashlib
 import requests
 import json
 from datetime import datetime
@@ -124,6 +125,11 @@ class DataAdapter:
         self.pedidos_nuevos_cache = None
         self.cache_timestamp = None
         self.cache_duration = 1800  # 30 minutos
+        # Índice usuario -> posiciones en pedidos_antiguos_cache (la lista
+        # canónica), y huella del contenido de esa lista. La versión solo
+        # cambia si los pedidos cambian, no en cada refresco del cache.
+        self.indice_por_usuario: Dict[str, List[int]] = {}
+        self.version_datos: Optional[str] = None
     
     def _is_cache_valid(self) -> bool:
         """Verifica si el cache es válido"""
@@ -131,6 +137,32 @@ class DataAdapter:
             return False
         return (datetime.now().timestamp() - self.cache_timestamp) < self.cache_duration
     
+    def _indexar_pedidos(self, pedidos: List[Dict]):
+        """Reconstruye el índice por usuario y la versión de los datos."""
+        indice: Dict[str, List[int]] = {}
+        huella = hashlib.md5()
+        for posicion, pedido in enumerate(pedidos):
+            usuario = str(pedido.get('usuario', '') or '').strip()
+            if usuario:
+                indice.setdefault(usuario, []).append(posicion)
+            huella.update(
+                f"{pedido.get('id', '')}|{pedido.get('fecha', '')}|{pedido.get('status', '')}|{pedido.get('precio', '')}\n".encode()
+            )
+        self.indice_por_usuario = indice
+        self.version_datos = huella.hexdigest()
+        # El índice de búsqueda también lo usa el geocoding para normalizar
+        # direcciones: se pone al día con cada refresco, no recién con la
+        # primera búsqueda después de un reinicio.
+        from services.customer_search_service import sincronizar_indice
+        sincronizar_indice(pedidos, self.version_datos)
+
+    def obtener_pedidos_de_usuario(self, usuario: str) -> List[Dict]:
+        """Pedidos de un solo cliente vía el índice — O(pedidos del cliente),
+        sin recorrer la lista completa."""
+        pedidos = self.obtener_pedidos_combinados()
+        posiciones = self.indice_por_usuario.get(str(usuario or '').strip(), [])
+        return [pedidos[i] for i in posiciones]
+
     def fetch_pedidos_antiguos(self) -> List[Dict]:
         """Obtiene pedidos previos a la migración desde el snapshot local.
 
@@ -378,6 +410,7 @@ class DataAdapter:
             # Actualizar cache
             self.pedidos_antiguos_cache = pedidos_combinados
             self.cache_timestamp = datetime.now().timestamp()
+            self._indexar_pedidos(pedidos_combinados)
             
             logger.info("Cache actualizado exitosamente")
             return pedidos_combinados
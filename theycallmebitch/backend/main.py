@@ -26,24 +26,40 @@ from data_adapter import data_adapter
 from pydantic import BaseModel
 from services.ai_engine import (
     run_autonomous_insight,
-    run_chat_query_prepare,
     run_chat_query_with_rec_id,
+    run_chat_query_prepare_async,
+    stream_respuesta,
+    generar_preguntas_sugeridas,
+    CARACTERES_PREGUNTAS_SUGERIDAS,
+    ESTADISTICAS_TOOLS,
+    ESTADISTICAS_PROMPT,
 )
+from services.chat_cache_service import estadisticas_cache_chat
+from services.tool_output_service import ESTADISTICAS_FORMA
+from services.conversation_summary_service import estadisticas_resumenes
 from services.business_context import build_business_context
-from services.rfm_engine import calcular_rfm
+from services.rfm_engine import calcular_rfm, calcular_segmentos_por_mes, matriz_transicion_segmentos
 from services.zone_engine import analizar_zonas
 from services.weather_service import obtener_clima
 from services.fuel_service import obtener_precio_bencina
 from services.memory_service import (
     inicializar_db, guardar_insight, guardar_snapshot_kpis,
     obtener_contexto_historico, guardar_briefing, obtener_briefing_hoy,
-    obtener_historial_insights, get_recent_recommendations, actualizar_recomendacion
+    obtener_historial_insights, get_recent_recommendations, actualizar_recomendacion,
+    guardar_snapshots_rfm, obtener_snapshots_rfm
 )
 from services.briefing_service import generar_briefing
 from services import geocoding_service
 from services import demand_forecast_service
 from services import customer_risk_service
+from services import next_order_service
 from services import customer_profile_service
+from services import customer_search_service
+from services import cohort_service
+from services import hierarchical_forecast_service
+from services import precompute_service
+from services import context_cache_service
+from services.memo_service import estadisticas_memo, memorizar
 
 app = FastAPI(title="API Aguas Ancud", version="2.0")
 
@@ -375,6 +391,44 @@ def get_pedidos():
 
 
 
+# Análisis globales de clientes (RFM + riesgo) por versión de datos: dependen
+# de todos los clientes a la vez, pero la ficha individual solo necesita leer
+# la fila de un usuario. La fecha entra en la clave porque recencia y atraso
+# cambian con el día aunque los pedidos no cambien.
+_cache_analisis_clientes = {"clave": None, "segmentos": {}, "riesgo": {}}
+
+
+def _filtrar_aguas_ancud(pedidos: List[Dict]) -> List[Dict]:
+    df = pd.DataFrame(pedidos)
+    if 'nombrelocal' in df.columns:
+        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
+    return df.to_dict('records')
+
+
+def _obtener_analisis_clientes(pedidos_filtrados: Optional[List[Dict]] = None) -> Dict:
+    clave = (data_adapter.version_datos, date.today())
+    if data_adapter.version_datos is not None and _cache_analisis_clientes["clave"] == clave:
+        return _cache_analisis_clientes
+
+    if pedidos_filtrados is None:
+        pedidos_filtrados = _filtrar_aguas_ancud(data_adapter.obtener_pedidos_combinados())
+
+    riesgo = customer_risk_service.calcular_riesgo_clientes(pedidos_filtrados)
+    try:
+        rfm_data = calcular_rfm(pedidos_filtrados)
+        segmentos = rfm_data.get('segmento_por_cliente', {})
+    except Exception as e:
+        logger.error(f"Error calculando RFM para clientes: {e}", exc_info=True)
+        segmentos = {}
+
+    _cache_analisis_clientes.update({
+        "clave": clave,
+        "segmentos": segmentos,
+        "riesgo": {c['usuario']: c for c in riesgo['clientes']},
+    })
+    return _cache_analisis_clientes
+
+
 @app.get("/clientes", response_model=List[Dict])
 def get_clientes():
     """Perfil agregado de clientes: se agrupan todos los pedidos por
@@ -389,24 +443,15 @@ def get_clientes():
         logger.error(f"Error al obtener pedidos para /clientes: {e}", exc_info=True)
         return []
 
-    df = pd.DataFrame(pedidos)
-    if 'nombrelocal' in df.columns:
-        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
-    pedidos_filtrados = df.to_dict('records')
+    pedidos_filtrados = _filtrar_aguas_ancud(pedidos)
 
     perfiles = customer_profile_service.construir_perfiles_clientes(pedidos_filtrados)
     if not perfiles:
         return []
 
-    riesgo = customer_risk_service.calcular_riesgo_clientes(pedidos_filtrados)
-    estado_por_usuario = {c['usuario']: c for c in riesgo['clientes']}
-
-    try:
-        rfm_data = calcular_rfm(pedidos_filtrados)
-        segmento_por_usuario = rfm_data.get('segmento_por_cliente', {})
-    except Exception as e:
-        logger.error(f"Error calculando RFM para /clientes: {e}", exc_info=True)
-        segmento_por_usuario = {}
+    analisis = _obtener_analisis_clientes(pedidos_filtrados)
+    estado_por_usuario = analisis["riesgo"]
+    segmento_por_usuario = analisis["segmentos"]
 
     segmentos_vip = {'campeon', 'leal'}
 
@@ -427,6 +472,47 @@ def get_clientes():
     resultado.sort(key=lambda c: c['total_comprado'], reverse=True)
     return resultado
 
+
+@app.get("/clientes/buscar", response_model=List[Dict])
+def buscar_clientes(q: str = Query(..., min_length=1), limite: int = Query(20, ge=1, le=100)):
+    """Búsqueda tolerante a errores de tipeo por email, teléfono o
+    dirección, ordenada por similitud. El índice de trigramas se pone al día
+    solo cuando cambia data_adapter.version_datos. Declarado antes de
+    /clientes/{usuario} para que "buscar" no se tome como usuario."""
+    try:
+        pedidos = data_adapter.obtener_pedidos_combinados()
+    except Exception as e:
+        logger.error(f"Error al obtener pedidos para /clientes/buscar: {e}", exc_info=True)
+        raise HTTPException(status_code=502, detail="No se pudo obtener los pedidos")
+
+    customer_search_service.sincronizar_indice(pedidos, data_adapter.version_datos)
+    return customer_search_service.buscar_clientes(q, limite=limite)
+
+
+@app.get("/clientes/{usuario}", response_model=Dict)
+def get_cliente(usuario: str):
+    """Ficha 360 de un cliente: pedidos, segmento RFM, estado de riesgo,
+    cadencia, cumplimiento de horario y ubicación. Sus pedidos salen del
+    índice por usuario de data_adapter (sin recorrer todos los pedidos)."""
+    try:
+        pedidos_cliente = data_adapter.obtener_pedidos_de_usuario(usuario)
+    except Exception as e:
+        logger.error(f"Error al obtener pedidos de {usuario}: {e}", exc_info=True)
+        raise HTTPException(status_code=502, detail="No se pudo obtener los pedidos del cliente")
+
+    if not pedidos_cliente:
+        raise HTTPException(status_code=404, detail=f"Cliente '{usuario}' no encontrado")
+
+    analisis = _obtener_analisis_clientes()
+    ficha = customer_profile_service.construir_ficha_cliente(
+        usuario, pedidos_cliente,
+        segmento=analisis["segmentos"].get(usuario),
+        riesgo=analisis["riesgo"].get(usuario),
+    )
+    if ficha is None:
+        raise HTTPException(status_code=404, detail=f"Cliente '{usuario}' no encontrado")
+    return ficha
+
 @app.get("/pedidos-v2", response_model=List[Dict])
 def get_pedidos_v2():
     """Endpoint con nuevo esquema MongoDB para pedidos"""
@@ -676,7 +762,19 @@ def get_kpis():
 
 GLOBAL_INSIGHTS = []
 
-def _build_full_context():
+def _build_full_context(esperar_vigente: bool = False):
+    """Contexto completo cacheado por versión de sus entradas; si cambiaron,
+    se reconstruye en segundo plano (ver context_cache_service)."""
+    return context_cache_service.obtener_contexto(
+        _construir_contexto_completo, _firma_contexto, esperar_vigente=esperar_vigente
+    )
+
+
+def _firma_contexto() -> tuple:
+    return context_cache_service.firma_entradas(data_adapter.version_datos)
+
+
+def _construir_contexto_completo():
     """Construye contexto completo con todos los módulos."""
     try:
         kpis_data = get_kpis()
@@ -687,13 +785,15 @@ def _build_full_context():
     pedidos = []
     try:
         pedidos = data_adapter.obtener_pedidos_combinados()
-        rfm_data = calcular_rfm(pedidos)
+        # Mismo memo que las tools del chat: RFM y zonas se calculan una vez
+        # por versión de datos, no en cada pasada del loop ni en cada turno.
+        rfm_data = memorizar("calcular_rfm", None, pedidos, lambda: calcular_rfm(pedidos))
     except Exception as e:
         logger.error(f"Error calculando RFM: {e}")
         rfm_data = {}
 
     try:
-        zonas_data = analizar_zonas(pedidos)
+        zonas_data = memorizar("analizar_zonas", None, pedidos, lambda: analizar_zonas(pedidos))
     except Exception as e:
         logger.error(f"Error analizando zonas: {e}")
         zonas_data = {}
@@ -731,9 +831,13 @@ def _build_full_context():
 
 def _decidir_si_generar_insight(pedidos: list, generar_insight_fn, context: dict) -> list:
     """Solo llama a OpenAI (generar_insight_fn) si anomaly_detection_service
-    encuentra una desviación real — evita el costo de una llamada incondicional."""
-    from services.anomaly_detection_service import detectar_anomalias
-    anomalias = detectar_anomalias(pedidos)
+    encuentra una desviación real — evita el costo de una llamada incondicional.
+    Durante el día compara contra lo normal a esta hora; sin línea base
+    intradía, contra los días completos."""
+    from services.anomaly_detection_service import detectar_anomalias, detectar_anomalias_intradia
+    anomalias = detectar_anomalias_intradia(pedidos, version_datos=data_adapter.version_datos)
+    if anomalias is None:
+        anomalias = detectar_anomalias(pedidos, version_datos=data_adapter.version_datos)
     if not anomalias:
         return []
     return generar_insight_fn(context)
@@ -761,7 +865,7 @@ async def ai_autonomous_loop():
         try:
             # 15 minutos — balance costo/frescura
             await asyncio.sleep(900)
-            context = _build_full_context()
+            context = _build_full_context(esperar_vigente=True)
             pedidos = data_adapter.obtener_pedidos_combinados()
             nuevas_alertas = _decidir_si_generar_insight(pedidos, run_autonomous_insight, context)
             if nuevas_alertas:
@@ -777,6 +881,10 @@ async def ai_autonomous_loop():
 async def startup_event():
     inicializar_db()
     asyncio.create_task(ai_autonomous_loop())
+    asyncio.create_task(precompute_service.programador_precalculos(
+        {**TAREAS_PRECALCULO, "pronostico_jerarquico": _actualizar_pronostico_jerarquico},
+        _version_datos_actual,
+    ))
 
 @app.get("/insights")
 def get_autonomous_insights():
@@ -828,8 +936,7 @@ async def chat_stream(req: ChatRequest):
             history = [{"role": m.role, "content": m.content} for m in req.history]
 
             # Fase A: resolver tools silenciosamente
-            final_conv, tools_used, rec_id = await asyncio.to_thread(
-                run_chat_query_prepare,
+            final_conv, tools_used, rec_id = await run_chat_query_prepare_async(
                 context, req.message, history, pedidos,
             )
 
@@ -837,51 +944,35 @@ async def chat_stream(req: ChatRequest):
             for tool_name in tools_used:
                 yield f"data: {json.dumps({'tool': tool_name})}\n\n"
 
-            # Fase B: streaming de la respuesta final
-            from openai import OpenAI
-            oai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
-            stream = oai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=final_conv,
-                temperature=0.25,
-                max_tokens=1200,
-                stream=True,
-            )
-
+            # Fase B: streaming de la respuesta final. Las preguntas sugeridas
+            # se piden apenas hay texto suficiente y se emiten cuando llegan,
+            # sin esperar a que termine el stream.
             accumulated = ""
-            for chunk in stream:
-                delta = chunk.choices[0].delta.content if chunk.choices else None
-                if delta:
+            tarea_sugeridas = None
+            sugeridas_emitidas = False
+            try:
+                async for delta in stream_respuesta(final_conv):
                     accumulated += delta
                     yield f"data: {json.dumps({'token': delta})}\n\n"
-
-            # Generar preguntas sugeridas (llamada rápida post-stream)
-            try:
-                sq_resp = oai_client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": (
-                                "Genera exactamente 3 preguntas de seguimiento cortas en español "
-                                "(máx 10 palabras cada una) relevantes para continuar este análisis. "
-                                "Responde SOLO con un JSON array de strings, sin markdown."
-                            ),
-                        },
-                        {
-                            "role": "user",
-                            "content": f"Pregunta: {req.message}\nRespuesta: {accumulated[:400]}",
-                        },
-                    ],
-                    max_tokens=100,
-                    temperature=0.4,
-                )
-                raw_sq = sq_resp.choices[0].message.content.strip()
-                suggested = json.loads(raw_sq)
-                if isinstance(suggested, list):
-                    yield f"data: {json.dumps({'suggested_questions': suggested[:3]})}\n\n"
-            except Exception:
-                pass
+                    if tarea_sugeridas is None:
+                        if len(accumulated) >= CARACTERES_PREGUNTAS_SUGERIDAS:
+                            tarea_sugeridas = asyncio.create_task(
+                                generar_preguntas_sugeridas(req.message, accumulated)
+                            )
+                    elif not sugeridas_emitidas and tarea_sugeridas.done():
+                        sugeridas_emitidas = True
+                        if tarea_sugeridas.result():
+                            yield f"data: {json.dumps({'suggested_questions': tarea_sugeridas.result()})}\n\n"
+
+                if tarea_sugeridas is None:
+                    tarea_sugeridas = asyncio.create_task(generar_preguntas_sugeridas(req.message, accumulated))
+                if not sugeridas_emitidas:
+                    suggested = await tarea_sugeridas
+                    if suggested:
+                        yield f"data: {json.dumps({'suggested_questions': suggested})}\n\n"
+            finally:
+                if tarea_sugeridas is not None and not tarea_sugeridas.done():
+                    tarea_sugeridas.cancel()
 
             # Meta final (is_campaign, tools usados)
             is_campaign = "draft_campaign_message" in tools_used
@@ -903,6 +994,21 @@ async def chat_stream(req: ChatRequest):
     )
 
 
+@app.get("/chat/metricas")
+def chat_metricas():
+    """Aciertos de caché del chat y del contexto, memo de tools, tiempos por
+    tool, tokens recortados y tokens de prompt cacheados por OpenAI."""
+    return {
+        "cache_respuestas": estadisticas_cache_chat(),
+        "contexto_negocio": context_cache_service.estadisticas_contexto(),
+        "memo_tools": estadisticas_memo(),
+        "tools": {nombre: dict(stats) for nombre, stats in ESTADISTICAS_TOOLS.items()},
+        "forma_resultados": {nombre: dict(stats) for nombre, stats in ESTADISTICAS_FORMA.items()},
+        "prompt": {tipo: dict(stats) for tipo, stats in ESTADISTICAS_PROMPT.items()},
+        "resumenes_historial": estadisticas_resumenes(),
+    }
+
+
 @app.patch("/recommendations/{rec_id}")
 def update_recommendation(rec_id: int, feedback: RecomendacionFeedback):
     """Marca una recomendación como ejecutada y guarda el resultado."""
@@ -933,6 +1039,40 @@ def get_rfm():
         return {}
 
 
+@app.get("/rfm/transiciones")
+def get_rfm_transiciones():
+    """Matriz de transición entre segmentos RFM mes a mes. Los meses ya
+    cerrados quedan guardados; solo se clasifican los que cerraron desde
+    la última vez."""
+    try:
+        guardados = obtener_snapshots_rfm()
+        ultimo_mes = max(guardados) if guardados else None
+        pedidos = data_adapter.obtener_pedidos_combinados()
+        nuevos = calcular_segmentos_por_mes(pedidos, desde_mes=ultimo_mes)
+        guardar_snapshots_rfm(nuevos)
+        return matriz_transicion_segmentos({**guardados, **nuevos})
+    except Exception as e:
+        logger.error(f"Error en /rfm/transiciones: {e}")
+        return {"meses": [], "matriz": {}, "transiciones_por_mes": []}
+
+
+@app.get("/cohortes")
+def get_cohortes(
+    meses: int = Query(12, ge=1, le=120, description="Cohortes recientes a devolver"),
+    horizonte: int = Query(12, ge=1, le=120, description="Meses desde la primera compra por cohorte"),
+):
+    """Matriz de retención y curvas de recompra por cohorte de primera
+    compra. Se calcula una vez por versión de datos y día; `meses` y
+    `horizonte` solo recortan la respuesta."""
+    try:
+        pedidos = data_adapter.obtener_pedidos_combinados()
+        cohortes = cohort_service.obtener_cohortes(pedidos, data_adapter.version_datos)
+        return cohort_service.recortar_cohortes(cohortes, horizonte_meses=horizonte, ultimas_cohortes=meses)
+    except Exception as e:
+        logger.error(f"Error en /cohortes: {e}")
+        return {"cohortes": [], "retencion_promedio_pct": [], "activacion": {}}
+
+
 @app.get("/zonas")
 def get_zonas():
     """Análisis geográfico de zonas de Ancud."""
@@ -2840,31 +2980,15 @@ def get_ventas_locales_test():
         "clientes_unicos": 15
     }
 
-_cache_predictor_demanda = {"respuesta": None, "timestamp": 0}
-_CACHE_PREDICTOR_DEMANDA_TTL = 600  # 10 min — coincide con el auto-refresh del frontend
-
-
-@app.get("/predictor/demanda", response_model=Dict)
-def get_predictor_demanda():
-    """Pronóstico de demanda: próximos 7 días con rango P10-P90 y
-    proyección de fin de mes, más la precisión histórica real del modelo.
+PRECALCULO_PREDICTOR_DEMANDA = "predictor_demanda"
+PRECALCULO_CLIENTES_RIESGO = "predictor_clientes_riesgo"
+PRECALCULO_PROXIMOS_PEDIDOS = "predictor_proximos_pedidos"
 
-    Entrenar los 3 modelos de cuantiles + la validación walk-forward (hasta
-    30 reentrenamientos) toma varios segundos; se cachea la respuesta por
-    unos minutos para que no cada carga de la página quede esperando ese
-    cómputo completo — los pedidos reales no cambian tan seguido como para
-    justificarlo en cada request."""
-    ahora = datetime.now().timestamp()
-    if _cache_predictor_demanda["respuesta"] is not None and \
-            (ahora - _cache_predictor_demanda["timestamp"]) < _CACHE_PREDICTOR_DEMANDA_TTL:
-        return _cache_predictor_demanda["respuesta"]
-
-    try:
-        pedidos = data_adapter.obtener_pedidos_combinados()
-    except Exception as e:
-        logger.error(f"Error al obtener pedidos para predictor de demanda: {e}", exc_info=True)
-        return {"dias_7": [], "manana": None, "proyeccion_mes": None, "precision_historica_pct": None}
 
+def _calcular_predictor_demanda() -> Dict:
+    """Pronóstico de demanda completo: próximos días con rango P10-P90,
+    proyección de fin de mes y precisión histórica (walk-forward)."""
+    pedidos = data_adapter.obtener_pedidos_combinados()
     df = pd.DataFrame(pedidos)
     if 'nombrelocal' in df.columns:
         df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
@@ -2890,8 +3014,6 @@ def get_predictor_demanda():
             "precision_historica_pct": validacion['mape_pct'],
             "dias_evaluados": validacion['dias_evaluados'],
         }
-        _cache_predictor_demanda["respuesta"] = resultado
-        _cache_predictor_demanda["timestamp"] = ahora
         return resultado
 
     manana = dias_7[0]
@@ -2925,26 +3047,130 @@ def get_predictor_demanda():
         "precision_historica_pct": validacion['mape_pct'],
         "dias_evaluados": validacion['dias_evaluados'],
     }
-    _cache_predictor_demanda["respuesta"] = resultado
-    _cache_predictor_demanda["timestamp"] = ahora
     return resultado
 
 
-@app.get("/predictor/clientes-riesgo", response_model=Dict)
-def get_predictor_clientes_riesgo():
-    """Clientes en riesgo: cadencia personal por cliente, probabilidad
-    empírica de reorden, priorizados por valor en juego."""
+def _calcular_predictor_clientes_riesgo() -> Dict:
+    pedidos = data_adapter.obtener_pedidos_combinados()
+    return customer_risk_service.calcular_riesgo_clientes(_filtrar_aguas_ancud(pedidos))
+
+
+def _calcular_predictor_proximos_pedidos() -> Dict:
+    pedidos = data_adapter.obtener_pedidos_combinados()
+    return next_order_service.obtener_tabla_proximos_pedidos(pedidos, data_adapter.version_datos)
+
+
+def _responder_precalculado(nombre: str, calcular, vacio: Dict) -> Dict:
+    """Respuesta desde el precálculo del programador nocturno; solo si
+    nunca se ha precalculado se calcula en línea (y se guarda)."""
+    entrada = precompute_service.obtener_precalculo(nombre)
+    if entrada is None:
+        try:
+            resultado = calcular()
+        except Exception as e:
+            logger.error(f"Error calculando {nombre} en línea: {e}", exc_info=True)
+            return vacio
+        entrada = precompute_service.guardar_precalculo(nombre, resultado, data_adapter.version_datos)
+    return {**entrada["resultado"], "calculado_en": entrada["calculado_en"]}
+
+
+def _version_datos_actual() -> Optional[str]:
+    data_adapter.obtener_pedidos_combinados()  # refresca el caché de 30 min si venció
+    return data_adapter.version_datos
+
+
+def _actualizar_pronostico_jerarquico() -> None:
+    # Tiene su propio caché en disco (y su chequeo de vigencia): el
+    # programador solo dispara el recálculo, no guarda copia.
+    pedidos = data_adapter.obtener_pedidos_combinados()
+    hierarchical_forecast_service.actualizar_pronostico_jerarquico(pedidos, data_adapter.version_datos)
+
+
+# Lo que el programador mantiene precalculado.
+TAREAS_PRECALCULO = {
+    PRECALCULO_PREDICTOR_DEMANDA: _calcular_predictor_demanda,
+    PRECALCULO_CLIENTES_RIESGO: _calcular_predictor_clientes_riesgo,
+    PRECALCULO_PROXIMOS_PEDIDOS: _calcular_predictor_proximos_pedidos,
+}
+
+
+@app.get("/predictor/demanda", response_model=Dict)
+def get_predictor_demanda():
+    """Pronóstico de demanda: próximos 7 días con rango P10-P90 y
+    proyección de fin de mes, más la precisión histórica real del modelo.
+
+    Se sirve desde el precálculo (ver programador_precalculos en el
+    startup): se recalcula al cerrar el día y cuando llegan pedidos nuevos,
+    así que ningún visitante paga el entrenamiento. `calculado_en` indica
+    cuándo se calculó."""
+    return _responder_precalculado(
+        PRECALCULO_PREDICTOR_DEMANDA, _calcular_predictor_demanda,
+        {"dias_7": [], "manana": None, "proyeccion_mes": None, "precision_historica_pct": None},
+    )
+
+
+@app.get("/predictor/demanda/jerarquico", response_model=Dict)
+def get_predictor_demanda_jerarquico(background_tasks: BackgroundTasks):
+    """Pronóstico por canal (local / domicilio) y por zona, reconciliado
+    para que sume el total. Siempre responde desde lo ya calculado: si los
+    datos cambiaron desde el último cálculo, se recalcula en segundo plano
+    (un pool de procesos, fuera del request) y mientras tanto se sirve la
+    versión anterior marcada como "actualizando"."""
     try:
         pedidos = data_adapter.obtener_pedidos_combinados()
     except Exception as e:
-        logger.error(f"Error al obtener pedidos para riesgo de clientes: {e}", exc_info=True)
-        return {"resumen": {"activos": 0, "en_riesgo": 0, "inactivos": 0}, "clientes": []}
+        logger.error(f"Error al obtener pedidos para pronóstico jerárquico: {e}", exc_info=True)
+        pedidos = None
+
+    version = data_adapter.version_datos
+    vigente = hierarchical_forecast_service.esta_vigente(version)
+    if pedidos and not vigente and not hierarchical_forecast_service.calculo_en_curso():
+        background_tasks.add_task(hierarchical_forecast_service.actualizar_pronostico_jerarquico, pedidos, version)
+
+    guardado = hierarchical_forecast_service.obtener_pronostico_jerarquico()
+    if guardado is None:
+        return {"estado": "calculando", "total": [], "canales": {}, "zonas": {}}
+    return {**guardado, "estado": "vigente" if vigente else "actualizando"}
 
-    df = pd.DataFrame(pedidos)
-    if 'nombrelocal' in df.columns:
-        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
 
-    return customer_risk_service.calcular_riesgo_clientes(df.to_dict('records'))
+@app.get("/predictor/clientes-riesgo", response_model=Dict)
+def get_predictor_clientes_riesgo():
+    """Clientes en riesgo: cadencia personal por cliente, probabilidad
+    empírica de reorden, priorizados por valor en juego. Servido desde el
+    precálculo, como /predictor/demanda."""
+    return _responder_precalculado(
+        PRECALCULO_CLIENTES_RIESGO, _calcular_predictor_clientes_riesgo,
+        {"resumen": {"activos": 0, "en_riesgo": 0, "inactivos": 0}, "clientes": []},
+    )
+
+
+@app.get("/predictor/proximos-pedidos", response_model=Dict)
+def get_predictor_proximos_pedidos(
+    dias: int = Query(7, ge=1, le=90, description="Días hacia adelante"),
+    limite: int = Query(100, ge=1, le=1000, description="Clientes a devolver"),
+    usuario: Optional[str] = None,
+):
+    """Fecha esperada del próximo pedido por cliente (P10/P50/P90) y
+    probabilidad de pedir en 7 días. Lee la tabla precalculada (se refresca
+    en forma incremental cuando llegan pedidos); `usuario` devuelve la fila
+    de un cliente, si no, los clientes esperados en los próximos `dias`."""
+    tabla = _responder_precalculado(
+        PRECALCULO_PROXIMOS_PEDIDOS, _calcular_predictor_proximos_pedidos,
+        {"clientes": [], "resumen": {"clientes": 0, "pedidos_esperados_7_dias": 0.0}},
+    )
+    if usuario:
+        cliente = next_order_service.prediccion_cliente(tabla, usuario)
+        if cliente is None:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        return {**cliente, "calculado_en": tabla.get("calculado_en")}
+    esperados = next_order_service.proximos_pedidos(tabla, dias=dias, limite=None)
+    return {
+        "fecha_referencia": tabla.get("fecha_referencia"),
+        "calculado_en": tabla.get("calculado_en"),
+        "resumen": tabla.get("resumen"),
+        "clientes_esperados": len(esperados),
+        "clientes": esperados[:limite],
+    }
 
 # Servir frontend estático (debe ir al final, después de todas las rutas API)
 _BASE = os.path.dirname(os.path.abspath(__file__))
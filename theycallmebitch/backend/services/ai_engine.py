@@ -2,15 +2,24 @@
 Motor de IA — CEO Virtual con Function Calling
 GPT-4o-mini + 6 tools + loop de tool calling + caché + guardia de tokens.
 """
+import asyncio
 import os
 import re
 import json
 import hashlib
 import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from datetime import datetime
 from math import ceil
-from typing import Union
-from openai import OpenAI
+from typing import Optional, Union
+from openai import AsyncOpenAI, OpenAI
 from services.business_context import UBICACION_EMPRESA
+from services.chat_cache_service import clave_pregunta, resolver
+from services.conversation_summary_service import obtener_resumen, programar_resumen
+from services.memo_service import memorizar, normalizar_args, version_de
+from services.tool_output_service import formar_resultado
 
 logger = logging.getLogger(__name__)
 
@@ -24,8 +33,8 @@ DRIVER_COST_TRIP  = 2500    # CLP/viaje en costo de tiempo extra del chofer
 # pedidos reales con/sin descuento por volumen — ver discount_analysis_service.py.
 
 # ─── Caché en memoria ─────────────────────────────────────────────────────────
-CHAT_CACHE: dict = {}
-_kpi_hash_cache: str = ""
+# Respuestas del chat: ver services/chat_cache_service.py. Las respuestas que
+# usaron alguna de estas tools no se cachean.
 NO_CACHE_TOOLS = {
     "simulate_scenario", "draft_campaign_message",
     "analyze_campaign", "recommend_expansion", "get_daily_cashflow",
@@ -308,6 +317,33 @@ TOOLS = [
             "parameters": {"type": "object", "properties": {}, "required": []},
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_next_orders",
+            "description": (
+                "Fecha esperada del PRÓXIMO pedido de cada cliente (P10/P50/P90) y "
+                "probabilidad de que pida en los próximos 7 días, según su cadencia "
+                "personal, estacionalidad y día preferido. Llama cuando el usuario "
+                "pregunta quién va a pedir esta semana o mañana, para planificar el "
+                "reparto, o cuándo debería volver a pedir un cliente puntual."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "dias": {
+                        "type": "integer",
+                        "description": "Horizonte en días para listar clientes esperados (default 7)",
+                    },
+                    "usuario": {
+                        "type": "string",
+                        "description": "Cliente puntual (usuario, teléfono o dirección); omitir para la lista",
+                    },
+                },
+                "required": [],
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
@@ -448,6 +484,28 @@ TOOLS = [
             "parameters": {"type": "object", "properties": {}, "required": []},
         },
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_cohort_retention",
+            "description": (
+                "Matriz de retención por cohorte (mes de primera compra): qué % de cada "
+                "cohorte vuelve a comprar 1, 2, 3... meses después y qué % ya hizo su "
+                "segunda compra. Llama cuando el usuario pregunta por retención, "
+                "cohortes, recompra o si los clientes nuevos de un mes se quedaron."
+            ),
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "meses": {
+                        "type": "integer",
+                        "description": "Cuántas cohortes recientes mostrar (default 6)",
+                    }
+                },
+                "required": [],
+            },
+        },
+    },
     {
         "type": "function",
         "function": {
@@ -618,10 +676,10 @@ _WA_TEMPLATES = {
 
 # ─── Clasificación de intento ─────────────────────────────────────────────────
 _INTENT_TOOLS = {
-    "zone":       ["get_zone_analysis", "get_route_intelligence", "get_margin_leak_analysis"],
+    "zone":       ["get_zone_analysis", "get_route_intelligence", "get_margin_leak_analysis", "get_next_orders"],
     "rfm":        [
         "get_customer_segments", "draft_campaign_message",
-        "get_customer_risk", "get_activation_rate",
+        "get_customer_risk", "get_next_orders", "get_activation_rate", "get_cohort_retention",
         "get_seasonal_churn_classification", "get_growth_opportunities",
         "get_payment_risk_analysis",
     ],
@@ -643,7 +701,7 @@ def _classify_intent(question: str) -> str:
         return "simulation"
     if any(w in q for w in ["campaña", "mensaje", "whatsapp", "redacta", "escribe", "texto", "contactar"]):
         return "campaign"
-    if any(w in q for w in ["cliente", "riesgo", "rfm", "reactivar", "churn", "campeón", "perdido", "segmento"]):
+    if any(w in q for w in ["cliente", "riesgo", "rfm", "reactivar", "churn", "campeón", "perdido", "segmento", "cohorte", "retención", "recompra"]):
         return "rfm"
     if any(w in q for w in ["tendencia", "histórico", "historial", "semanas", "evolución", "antes", "meses atrás"]):
         return "trends"
@@ -666,19 +724,12 @@ def _get_tools_for_intent(intent: str) -> list:
 
 
 # ─── Caché ────────────────────────────────────────────────────────────────────
-def _make_cache_key(question: str, core_ctx: dict) -> str:
-    sig = f"{core_ctx.get('ventas_mensuales','')}{core_ctx.get('pedidos_mensuales','')}"
-    return hashlib.md5(f"{question}|{sig}".encode()).hexdigest()
-
-
-def _invalidate_cache_if_needed(core_ctx: dict):
-    global _kpi_hash_cache, CHAT_CACHE
-    h = hashlib.md5(
-        f"{core_ctx.get('ventas_mensuales','')}{core_ctx.get('pedidos_mensuales','')}".encode()
-    ).hexdigest()
-    if h != _kpi_hash_cache:
-        CHAT_CACHE.clear()
-        _kpi_hash_cache = h
+def _version_cache_chat(core_ctx: dict, pedidos_cache: list) -> str:
+    """Versión de datos contra la que se valida una respuesta cacheada:
+    versión de los pedidos (si vienen de data_adapter) más las cifras del
+    mes que ve el modelo en el system prompt."""
+    firma = f"{core_ctx.get('ventas_mensuales','')}|{core_ctx.get('pedidos_mensuales','')}"
+    return f"{version_de(pedidos_cache) or ''}|{hashlib.md5(firma.encode()).hexdigest()}"
 
 
 # ─── Core Context (liviano, siempre inyectado) ────────────────────────────────
@@ -709,11 +760,12 @@ def _build_core_context(full_ctx: dict) -> dict:
 
 
 # ─── Guardia de tokens ────────────────────────────────────────────────────────
-def _compress_if_needed(conversation: list, client: OpenAI) -> list:
-    """Si la conversación supera ~10k tokens estimados, resume los turnos más viejos."""
+def _partes_a_comprimir(conversation: list):
+    """(system, viejos, recientes, actual) si la conversación supera ~10k
+    tokens estimados y hay turnos viejos que resumir; si no, None."""
     approx_tokens = len(json.dumps(conversation, ensure_ascii=False)) // 4
     if approx_tokens < 10000:
-        return conversation
+        return None
 
     system_msg   = conversation[0]
     current_msg  = conversation[-1]
@@ -721,33 +773,60 @@ def _compress_if_needed(conversation: list, client: OpenAI) -> list:
     to_summarize = conversation[1:-8]    # turnos más viejos
 
     if not to_summarize:
+        return None
+    return system_msg, to_summarize, recent, current_msg
+
+
+def _resumir_turnos(resumen_previo, turnos: list) -> str:
+    """Resume `turnos` (extendiendo `resumen_previo` si lo hay). Corre en el
+    hilo de fondo de conversation_summary_service."""
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", ""))
+    contenido = json.dumps(turnos, ensure_ascii=False)
+    if resumen_previo:
+        contenido = f"Resumen previo: {resumen_previo}\n\nTurnos nuevos: {contenido}"
+    resp = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Resume esta conversación en máximo 3 oraciones en español, "
+                    "preservando todos los datos numéricos clave mencionados. "
+                    "Si hay un resumen previo, intégralo con los turnos nuevos."
+                ),
+            },
+            {"role": "user", "content": contenido},
+        ],
+        max_tokens=200,
+        temperature=0.1,
+    )
+    return resp.choices[0].message.content
+
+
+def _compress_if_needed(conversation: list) -> list:
+    """Si la conversación supera ~10k tokens estimados, reemplaza los turnos
+    más viejos por su resumen cacheado. Nunca llama al LLM en línea: lo que
+    aún no está resumido se resume en segundo plano para el próximo turno y,
+    mientras tanto, va tal cual si cabe o se omite si no."""
+    partes = _partes_a_comprimir(conversation)
+    if partes is None:
         return conversation
+    system_msg, to_summarize, recent, current_msg = partes
 
-    try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Resume esta conversación en máximo 3 oraciones en español, "
-                        "preservando todos los datos numéricos clave mencionados."
-                    ),
-                },
-                {"role": "user", "content": json.dumps(to_summarize, ensure_ascii=False)},
-            ],
-            max_tokens=200,
-            temperature=0.1,
-        )
-        summary = resp.choices[0].message.content
-        summary_msg = {
+    resumen, cubiertos = obtener_resumen(to_summarize)
+    if cubiertos < len(to_summarize):
+        programar_resumen(to_summarize, _resumir_turnos)
+
+    prefijo = [system_msg]
+    if resumen:
+        prefijo.append({
             "role": "assistant",
-            "content": f"[Resumen de conversación anterior: {summary}]",
-        }
-        return [system_msg, summary_msg] + recent + [current_msg]
-    except Exception as e:
-        logger.warning(f"No se pudo comprimir historial: {e}")
-        return [system_msg] + conversation[-8:]
+            "content": f"[Resumen de conversación anterior: {resumen}]",
+        })
+    comprimida = prefijo + to_summarize[cubiertos:] + recent + [current_msg]
+    if cubiertos < len(to_summarize) and _partes_a_comprimir(comprimida) is not None:
+        comprimida = prefijo + recent + [current_msg]
+    return comprimida
 
 
 # Campo que cada acción individual usa para reportar su impacto económico
@@ -1191,13 +1270,79 @@ def _buscar_web(query: str) -> dict:
         return {"error": str(e)}
 
 
+def _dias_inactivo_cliente(usuario: str):
+    """Días desde el último pedido de un cliente, leídos del índice por
+    usuario de data_adapter (solo sus pedidos). Si el nombre no calza exacto
+    (typo, teléfono, dirección) se resuelve con el índice de búsqueda.
+    None si no se encuentra."""
+    from data_adapter import data_adapter
+    from services.customer_search_service import resolver_usuario, sincronizar_indice
+    pedidos = data_adapter.obtener_pedidos_de_usuario(usuario)
+    if not pedidos:
+        sincronizar_indice(data_adapter.obtener_pedidos_combinados(), data_adapter.version_datos)
+        resuelto = resolver_usuario(usuario)
+        pedidos = data_adapter.obtener_pedidos_de_usuario(resuelto) if resuelto else []
+    fechas = []
+    for pedido in pedidos:
+        try:
+            fechas.append(datetime.strptime(str(pedido.get("fecha", ""))[:10], "%d-%m-%Y"))
+        except ValueError:
+            continue
+    if not fechas:
+        return None
+    return (datetime.now() - max(fechas)).days
+
+
+# Tools cuyo resultado depende solo de los pedidos y de sus argumentos: se
+# memoizan por versión de datos (memo_service). Las que leen el contexto,
+# la base de memoria, la hora actual o generan texto quedan fuera.
+MEMO_TOOLS = {
+    "get_zone_analysis", "get_customer_segments", "analyze_campaign",
+    "get_customer_risk", "get_demand_forecast", "get_rentabilidad_reportes",
+    "get_discount_analysis", "get_route_intelligence", "get_growth_opportunities",
+    "get_margin_leak_analysis", "get_payment_risk_analysis", "get_channel_comparison",
+    "get_sla_compliance", "get_activation_rate", "get_cohort_retention",
+    "get_next_orders", "get_seasonal_churn_classification",
+}
+
+
+def _rfm_memo(pedidos_cache: list) -> dict:
+    from services.rfm_engine import calcular_rfm
+    return memorizar("calcular_rfm", None, pedidos_cache, lambda: calcular_rfm(pedidos_cache or []))
+
+
+def _riesgo_memo(pedidos_cache: list) -> dict:
+    from services.customer_risk_service import calcular_riesgo_clientes
+    return memorizar("calcular_riesgo_clientes", None, pedidos_cache, lambda: calcular_riesgo_clientes(pedidos_cache or []))
+
+
+def _zonas_memo(pedidos_cache: list) -> dict:
+    from services.zone_engine import analizar_zonas
+    return memorizar("analizar_zonas", None, pedidos_cache, lambda: analizar_zonas(pedidos_cache or []))
+
+
 def _execute_tool(
     name: str,
     args: dict,
     pedidos_cache: list,
     context_data: dict,
 ) -> dict:
-    """Ejecuta la tool solicitada y retorna el resultado como dict."""
+    """Ejecuta la tool solicitada y retorna el resultado como dict. Las de
+    MEMO_TOOLS no se recalculan mientras no cambien los pedidos."""
+    if name in MEMO_TOOLS:
+        return memorizar(
+            f"tool:{name}", args, pedidos_cache,
+            lambda: _ejecutar_tool(name, args, pedidos_cache, context_data),
+        )
+    return _ejecutar_tool(name, args, pedidos_cache, context_data)
+
+
+def _ejecutar_tool(
+    name: str,
+    args: dict,
+    pedidos_cache: list,
+    context_data: dict,
+) -> dict:
     try:
         if name == "get_kpis":
             return {
@@ -1218,9 +1363,8 @@ def _execute_tool(
             }
 
         if name == "get_zone_analysis":
-            from services.zone_engine import analizar_zonas
             zone_filter = args.get("zone", "todas")
-            result = analizar_zonas(pedidos_cache or [])
+            result = _zonas_memo(pedidos_cache)
             if zone_filter != "todas":
                 result["zonas"] = [z for z in result.get("zonas", []) if z["zona"] == zone_filter]
             # Añadir confidence flags
@@ -1236,9 +1380,8 @@ def _execute_tool(
             return result
 
         if name == "get_customer_segments":
-            from services.rfm_engine import calcular_rfm
             segment_filter = args.get("segment", "todos")
-            result = calcular_rfm(pedidos_cache or [])
+            result = _rfm_memo(pedidos_cache)
             if segment_filter != "todos":
                 result["clientes_en_riesgo"] = [
                     c for c in result.get("clientes_en_riesgo", [])
@@ -1276,16 +1419,18 @@ def _execute_tool(
             return simulate_scenario(args["action"], args.get("params", {}), scenario_context)
 
         if name == "draft_campaign_message":
+            days_inactive = args.get("days_inactive")
+            if args.get("client_name") and not days_inactive:
+                days_inactive = _dias_inactivo_cliente(args["client_name"])
             return draft_campaign_message(
                 segment=args.get("segment", "en_riesgo"),
                 offer=args.get("offer", ""),
                 client_name=args.get("client_name"),
-                days_inactive=args.get("days_inactive"),
+                days_inactive=days_inactive,
             )
 
         if name == "analyze_campaign":
-            from services.rfm_engine import calcular_rfm
-            rfm = calcular_rfm(pedidos_cache or [])
+            rfm = _rfm_memo(pedidos_cache)
             return analyze_campaign(
                 segment=args.get("segment", "en_riesgo"),
                 tipo_campana=args.get("tipo_campana", "reactivacion"),
@@ -1301,8 +1446,7 @@ def _execute_tool(
             )
 
         if name == "get_customer_risk":
-            from services.customer_risk_service import calcular_riesgo_clientes
-            return calcular_riesgo_clientes(pedidos_cache or [])
+            return _riesgo_memo(pedidos_cache)
 
         if name == "get_demand_forecast":
             from services.demand_forecast_service import predecir_proximos_dias, validar_precision
@@ -1336,13 +1480,12 @@ def _execute_tool(
 
         if name == "get_margin_leak_analysis":
             from services.margin_leak_service import detectar_fuga_margen
-            from services.zone_engine import analizar_zonas
             from services.fuel_service import obtener_precio_bencina
             from services.business_context import DISTANCIAS_KM
             # analizar_zonas() no incluye distancia_km en su salida (ese campo lo
             # calcula business_context.py a partir de DISTANCIAS_KM) — se adapta
             # aquí antes de pasarlo a detectar_fuga_margen, que sí lo requiere.
-            zonas_raw = analizar_zonas(pedidos_cache or [])
+            zonas_raw = _zonas_memo(pedidos_cache)
             zonas_data = {
                 "zonas": [
                     {**z, "distancia_km": DISTANCIAS_KM.get(z.get("zona"))}
@@ -1365,13 +1508,40 @@ def _execute_tool(
             return calcular_cumplimiento_horario(pedidos_cache or [])
 
         if name == "get_activation_rate":
-            from services.activation_service import calcular_tasa_activacion
-            return calcular_tasa_activacion(pedidos_cache or [])
+            from data_adapter import data_adapter
+            from services.cohort_service import obtener_cohortes
+            return obtener_cohortes(pedidos_cache or [], data_adapter.version_datos)["activacion"]
+
+        if name == "get_cohort_retention":
+            from data_adapter import data_adapter
+            from services.cohort_service import obtener_cohortes, recortar_cohortes
+            cohortes = obtener_cohortes(pedidos_cache or [], data_adapter.version_datos)
+            return recortar_cohortes(cohortes, horizonte_meses=6, ultimas_cohortes=int(args.get("meses", 6)))
+
+        if name == "get_next_orders":
+            from data_adapter import data_adapter
+            from services.customer_search_service import resolver_usuario, sincronizar_indice
+            from services.next_order_service import obtener_tabla_proximos_pedidos, prediccion_cliente, proximos_pedidos
+            tabla = obtener_tabla_proximos_pedidos(pedidos_cache or [], data_adapter.version_datos)
+            if args.get("usuario"):
+                cliente = prediccion_cliente(tabla, args["usuario"])
+                if cliente is None:
+                    sincronizar_indice(pedidos_cache or [], data_adapter.version_datos)
+                    resuelto = resolver_usuario(args["usuario"])
+                    cliente = prediccion_cliente(tabla, resuelto) if resuelto else None
+                return cliente or {"error": f"Cliente no encontrado: {args['usuario']}"}
+            dias = int(args.get("dias", 7))
+            esperados = proximos_pedidos(tabla, dias=dias, limite=None)
+            return {
+                "fecha_referencia": tabla.get("fecha_referencia"),
+                "clientes_esperados": len(esperados),
+                "pedidos_esperados_7_dias": tabla["resumen"]["pedidos_esperados_7_dias"],
+                "clientes": esperados[:30],
+            }
 
         if name == "get_seasonal_churn_classification":
             from services.seasonal_churn_service import clasificar_churn_estacional
-            from services.customer_risk_service import calcular_riesgo_clientes
-            riesgo = calcular_riesgo_clientes(pedidos_cache or [])
+            riesgo = _riesgo_memo(pedidos_cache)
             inactivos = [c for c in riesgo.get("clientes", []) if c.get("estado") == "inactivo"]
             return clasificar_churn_estacional(pedidos_cache or [], inactivos)
 
@@ -1385,6 +1555,204 @@ def _execute_tool(
         return {"error": str(e)}
 
 
+# ─── Ejecución concurrente de tool calls ─────────────────────────────────────
+# Cuando el modelo pide varias tools en una misma respuesta son análisis
+# independientes (RFM + zonas + pronóstico...): se despachan juntas a un pool
+# de hilos — pandas/XGBoost y la red liberan el GIL, y las tools necesitan
+# la lista de pedidos en memoria, que un pool de procesos tendría que
+# copiar. Cada tool tiene su timeout; si se vence, el modelo recibe un error
+# para esa tool y las demás siguen (el hilo termina en segundo plano y su
+# resultado queda en el memo para la próxima vez).
+#
+# Ese hilo sigue ocupado después del timeout, así que las tools lentas
+# corren en su propio pool con un tope de ejecuciones simultáneas: por
+# muchos pronósticos que se acumulen, las tools rápidas siguen teniendo
+# hilos libres. Y una tool memoizable que ya se está calculando con los
+# mismos argumentos y datos no se vuelve a enviar: se espera el mismo
+# cálculo.
+MAX_TOOLS_PARALELO = 4
+TIMEOUT_TOOL_SEGUNDOS = 20
+TIMEOUT_POR_TOOL = {"get_demand_forecast": 60, "web_search": 15}
+MAX_EN_CURSO_POR_TOOL = {"get_demand_forecast": 1, "web_search": 2}
+
+_pool_tools = None
+_pools_por_tool: dict = {}
+_lock_pools = threading.Lock()
+# (nombre, args normalizados, versión de datos) -> Future en curso
+_tools_en_vuelo: dict = {}
+_en_curso = {"tools": 0}
+_tools_terminadas = threading.Condition(_lock_pools)
+_lock_estadisticas_tools = threading.Lock()
+# nombre -> {llamadas, segundos_total, segundos_max, timeouts, compartidas}
+ESTADISTICAS_TOOLS: dict = {}
+
+
+def _obtener_pool_tools(name: Optional[str] = None) -> ThreadPoolExecutor:
+    """Pool propio para las tools de MAX_EN_CURSO_POR_TOOL; el compartido
+    para el resto."""
+    global _pool_tools
+    with _lock_pools:
+        if name in MAX_EN_CURSO_POR_TOOL:
+            if name not in _pools_por_tool:
+                _pools_por_tool[name] = ThreadPoolExecutor(
+                    max_workers=MAX_EN_CURSO_POR_TOOL[name], thread_name_prefix=f"tool-{name}"
+                )
+            return _pools_por_tool[name]
+        if _pool_tools is None:
+            _pool_tools = ThreadPoolExecutor(max_workers=MAX_TOOLS_PARALELO, thread_name_prefix="tool")
+        return _pool_tools
+
+
+def _registrar_tiempo_tool(name: str, segundos: float = 0.0, timeout: bool = False, compartida: bool = False):
+    with _lock_estadisticas_tools:
+        stats = ESTADISTICAS_TOOLS.setdefault(
+            name, {"llamadas": 0, "segundos_total": 0.0, "segundos_max": 0.0, "timeouts": 0, "compartidas": 0}
+        )
+        if timeout:
+            stats["timeouts"] += 1
+            return
+        if compartida:
+            stats["compartidas"] = stats.get("compartidas", 0) + 1
+            return
+        stats["llamadas"] += 1
+        stats["segundos_total"] += segundos
+        stats["segundos_max"] = max(stats["segundos_max"], segundos)
+
+
+def _ejecutar_tool_cronometrada(name: str, args: dict, pedidos_cache: list, context_data: dict) -> dict:
+    inicio = time.perf_counter()
+    try:
+        return _execute_tool(name, args, pedidos_cache, context_data)
+    finally:
+        segundos = time.perf_counter() - inicio
+        _registrar_tiempo_tool(name, segundos)
+        logger.info(f"Tool '{name}' en {segundos * 1000:.0f} ms")
+
+
+def _enviar_tool(name: str, args: dict, pedidos_cache: list, context_data: dict) -> Future:
+    """Envía la tool a su pool, o devuelve el cálculo idéntico ya en curso."""
+    version = version_de(pedidos_cache) if name in MEMO_TOOLS else None
+    clave = (name, normalizar_args(args), version) if version is not None else None
+    with _lock_pools:
+        futuro = _tools_en_vuelo.get(clave) if clave else None
+        if futuro is not None:
+            compartida = True
+        else:
+            compartida = False
+            _en_curso["tools"] += 1
+    if compartida:
+        _registrar_tiempo_tool(name, compartida=True)
+        return futuro
+
+    def terminar(_futuro):
+        with _lock_pools:
+            if clave and _tools_en_vuelo.get(clave) is _futuro:
+                del _tools_en_vuelo[clave]
+            _en_curso["tools"] -= 1
+            _tools_terminadas.notify_all()
+
+    futuro = _obtener_pool_tools(name).submit(_ejecutar_tool_cronometrada, name, args, pedidos_cache, context_data)
+    if clave:
+        with _lock_pools:
+            _tools_en_vuelo.setdefault(clave, futuro)
+    futuro.add_done_callback(terminar)
+    return futuro
+
+
+def esperar_tools_en_curso(timeout: Optional[float] = None) -> bool:
+    """Espera a que terminen las tools en curso, incluidas las que ya
+    vencieron su timeout. False si el plazo se cumple antes."""
+    with _tools_terminadas:
+        return _tools_terminadas.wait_for(lambda: _en_curso["tools"] == 0, timeout)
+
+
+def _parsear_tool_calls(tool_calls) -> list:
+    llamadas = []
+    for tc in tool_calls:
+        try:
+            args = json.loads(tc.function.arguments)
+        except Exception:
+            args = {}
+        llamadas.append((tc, tc.function.name, args))
+    return llamadas
+
+
+def _resultado_timeout(name: str, limite: float) -> dict:
+    _registrar_tiempo_tool(name, timeout=True)
+    logger.warning(f"Tool '{name}' excedió {limite}s")
+    return {"error": f"La herramienta {name} tardó más de {limite}s; responde sin ese dato."}
+
+
+def _ejecutar_tool_calls(tool_calls, pedidos_cache: list, context_data: dict) -> list:
+    """Ejecuta todas las tool calls de una respuesta en paralelo.
+    Devuelve [(tool_call, name, args, result)] en el orden original."""
+    llamadas = _parsear_tool_calls(tool_calls)
+    inicio = time.monotonic()
+    futuros = [_enviar_tool(name, args, pedidos_cache, context_data) for _, name, args in llamadas]
+    resultados = []
+    for (tc, name, args), futuro in zip(llamadas, futuros):
+        limite = TIMEOUT_POR_TOOL.get(name, TIMEOUT_TOOL_SEGUNDOS)
+        try:
+            result = futuro.result(timeout=max(0.0, inicio + limite - time.monotonic()))
+        except FuturesTimeoutError:
+            result = _resultado_timeout(name, limite)
+        except Exception as e:
+            logger.error(f"Error ejecutando tool '{name}': {e}")
+            result = {"error": str(e)}
+        resultados.append((tc, name, args, result))
+    return resultados
+
+
+async def _ejecutar_tool_calls_async(tool_calls, pedidos_cache: list, context_data: dict) -> list:
+    """Como `_ejecutar_tool_calls`, pero espera sin bloquear el event loop:
+    las tools corren en el mismo pool de hilos y cada una se espera como una
+    tarea con su propio timeout."""
+    llamadas = _parsear_tool_calls(tool_calls)
+
+    async def esperar(name: str, args: dict) -> dict:
+        limite = TIMEOUT_POR_TOOL.get(name, TIMEOUT_TOOL_SEGUNDOS)
+        futuro = _enviar_tool(name, args, pedidos_cache, context_data)
+        try:
+            # shield: el timeout de esta espera no cancela un cálculo que
+            # otra consulta puede estar esperando
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(futuro)), timeout=limite)
+        except asyncio.TimeoutError:
+            return _resultado_timeout(name, limite)
+        except Exception as e:
+            logger.error(f"Error ejecutando tool '{name}': {e}")
+            return {"error": str(e)}
+
+    resultados = await asyncio.gather(*(esperar(name, args) for _, name, args in llamadas))
+    return [(tc, name, args, result) for (tc, name, args), result in zip(llamadas, resultados)]
+
+
+def _agregar_resultados_tools(conversation: list, resultados: list) -> Optional[int]:
+    """Agrega los resultados a la conversación (en el orden pedido por el
+    modelo, recortados a su presupuesto de tokens) y persiste las
+    recomendaciones con el resultado completo. Devuelve el último rec_id."""
+    rec_id = None
+    for tc, name, tool_args, result in resultados:
+        if name in ("draft_campaign_message", "simulate_scenario"):
+            try:
+                from services.memory_service import guardar_recomendacion
+                nuevo_id = guardar_recomendacion({
+                    "tipo": name,
+                    "zona": tool_args.get("segment", tool_args.get("action", "general")),
+                    "descripcion": json.dumps(result, ensure_ascii=False)[:400],
+                })
+                if isinstance(nuevo_id, int) and nuevo_id > 0:
+                    rec_id = nuevo_id
+            except Exception:
+                pass
+
+        conversation.append({
+            "role": "tool",
+            "tool_call_id": tc.id,
+            "content": formar_resultado(name, result),
+        })
+    return rec_id
+
+
 # ─── run_chat_query — loop de function calling ────────────────────────────────
 def run_chat_query(
     context_data: dict,
@@ -1429,40 +1797,42 @@ def run_chat_query_with_rec_id(
 
     client   = OpenAI(api_key=api_key)
     core_ctx = _build_core_context(context_data)
+    clave    = clave_pregunta(question, _classify_intent(question), history)
 
-    # Caché
-    _invalidate_cache_if_needed(core_ctx)
-    cache_key = _make_cache_key(question, core_ctx)
-    if cache_key in CHAT_CACHE:
+    def calcular():
+        respuesta, rec_id, cacheable = _responder_con_tools(
+            client, context_data, question, history, pedidos_cache
+        )
+        return (respuesta, rec_id), cacheable
+
+    (respuesta, rec_id), origen = resolver(clave, _version_cache_chat(core_ctx, pedidos_cache), calcular)
+    if origen == "cache":
         logger.info("Respuesta desde caché.")
-        return CHAT_CACHE[cache_key], None
+        return respuesta, None
+    return respuesta, rec_id
 
-    # Seleccionar tools según intento
-    intent = _classify_intent(question)
-    tools  = _get_tools_for_intent(intent)
 
-    # Construir conversación
-    system_msg = {
-        "role": "system",
-        "content": f"{CHAT_PROMPT}\n\nCONTEXTO ACTUAL DEL NEGOCIO:\n{json.dumps(core_ctx, ensure_ascii=False)}",
-    }
-    conversation = [system_msg]
-    if history:
-        for msg in history[-12:]:
-            role = "assistant" if msg.get("role") == "agent" else "user"
-            conversation.append({"role": role, "content": msg.get("content", "")})
-    conversation.append({"role": "user", "content": question})
+def _responder_con_tools(
+    client: OpenAI,
+    context_data: dict,
+    question: str,
+    history: list,
+    pedidos_cache: list,
+) -> tuple:
+    """Loop de function calling de /chat. Retorna (respuesta, rec_id,
+    cacheable)."""
+    conversation, tools = _conversacion_inicial(context_data, question, history)
 
     # Guardia de tokens
-    conversation = _compress_if_needed(conversation, client)
+    conversation = _compress_if_needed(conversation)
 
-    tools_used: list = []
     used_no_cache_tool = False
     rec_id = None
 
     for _ in range(5):
         try:
-            response = client.chat.completions.create(
+            response = _completar(
+                client,
                 model="gpt-4o-mini",
                 messages=conversation,
                 tools=tools,
@@ -1472,69 +1842,23 @@ def run_chat_query_with_rec_id(
             )
         except Exception as e:
             logger.error(f"Error OpenAI en chat: {e}")
-            return {"error": True, "mensaje": "No pude conectarme con el servicio de análisis. Intenta de nuevo en un momento."}, None
+            return {"error": True, "mensaje": "No pude conectarme con el servicio de análisis. Intenta de nuevo en un momento."}, None, False
 
         choice = response.choices[0]
 
         if choice.finish_reason == "stop":
-            answer = choice.message.content or ""
-            if not used_no_cache_tool:
-                CHAT_CACHE[cache_key] = answer
-            return answer, rec_id
+            return choice.message.content or "", rec_id, not used_no_cache_tool
 
         if choice.finish_reason == "tool_calls":
-            # Añadir mensaje del asistente con tool_calls
-            conversation.append({
-                "role": "assistant",
-                "content": choice.message.content,
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {
-                            "name": tc.function.name,
-                            "arguments": tc.function.arguments,
-                        },
-                    }
-                    for tc in choice.message.tool_calls
-                ],
-            })
+            conversation.append(_mensaje_tool_calls(choice.message))
 
-            # Ejecutar cada tool y añadir resultado
-            for tc in choice.message.tool_calls:
-                name = tc.function.name
-                try:
-                    tool_args = json.loads(tc.function.arguments)
-                except Exception:
-                    tool_args = {}
-
-                tools_used.append(name)
-                if name in NO_CACHE_TOOLS:
-                    used_no_cache_tool = True
-
-                result = _execute_tool(name, tool_args, pedidos_cache, context_data)
-
-                # Guardar recomendación si aplica
-                if name in ("draft_campaign_message", "simulate_scenario"):
-                    try:
-                        from services.memory_service import guardar_recomendacion
-                        nuevo_id = guardar_recomendacion({
-                            "tipo": name,
-                            "zona": tool_args.get("segment", tool_args.get("action", "general")),
-                            "descripcion": json.dumps(result, ensure_ascii=False)[:400],
-                        })
-                        if isinstance(nuevo_id, int) and nuevo_id > 0:
-                            rec_id = nuevo_id
-                    except Exception:
-                        pass
-
-                conversation.append({
-                    "role": "tool",
-                    "tool_call_id": tc.id,
-                    "content": json.dumps(result, ensure_ascii=False),
-                })
+            # Ejecutar las tools (en paralelo) y añadir resultados en orden
+            resultados = _ejecutar_tool_calls(choice.message.tool_calls, pedidos_cache, context_data)
+            if any(name in NO_CACHE_TOOLS for _, name, _, _ in resultados):
+                used_no_cache_tool = True
+            rec_id = _agregar_resultados_tools(conversation, resultados) or rec_id
 
-    return "No se pudo completar el análisis en el tiempo límite.", rec_id
+    return "No se pudo completar el análisis en el tiempo límite.", rec_id, False
 
 
 # ─── run_chat_query_prepare — para streaming (sin llamada final) ──────────────
@@ -1556,29 +1880,185 @@ def run_chat_query_prepare(
     if not api_key:
         return [], [], None
 
-    client   = OpenAI(api_key=api_key)
+    client = OpenAI(api_key=api_key)
+    conversation, tools = _conversacion_inicial(context_data, question, history)
+    conversation = _compress_if_needed(conversation)
+
+    tools_used: list = []
+    rec_id = None
+
+    for _ in range(5):
+        try:
+            response = _completar(
+                client,
+                model="gpt-4o-mini",
+                messages=conversation,
+                tools=tools,
+                tool_choice="auto",
+                temperature=0.25,
+                max_tokens=1200,
+            )
+        except Exception as e:
+            logger.error(f"Error prepare: {e}")
+            return conversation, tools_used, rec_id
+
+        choice = response.choices[0]
+
+        if choice.finish_reason == "stop":
+            # La conversación está lista para ser re-llamada con stream=True
+            return conversation, tools_used, rec_id
+
+        if choice.finish_reason == "tool_calls":
+            conversation.append(_mensaje_tool_calls(choice.message))
+            resultados = _ejecutar_tool_calls(choice.message.tool_calls, pedidos_cache, context_data)
+            tools_used.extend(name for _, name, _, _ in resultados)
+            rec_id = _agregar_resultados_tools(conversation, resultados) or rec_id
+
+    return conversation, tools_used, rec_id
+
+
+def _conversacion_inicial(context_data: dict, question: str, history: list = None) -> tuple:
+    """(conversación, tools) con las que arranca el loop de function calling.
+
+    Ordenada para el caché de prefijos de OpenAI: primero lo que es idéntico
+    byte a byte en todas las requests (CHAT_PROMPT y la lista completa de
+    TOOLS, que la API antepone a los mensajes), después el historial, que se
+    repite entre turnos de una misma conversación, y al final lo volátil:
+    contexto del negocio e intención detectada, justo antes de la pregunta.
+    Pasado el umbral de tokens, los turnos viejos se reemplazan por su
+    resumen (ver _compress_if_needed)."""
     core_ctx = _build_core_context(context_data)
     intent   = _classify_intent(question)
-    tools    = _get_tools_for_intent(intent)
 
-    system_msg = {
-        "role": "system",
-        "content": f"{CHAT_PROMPT}\n\nCONTEXTO ACTUAL DEL NEGOCIO:\n{json.dumps(core_ctx, ensure_ascii=False)}",
-    }
-    conversation = [system_msg]
+    conversation = [{"role": "system", "content": CHAT_PROMPT}]
     if history:
-        for msg in history[-12:]:
+        # Historial completo, no una ventana móvil: así el prefijo se repite
+        # entre turnos y los turnos viejos los resume _compress_if_needed.
+        for msg in history:
             role = "assistant" if msg.get("role") == "agent" else "user"
             conversation.append({"role": role, "content": msg.get("content", "")})
+    conversation.append({"role": "system", "content": _mensaje_contexto(core_ctx, intent)})
     conversation.append({"role": "user", "content": question})
-    conversation = _compress_if_needed(conversation, client)
+    return conversation, TOOLS
+
+
+def _mensaje_contexto(core_ctx: dict, intent: str) -> str:
+    texto = f"CONTEXTO ACTUAL DEL NEGOCIO:\n{json.dumps(core_ctx, ensure_ascii=False)}"
+    sugeridas = _INTENT_TOOLS.get(intent)
+    if sugeridas:
+        texto += f"\n\nHerramientas más relevantes para esta consulta: {', '.join(sugeridas)}."
+    return texto
+
+
+# ─── Uso de tokens y caché de prefijos ────────────────────────────────────────
+# Llamadas "inicial" (solo system + contexto + pregunta) vs "seguimiento"
+# (con historial o en vueltas siguientes del loop de tools): en las segundas
+# es donde el prefijo cacheado debe notarse en cached_tokens y en segundos.
+ESTADISTICAS_PROMPT: dict = {}
+
+
+def _registrar_uso(messages: list, usage, segundos: float):
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    if not isinstance(prompt_tokens, int):
+        return
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    cached = cached if isinstance(cached, int) else 0
+    tipo = "seguimiento" if len(messages) > 3 else "inicial"
+    with _lock_estadisticas_tools:
+        stats = ESTADISTICAS_PROMPT.setdefault(
+            tipo, {"llamadas": 0, "prompt_tokens": 0, "cached_tokens": 0, "segundos_total": 0.0}
+        )
+        stats["llamadas"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_tokens"] += cached
+        stats["segundos_total"] += segundos
+    logger.info(f"Prompt {tipo}: {prompt_tokens} tokens ({cached} cacheados) en {segundos:.2f}s")
+
+
+def _completar(client: OpenAI, **kwargs):
+    inicio = time.perf_counter()
+    response = client.chat.completions.create(**kwargs)
+    _registrar_uso(kwargs["messages"], getattr(response, "usage", None), time.perf_counter() - inicio)
+    return response
+
+
+async def _completar_async(client: AsyncOpenAI, **kwargs):
+    inicio = time.perf_counter()
+    response = await client.chat.completions.create(**kwargs)
+    _registrar_uso(kwargs["messages"], getattr(response, "usage", None), time.perf_counter() - inicio)
+    return response
+
+
+def _mensaje_tool_calls(message) -> dict:
+    return {
+        "role": "assistant",
+        "content": message.content,
+        "tool_calls": [
+            {
+                "id": tc.id,
+                "type": "function",
+                "function": {"name": tc.function.name, "arguments": tc.function.arguments},
+            }
+            for tc in message.tool_calls
+        ],
+    }
+
+
+# ─── /chat/stream async ───────────────────────────────────────────────────────
+# El endpoint de streaming corre en el event loop: con el cliente síncrono
+# cada token leído bloqueaba al worker entero (y con él al dashboard). Aquí
+# todo lo que espera red es `await` (AsyncOpenAI) y las tools van al pool
+# de hilos, así el worker sigue atendiendo otras requests mientras responde.
+_cliente_async = {"clave": None, "cliente": None}
+
+# Las preguntas sugeridas solo miran el comienzo de la respuesta: en cuanto
+# el stream lleva estos caracteres ya se pueden pedir, en paralelo con el
+# resto de los tokens.
+CARACTERES_PREGUNTAS_SUGERIDAS = 400
+
+PROMPT_PREGUNTAS_SUGERIDAS = (
+    "Genera exactamente 3 preguntas de seguimiento cortas en español "
+    "(máx 10 palabras cada una) relevantes para continuar este análisis. "
+    "Responde SOLO con un JSON array de strings, sin markdown."
+)
+
+
+def _obtener_cliente_async() -> Optional[AsyncOpenAI]:
+    """Un AsyncOpenAI por (API key, event loop): reutiliza conexiones entre
+    requests sin compartir el cliente HTTP entre loops distintos."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        return None
+    clave = (api_key, id(asyncio.get_running_loop()))
+    if _cliente_async["clave"] != clave:
+        _cliente_async["clave"] = clave
+        _cliente_async["cliente"] = AsyncOpenAI(api_key=api_key)
+    return _cliente_async["cliente"]
+
+
+async def run_chat_query_prepare_async(
+    context_data: dict,
+    question: str,
+    history: list = None,
+    pedidos_cache: list = None,
+) -> tuple:
+    """Versión async de `run_chat_query_prepare` (mismo contrato): las
+    llamadas a OpenAI se esperan sin bloquear y las tools de cada respuesta
+    corren en paralelo como tareas."""
+    client = _obtener_cliente_async()
+    if client is None:
+        return [], [], None
+
+    conversation, tools = _conversacion_inicial(context_data, question, history)
+    conversation = _compress_if_needed(conversation)
 
     tools_used: list = []
     rec_id = None
 
     for _ in range(5):
         try:
-            response = client.chat.completions.create(
+            response = await _completar_async(
+                client,
                 model="gpt-4o-mini",
                 messages=conversation,
                 tools=tools,
@@ -1593,55 +2073,62 @@ def run_chat_query_prepare(
         choice = response.choices[0]
 
         if choice.finish_reason == "stop":
-            # La conversación está lista para ser re-llamada con stream=True
             return conversation, tools_used, rec_id
 
         if choice.finish_reason == "tool_calls":
-            conversation.append({
-                "role": "assistant",
-                "content": choice.message.content,
-                "tool_calls": [
-                    {
-                        "id": tc.id,
-                        "type": "function",
-                        "function": {"name": tc.function.name, "arguments": tc.function.arguments},
-                    }
-                    for tc in choice.message.tool_calls
-                ],
-            })
-
-            for tc in choice.message.tool_calls:
-                name = tc.function.name
-                try:
-                    tool_args = json.loads(tc.function.arguments)
-                except Exception:
-                    tool_args = {}
-
-                tools_used.append(name)
-                result = _execute_tool(name, tool_args, pedidos_cache, context_data)
-
-                if name in ("draft_campaign_message", "simulate_scenario"):
-                    try:
-                        from services.memory_service import guardar_recomendacion
-                        nuevo_id = guardar_recomendacion({
-                            "tipo": name,
-                            "zona": tool_args.get("segment", tool_args.get("action", "general")),
-                            "descripcion": json.dumps(result, ensure_ascii=False)[:400],
-                        })
-                        if isinstance(nuevo_id, int) and nuevo_id > 0:
-                            rec_id = nuevo_id
-                    except Exception:
-                        pass
-
-                conversation.append({
-                    "role": "tool",
-                    "tool_call_id": tc.id,
-                    "content": json.dumps(result, ensure_ascii=False),
-                })
+            conversation.append(_mensaje_tool_calls(choice.message))
+            resultados = await _ejecutar_tool_calls_async(choice.message.tool_calls, pedidos_cache, context_data)
+            tools_used.extend(name for _, name, _, _ in resultados)
+            # Persistir recomendaciones es I/O de SQLite: fuera del loop
+            rec_id = await asyncio.to_thread(_agregar_resultados_tools, conversation, resultados) or rec_id
 
     return conversation, tools_used, rec_id
 
 
+async def stream_respuesta(conversation: list):
+    """Tokens de la respuesta final, a medida que llegan."""
+    client = _obtener_cliente_async()
+    if client is None:
+        return
+    inicio = time.perf_counter()
+    stream = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=conversation,
+        temperature=0.25,
+        max_tokens=1200,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            _registrar_uso(conversation, chunk.usage, time.perf_counter() - inicio)
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+
+async def generar_preguntas_sugeridas(question: str, respuesta: str) -> list:
+    """Hasta 3 preguntas de seguimiento; [] si el modelo no devuelve un
+    JSON array válido o la llamada falla."""
+    client = _obtener_cliente_async()
+    if client is None:
+        return []
+    try:
+        resp = await client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": PROMPT_PREGUNTAS_SUGERIDAS},
+                {"role": "user", "content": f"Pregunta: {question}\nRespuesta: {respuesta[:CARACTERES_PREGUNTAS_SUGERIDAS]}"},
+            ],
+            max_tokens=100,
+            temperature=0.4,
+        )
+        sugeridas = json.loads(resp.choices[0].message.content.strip())
+    except Exception:
+        return []
+    return sugeridas[:3] if isinstance(sugeridas, list) else []
+
+
 # ─── run_autonomous_insight — loop de background (sin cambios) ────────────────
 def run_autonomous_insight(context_data: dict) -> list:
     """Ejecuta el job en background para extraer insights CEO con todos los datos."""
@@ -3,50 +3,343 @@ Servicio de detección de anomalías.
 
 Cálculo puro (sin IA) sobre la serie diaria de pedidos: detecta
 desviaciones estadísticas reales (no ruido normal) para decidir si vale la
-pena generar una alerta. Reutiliza la misma construcción de serie diaria
-que `demand_forecast_service.construir_serie_diaria`.
+pena generar una alerta.
+
+El detector es incremental: lleva el conteo por día y la media/varianza
+de los días cerrados con el algoritmo de Welford (global y por día de la
+semana). Cuando llegan pedidos nuevos (cambia data_adapter.version_datos)
+solo se aplican las diferencias de conteo por día; cerrar un día o
+corregir uno pasado cuesta O(1), y el z-score del día en curso se lee sin
+volver a recorrer el historial. La serie es la misma que
+`demand_forecast_service.construir_serie_diaria`: del primer al último día
+con pedidos, días sin pedidos en 0, el último día es "hoy".
+
+A media jornada el total de hoy siempre parece una caída frente a días
+completos, así que también hay una línea base intradía: para cada día de
+la semana y hora, media/varianza de los pedidos acumulados hasta el fin de
+esa hora en los días ya cerrados (calendario). `detectar_anomalias_intradia`
+compara lo que va de hoy contra lo esperado a esta hora.
 """
 import logging
-from typing import Dict, List
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional
 
-import numpy as np
-
-from services.demand_forecast_service import construir_serie_diaria
+from services.sla_compliance_service import CHILE_TZ
 
 logger = logging.getLogger(__name__)
 
 MIN_DIAS_HISTORIAL = 14
 UMBRAL_DESVIACIONES = 2.0  # desviaciones estándar
+# Mínimo de días del mismo día de la semana para confiar en la línea base
+# intradía, y pedidos esperados a esa hora para juzgar (de madrugada 0 vs 0.3
+# no dice nada).
+MIN_SEMANAS_INTRADIA = 4
+MIN_ESPERADO_INTRADIA = 3.0
 
+_lock = threading.Lock()
+_detector: Dict = {}
 
-def detectar_anomalias(pedidos: List[Dict]) -> List[Dict]:
-    serie = construir_serie_diaria(pedidos)
-    if len(serie) < MIN_DIAS_HISTORIAL:
-        return []
 
-    conteos = serie['pedidos'].values
-    historial = conteos[:-1]
-    hoy = conteos[-1]
+@lru_cache(maxsize=None)
+def _parsear_fecha(fecha_str: Optional[str]):
+    """Una vez por texto de fecha distinto, no por pedido."""
+    if not fecha_str:
+        return None
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(fecha_str)[:10], fmt).date()
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+# --- Estadística online (Welford) -------------------------------------------
+
+def _nueva_estadistica() -> Dict:
+    return {'n': 0, 'media': 0.0, 'm2': 0.0}
+
+
+def _agregar(est: Dict, x: float):
+    est['n'] += 1
+    delta = x - est['media']
+    est['media'] += delta / est['n']
+    est['m2'] += delta * (x - est['media'])
+
+
+def _quitar(est: Dict, x: float):
+    """Inverso de _agregar: permite corregir un día ya cerrado."""
+    if est['n'] <= 1:
+        est.update(_nueva_estadistica())
+        return
+    est['n'] -= 1
+    delta = x - est['media']
+    est['media'] -= delta / est['n']
+    est['m2'] = max(0.0, est['m2'] - delta * (x - est['media']))
+
+
+def _desviacion(est: Dict) -> float:
+    """Desviación estándar poblacional (como np.std)."""
+    return (est['m2'] / est['n']) ** 0.5 if est['n'] else 0.0
+
+
+# --- Estado del detector ------------------------------------------------------
+
+def reiniciar_detector():
+    _detector.clear()
+    _detector.update({
+        'version': None,
+        'conteos': {},          # fecha -> pedidos (solo días con pedidos)
+        'primer_dia': None,
+        'dia_actual': None,     # último día con pedidos; aún no entra a las estadísticas
+        'global': _nueva_estadistica(),
+        'por_dia_semana': {d: _nueva_estadistica() for d in range(7)},
+    })
+    _reiniciar_intradia()
+
+
+def _reiniciar_intradia():
+    _detector.update({
+        'horas': {},                    # fecha -> [pedidos por hora] (días con hora conocida)
+        'primer_dia_horas': None,
+        'intradia_cerrado_hasta': None,  # último día calendario ya sumado a la línea base
+        # día de la semana -> hora -> pedidos acumulados hasta el fin de esa hora
+        'base_intradia': {d: [_nueva_estadistica() for _ in range(24)] for d in range(7)},
+    })
+
+
+reiniciar_detector()
+
+
+def _estadisticas_de(fecha) -> List[Dict]:
+    return [_detector['global'], _detector['por_dia_semana'][fecha.weekday()]]
+
+
+def _cerrar_dia(fecha):
+    for est in _estadisticas_de(fecha):
+        _agregar(est, _detector['conteos'].get(fecha, 0))
+
 
-    media = float(np.mean(historial))
-    desviacion = float(np.std(historial))
-    if desviacion == 0:
+def _actualizar_dia(fecha, conteo: int):
+    """Fija el conteo de `fecha`. Un día posterior al actual cierra el
+    actual (y los intermedios sin pedidos, en 0); un día ya cerrado se
+    corrige quitando su valor viejo y agregando el nuevo."""
+    conteos = _detector['conteos']
+    actual = _detector['dia_actual']
+    if actual is None:
+        _detector['primer_dia'] = _detector['dia_actual'] = fecha
+    elif fecha > actual:
+        dia = actual
+        while dia < fecha:
+            _cerrar_dia(dia)
+            dia += timedelta(days=1)
+        _detector['dia_actual'] = fecha
+    elif fecha < actual:
+        for est in _estadisticas_de(fecha):
+            _quitar(est, conteos.get(fecha, 0))
+            _agregar(est, conteo)
+    if conteo:
+        conteos[fecha] = conteo
+    else:
+        conteos.pop(fecha, None)
+
+
+def _sumar_intradia(fecha, horas: Optional[List[int]], quitar: bool = False):
+    """Agrega (o quita) un día cerrado a la línea base: 24 actualizaciones."""
+    estadisticas = _detector['base_intradia'][fecha.weekday()]
+    acumulado = 0
+    for hora in range(24):
+        acumulado += horas[hora] if horas else 0
+        (_quitar if quitar else _agregar)(estadisticas[hora], acumulado)
+
+
+def _cerrar_intradia_hasta(ultimo_dia):
+    """Suma a la línea base los días calendario hasta `ultimo_dia`
+    inclusive (los días sin pedidos cuentan, en 0)."""
+    if _detector['primer_dia_horas'] is None:
+        return
+    dia = _detector['intradia_cerrado_hasta'] or _detector['primer_dia_horas'] - timedelta(days=1)
+    while dia < ultimo_dia:
+        dia += timedelta(days=1)
+        _sumar_intradia(dia, _detector['horas'].get(dia))
+        _detector['intradia_cerrado_hasta'] = dia
+
+
+def _sincronizar_horas(nuevas: Dict):
+    if nuevas and min(nuevas) != _detector['primer_dia_horas']:
+        _reiniciar_intradia()
+        _detector['primer_dia_horas'] = min(nuevas)
+    viejas = _detector['horas']
+    cerrado_hasta = _detector['intradia_cerrado_hasta']
+    for fecha in set(nuevas) | set(viejas):
+        vieja, nueva = viejas.get(fecha), nuevas.get(fecha)
+        if vieja == nueva:
+            continue
+        if cerrado_hasta is not None and fecha <= cerrado_hasta:
+            _sumar_intradia(fecha, vieja, quitar=True)
+            _sumar_intradia(fecha, nueva)
+        if nueva:
+            viejas[fecha] = nueva
+        else:
+            viejas.pop(fecha, None)
+
+
+def _hora_de(texto) -> Optional[int]:
+    hora = str(texto or '')[:2]
+    return int(hora) if hora.isdigit() and int(hora) < 24 else None
+
+
+def _contar_por_dia(pedidos: List[Dict]):
+    """(pedidos por día, pedidos por día y hora). La hora es la de creación
+    del pedido ('hora', HH:MM:SS en hora de Chile); los pedidos sin hora
+    solo cuentan para la serie diaria."""
+    por_texto = Counter((p.get('fecha'), str(p.get('hora') or '')[:2]) for p in pedidos)
+    conteos = Counter()
+    horas = {}
+    for (texto, texto_hora), n in por_texto.items():
+        fecha = _parsear_fecha(texto)
+        if fecha is None:
+            continue
+        conteos[fecha] += n
+        hora = _hora_de(texto_hora)
+        if hora is not None:
+            horas.setdefault(fecha, [0] * 24)[hora] += n
+    return conteos, horas
+
+
+def sincronizar_detector(pedidos: List[Dict], version_datos: Optional[str] = None) -> bool:
+    """Lleva el detector al estado de `pedidos`. Con la misma
+    `version_datos` que la última vez no hace nada. Si no, aplica solo los
+    días cuyo conteo cambió; se reconstruye desde cero únicamente si la
+    serie empieza en otro día o termina antes (datos reemplazados, no
+    agregados). Devuelve True si hubo cambios."""
+    with _lock:
+        if version_datos is not None and version_datos == _detector['version']:
+            return False
+        nuevos, nuevas_horas = _contar_por_dia(pedidos)
+        if _detector['dia_actual'] is not None and (
+            not nuevos or min(nuevos) != _detector['primer_dia'] or max(nuevos) < _detector['dia_actual']
+        ):
+            reiniciar_detector()
+        viejos = _detector['conteos']
+        cambiados = sorted(f for f in set(nuevos) | set(viejos) if nuevos.get(f, 0) != viejos.get(f, 0))
+        for fecha in cambiados:
+            _actualizar_dia(fecha, nuevos.get(fecha, 0))
+        _sincronizar_horas(nuevas_horas)
+        _detector['version'] = version_datos
+        return bool(cambiados)
+
+
+def puntaje_z_actual(por_dia_semana: bool = False) -> Optional[Dict]:
+    """z-score del día en curso contra los días cerrados (todos, o solo los
+    del mismo día de la semana). O(1): no recorre el historial."""
+    fecha = _detector['dia_actual']
+    if fecha is None:
+        return None
+    est = _detector['por_dia_semana'][fecha.weekday()] if por_dia_semana else _detector['global']
+    pedidos = _detector['conteos'].get(fecha, 0)
+    desviacion = _desviacion(est)
+    return {
+        'fecha': str(fecha),
+        'pedidos': pedidos,
+        'media': est['media'],
+        'desviacion': desviacion,
+        'dias_historial': est['n'],
+        'z_score': (pedidos - est['media']) / desviacion if desviacion else None,
+    }
+
+
+def detectar_anomalias(pedidos: List[Dict], version_datos: Optional[str] = None) -> List[Dict]:
+    """Caída o salto de los pedidos de hoy respecto de los días anteriores.
+    Con `version_datos` (data_adapter.version_datos) la revisión no vuelve a
+    contar pedidos si los datos no cambiaron."""
+    sincronizar_detector(pedidos, version_datos)
+    actual = puntaje_z_actual()
+    if actual is None or actual['dias_historial'] + 1 < MIN_DIAS_HISTORIAL or actual['z_score'] is None:
         return []
 
-    z_score = (hoy - media) / desviacion
+    z_score, hoy, media, dias = actual['z_score'], actual['pedidos'], actual['media'], actual['dias_historial']
     anomalias = []
     if z_score <= -UMBRAL_DESVIACIONES:
         anomalias.append({
             "tipo": "caida_pedidos",
-            "fecha": str(serie['fecha'].iloc[-1]),
-            "descripcion": f"Pedidos de hoy ({int(hoy)}) muy por debajo del promedio de los últimos {len(historial)} días ({media:.1f}).",
+            "fecha": actual['fecha'],
+            "descripcion": f"Pedidos de hoy ({int(hoy)}) muy por debajo del promedio de los últimos {dias} días ({media:.1f}).",
             "severidad": "alta" if z_score <= -3 else "media",
         })
     elif z_score >= UMBRAL_DESVIACIONES:
         anomalias.append({
             "tipo": "salto_pedidos",
-            "fecha": str(serie['fecha'].iloc[-1]),
-            "descripcion": f"Pedidos de hoy ({int(hoy)}) muy por encima del promedio de los últimos {len(historial)} días ({media:.1f}).",
+            "fecha": actual['fecha'],
+            "descripcion": f"Pedidos de hoy ({int(hoy)}) muy por encima del promedio de los últimos {dias} días ({media:.1f}).",
             "severidad": "media",
         })
     return anomalias
+
+
+def puntaje_z_intradia(ahora: Optional[datetime] = None) -> Optional[Dict]:
+    """Pedidos de hoy hasta la última hora completa contra lo acumulado a
+    esa hora en los mismos días de la semana. None si aún no hay línea base
+    suficiente (o si todavía no termina la primera hora del día).
+    `fecha`/`hora` de los pedidos son hora de Chile: el reloj del servidor
+    (UTC en Render) se convierte antes de elegir el día y la hora; un
+    `ahora` sin zona se toma como hora de Chile."""
+    if ahora is None:
+        ahora = datetime.now(CHILE_TZ)
+    elif ahora.tzinfo is not None:
+        ahora = ahora.astimezone(CHILE_TZ)
+    hoy, hora = ahora.date(), ahora.hour - 1
+    if hora < 0:
+        return None
+    with _lock:
+        _cerrar_intradia_hasta(hoy - timedelta(days=1))
+    est = _detector['base_intradia'][hoy.weekday()][hora]
+    if est['n'] < MIN_SEMANAS_INTRADIA:
+        return None
+    horas_hoy = _detector['horas'].get(hoy)
+    llevamos = sum(horas_hoy[:hora + 1]) if horas_hoy else 0
+    desviacion = _desviacion(est)
+    return {
+        'fecha': str(hoy),
+        'hasta_hora': f"{hora + 1:02d}:00",
+        'pedidos': llevamos,
+        'esperado': est['media'],
+        'desviacion': desviacion,
+        'dias_historial': est['n'],
+        'z_score': (llevamos - est['media']) / desviacion if desviacion else None,
+    }
+
+
+def detectar_anomalias_intradia(
+    pedidos: List[Dict], version_datos: Optional[str] = None, ahora: Optional[datetime] = None,
+) -> Optional[List[Dict]]:
+    """Caída o salto de lo que va de hoy respecto de lo normal a esta hora
+    para este día de la semana. Devuelve None si no hay línea base
+    intradía (historial sin hora o muy corto): el llamador decide si cae a
+    `detectar_anomalias`."""
+    sincronizar_detector(pedidos, version_datos)
+    actual = puntaje_z_intradia(ahora)
+    if actual is None:
+        return None
+    if actual['esperado'] < MIN_ESPERADO_INTRADIA or actual['z_score'] is None:
+        return []
+
+    z_score, hasta = actual['z_score'], actual['hasta_hora']
+    detalle = f"Hasta las {hasta} van {actual['pedidos']} pedidos; a esa hora lo normal para este día de la semana es {actual['esperado']:.1f}."
+    if z_score <= -UMBRAL_DESVIACIONES:
+        return [{
+            "tipo": "caida_pedidos_intradia",
+            "fecha": actual['fecha'],
+            "descripcion": detalle,
+            "severidad": "alta" if z_score <= -3 else "media",
+        }]
+    if z_score >= UMBRAL_DESVIACIONES:
+        return [{
+            "tipo": "salto_pedidos_intradia",
+            "fecha": actual['fecha'],
+            "descripcion": detalle,
+            "severidad": "media",
+        }]
+    return []
@@ -0,0 +1,139 @@
+"""
+Caché de respuestas del chat (/chat).
+
+- Clave: pregunta normalizada (minúsculas, sin tildes, espacios ni signos
+  de sobra) + intención + últimos turnos del historial. "¿Cómo van las
+  ventas?" y "como van las ventas" comparten respuesta.
+- Cada entrada guarda la versión de datos con que se calculó; una entrada
+  de otra versión o más vieja que TTL_SEGUNDOS no se sirve y se descarta
+  al encontrarla. Tamaño acotado (LRU).
+- Preguntas idénticas que llegan mientras la primera todavía se calcula
+  esperan ese mismo resultado en vez de repetir LLM + tools.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRADAS = 256
+TTL_SEGUNDOS = 30 * 60
+TURNOS_HISTORIAL_EN_CLAVE = 4
+
+# clave -> (versión, timestamp, valor)
+_cache: "OrderedDict[tuple, Tuple[str, float, Any]]" = OrderedDict()
+# (clave, versión) -> Future del cálculo en curso
+_en_vuelo: Dict[tuple, Future] = {}
+_estadisticas = {
+    "aciertos": 0, "fallos": 0, "coalescidas": 0,
+    "expiradas": 0, "invalidadas": 0, "desalojos": 0, "no_cacheables": 0,
+}
+_lock = threading.Lock()
+
+
+def normalizar_pregunta(pregunta: str) -> str:
+    sin_tildes = "".join(
+        c for c in unicodedata.normalize("NFKD", pregunta.lower())
+        if not unicodedata.combining(c)
+    )
+    sin_signos = re.sub(r"[¿?¡!.,;:]+", " ", sin_tildes)
+    return " ".join(sin_signos.split())
+
+
+def clave_pregunta(pregunta: str, intencion: str, historial: Optional[List[Dict]] = None) -> tuple:
+    """La misma pregunta en conversaciones distintas puede significar otra
+    cosa ("¿y el mes pasado?"): los últimos turnos entran en la clave."""
+    turnos = [
+        (m.get("role"), normalizar_pregunta(m.get("content", "")))
+        for m in (historial or [])[-TURNOS_HISTORIAL_EN_CLAVE:]
+    ]
+    firma_historial = hashlib.md5(json.dumps(turnos, ensure_ascii=False).encode()).hexdigest() if turnos else ""
+    return (normalizar_pregunta(pregunta), intencion, firma_historial)
+
+
+def _guardar(clave: tuple, version: str, valor: Any, cacheable: bool):
+    with _lock:
+        if cacheable:
+            _cache[clave] = (version, time.monotonic(), valor)
+            _cache.move_to_end(clave)
+            while len(_cache) > MAX_ENTRADAS:
+                _cache.popitem(last=False)
+                _estadisticas["desalojos"] += 1
+        else:
+            _estadisticas["no_cacheables"] += 1
+
+
+def resolver(clave: tuple, version: str, calcular: Callable[[], Tuple[Any, bool]]) -> Tuple[Any, str]:
+    """Devuelve (valor, origen) con origen "cache", "coalescida" o
+    "calculada". `calcular()` devuelve (valor, cacheable). Una consulta
+    idéntica en vuelo solo comparte su valor si es cacheable: borradores,
+    simulaciones, errores y timeouts se calculan por separado."""
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _cache.get(clave)
+        if entrada is not None:
+            version_entrada, creada, valor = entrada
+            if version_entrada == version and ahora - creada < TTL_SEGUNDOS:
+                _cache.move_to_end(clave)
+                _estadisticas["aciertos"] += 1
+                return valor, "cache"
+            del _cache[clave]
+            _estadisticas["invalidadas" if version_entrada != version else "expiradas"] += 1
+
+        clave_vuelo = (clave, version)
+        futuro = _en_vuelo.get(clave_vuelo)
+        lider = futuro is None
+        if lider:
+            futuro = Future()
+            _en_vuelo[clave_vuelo] = futuro
+
+    if not lider:
+        valor, cacheable = futuro.result()
+        if cacheable:
+            with _lock:
+                _estadisticas["coalescidas"] += 1
+            return valor, "coalescida"
+
+    with _lock:
+        _estadisticas["fallos"] += 1
+    try:
+        valor, cacheable = calcular()
+    except BaseException:
+        if lider:
+            with _lock:
+                _en_vuelo.pop(clave_vuelo, None)
+            futuro.set_result((None, False))
+        raise
+
+    _guardar(clave, version, valor, cacheable)
+    if lider:
+        with _lock:
+            _en_vuelo.pop(clave_vuelo, None)
+        futuro.set_result((valor, cacheable))
+    return valor, "calculada"
+
+
+def estadisticas_cache_chat() -> Dict:
+    with _lock:
+        consultas = _estadisticas["aciertos"] + _estadisticas["fallos"] + _estadisticas["coalescidas"]
+        ahorradas = _estadisticas["aciertos"] + _estadisticas["coalescidas"]
+        return {
+            **_estadisticas,
+            "entradas": len(_cache),
+            "en_vuelo": len(_en_vuelo),
+            "tasa_aciertos": round(ahorradas / consultas, 3) if consultas else None,
+        }
+
+
+def limpiar_cache_chat():
+    with _lock:
+        _cache.clear()
+        for clave in _estadisticas:
+            _estadisticas[clave] = 0
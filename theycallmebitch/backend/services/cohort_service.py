@@ -0,0 +1,181 @@
+"""
+Servicio de cohortes de retención.
+
+Agrupa a los clientes por mes de su primera compra (cohorte) y mide, para
+cada mes transcurrido desde entonces, qué porcentaje de la cohorte volvió a
+comprar ese mes (retención) y qué porcentaje ya hizo su segunda compra
+(curva de recompra acumulada). Todo sale de una sola pasada vectorizada
+sobre los pares (cohorte, meses desde la primera compra) — sin recorrer
+cliente por cliente.
+
+La tasa de activación de clientes nuevos (activation_service) es una celda
+más de este mismo cálculo: segunda compra dentro de la ventana en días.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Una sola entrada: la última matriz calculada, por versión de datos y día
+# (la columna del mes en curso depende de "hoy").
+_cache_cohortes = {"clave": None, "resultado": None}
+
+
+def _parsear_fechas(fechas: pd.Series) -> pd.Series:
+    """DD-MM-YYYY primero, YYYY-MM-DD como respaldo, NaT si ninguno calza."""
+    texto = fechas.astype(str).str[:10]
+    dmy = pd.to_datetime(texto, format="%d-%m-%Y", errors="coerce")
+    ymd = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    return dmy.fillna(ymd)
+
+
+def _indice_mes(fechas: pd.Series) -> pd.Series:
+    return fechas.dt.year * 12 + fechas.dt.month - 1
+
+
+def _etiqueta_mes(indice: int) -> str:
+    return f"{indice // 12}-{indice % 12 + 1:02d}"
+
+
+def _porcentaje(numerador, denominador) -> Optional[float]:
+    return round(float(numerador) / float(denominador) * 100, 1) if denominador else None
+
+
+def _resultado_vacio() -> Dict:
+    return {
+        "cohortes": [],
+        "retencion_promedio_pct": [],
+        "activacion": {
+            "clientes_evaluados": 0, "clientes_activados": 0,
+            "tasa_activacion_pct": None, "dias_promedio_segunda_compra": None,
+        },
+    }
+
+
+def calcular_cohortes(
+    pedidos: List[Dict],
+    ventana_activacion_dias: int = 30,
+    hoy: Optional[datetime] = None,
+) -> Dict:
+    """Matriz de retención y curvas de recompra de todas las cohortes.
+
+    Solo se reportan los meses ya observables de cada cohorte (el mes en
+    curso cuenta, aunque esté incompleto)."""
+    df = pd.DataFrame(pedidos)
+    if df.empty or 'usuario' not in df.columns or 'fecha' not in df.columns:
+        return _resultado_vacio()
+    if 'nombrelocal' in df.columns:
+        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
+
+    df = pd.DataFrame({'usuario': df['usuario'].astype(str), 'fecha_dt': _parsear_fechas(df['fecha'])})
+    df = df.dropna(subset=['fecha_dt']).sort_values(['usuario', 'fecha_dt'], kind='stable')
+    if df.empty:
+        return _resultado_vacio()
+
+    hoy = hoy or datetime.now()
+    mes_hoy = hoy.year * 12 + hoy.month - 1
+
+    por_usuario = df.groupby('usuario', sort=False)['fecha_dt']
+    primera = por_usuario.transform('first')
+    orden = df.groupby('usuario', sort=False).cumcount()
+    df['cohorte'] = _indice_mes(primera)
+    df['k'] = _indice_mes(df['fecha_dt']) - df['cohorte']
+
+    # Retención: clientes distintos de cada cohorte que compraron en el mes k.
+    pares = df[['cohorte', 'k', 'usuario']].drop_duplicates()
+    activos = pares.groupby(['cohorte', 'k']).size().unstack(fill_value=0)
+    tamanos = activos[0]
+    # Hasta el último mes observable de la cohorte más antigua, aunque nadie haya comprado.
+    columnas = range(max(int(activos.columns.max()), mes_hoy - int(activos.index.min())) + 1)
+    activos = activos.reindex(columns=columnas, fill_value=0)
+
+    # Recompra acumulada: mes (desde la cohorte) de la segunda compra de cada cliente.
+    segundas = df[orden == 1]
+    recompra = (
+        segundas.groupby(['cohorte', 'k']).size().unstack(fill_value=0)
+        .reindex(index=activos.index, columns=columnas, fill_value=0)
+        .cumsum(axis=1)
+    )
+
+    observable = (activos.index.values[:, None] + activos.columns.values[None, :]) <= mes_hoy
+    activos_obs = activos.where(observable)
+    retencion = activos_obs.div(tamanos, axis=0) * 100
+    recompra_pct = recompra.where(observable).div(tamanos, axis=0) * 100
+
+    cohortes = []
+    for cohorte in activos.index:
+        n_obs = int(observable[activos.index.get_loc(cohorte)].sum())
+        cohortes.append({
+            "cohorte": _etiqueta_mes(int(cohorte)),
+            "clientes": int(tamanos[cohorte]),
+            "retencion_pct": [round(float(v), 1) for v in retencion.loc[cohorte].iloc[:n_obs]],
+            "recompra_acumulada_pct": [round(float(v), 1) for v in recompra_pct.loc[cohorte].iloc[:n_obs]],
+        })
+
+    # Promedio ponderado por tamaño, solo con las cohortes que ya llegaron a ese mes.
+    tamanos_obs = pd.DataFrame(observable, index=activos.index, columns=activos.columns).mul(tamanos, axis=0).sum()
+    retencion_promedio = [
+        _porcentaje(activos_obs[k].sum(), tamanos_obs[k]) for k in activos.columns if tamanos_obs[k] > 0
+    ]
+
+    # Activación: segunda compra dentro de `ventana_activacion_dias` desde la primera,
+    # solo para clientes cuya primera compra fue hace al menos esa ventana.
+    primeras_fechas = df.loc[orden == 0].set_index('usuario')['fecha_dt']
+    segundas_fechas = segundas.set_index('usuario')['fecha_dt'].reindex(primeras_fechas.index)
+    dias_segunda = (segundas_fechas - primeras_fechas).dt.days
+    elegibles = primeras_fechas <= hoy - timedelta(days=ventana_activacion_dias)
+    activados = elegibles & (dias_segunda <= ventana_activacion_dias)
+    evaluados = int(elegibles.sum())
+    activacion = {
+        "clientes_evaluados": evaluados,
+        "clientes_activados": int(activados.sum()),
+        "tasa_activacion_pct": _porcentaje(activados.sum(), evaluados),
+        "dias_promedio_segunda_compra": (
+            round(float(dias_segunda[activados].mean()), 1) if activados.any() else None
+        ),
+    }
+
+    return {
+        "cohortes": cohortes,
+        "retencion_promedio_pct": retencion_promedio,
+        "activacion": activacion,
+    }
+
+
+def obtener_cohortes(
+    pedidos: List[Dict],
+    version_datos: Optional[str],
+    ventana_activacion_dias: int = 30,
+) -> Dict:
+    """`calcular_cohortes` cacheado por versión de datos (data_adapter.version_datos)
+    y día. Sin versión no se cachea."""
+    clave = (version_datos, date.today(), ventana_activacion_dias)
+    if version_datos is not None and _cache_cohortes["clave"] == clave:
+        return _cache_cohortes["resultado"]
+
+    resultado = calcular_cohortes(pedidos, ventana_activacion_dias=ventana_activacion_dias)
+    if version_datos is not None:
+        _cache_cohortes["clave"] = clave
+        _cache_cohortes["resultado"] = resultado
+    return resultado
+
+
+def recortar_cohortes(resultado: Dict, horizonte_meses: Optional[int] = None, ultimas_cohortes: Optional[int] = None) -> Dict:
+    """Vista reducida de la matriz (sin recalcular): solo las últimas N
+    cohortes y los primeros M meses de cada una."""
+    cohortes = resultado["cohortes"][-ultimas_cohortes:] if ultimas_cohortes else resultado["cohortes"]
+    return {
+        **resultado,
+        "cohortes": [
+            {
+                **c,
+                "retencion_pct": c["retencion_pct"][:horizonte_meses],
+                "recompra_acumulada_pct": c["recompra_acumulada_pct"][:horizonte_meses],
+            }
+            for c in cohortes
+        ],
+        "retencion_promedio_pct": resultado["retencion_promedio_pct"][:horizonte_meses],
+    }
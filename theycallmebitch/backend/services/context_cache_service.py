@@ -0,0 +1,126 @@
+"""
+Contexto de negocio cacheado para el chat, /briefing y el loop autónomo.
+
+Armar el contexto completo cuesta: KPIs desde cero, RFM, zonas, clima (a
+veces una llamada de red) y tres consultas a SQLite. Aquí se guarda el
+último contexto armado junto con la firma de sus entradas:
+
+    (versión de pedidos, marca del clima, versión de la memoria, día)
+
+Si la firma no cambió, se devuelve tal cual. Si cambió (o el contexto
+supera MAX_EDAD_SEGUNDOS), se devuelve el anterior y se reconstruye en un
+hilo de fondo, de modo que el chat llega a OpenAI sin esperar. Solo la
+primera vez, sin nada guardado, se construye en línea.
+
+El dict devuelto es compartido: quien lo recibe no debe modificarlo.
+"""
+import logging
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Respaldo para cambios que la firma no ve (p.ej. escrituras a la memoria
+# desde otro worker).
+MAX_EDAD_SEGUNDOS = 15 * 60
+# Posición de la marca del clima en la firma (ver firma_entradas)
+INDICE_MARCA_CLIMA = 1
+
+_estado = {
+    "contexto": None, "firma": None, "construido_en": 0.0,
+    "reconstruyendo": False,
+}
+_estadisticas = {"aciertos": 0, "obsoletos": 0, "construcciones": 0, "errores": 0}
+_lock = threading.Lock()
+_lock_construccion = threading.Lock()
+
+
+def firma_entradas(version_datos: Optional[str]) -> tuple:
+    from services.memory_service import version_memoria
+    from services.weather_service import marca_clima
+    return (version_datos, marca_clima(), version_memoria(), date.today().isoformat())
+
+
+def _construir(construir: Callable[[], Dict], obtener_firma: Callable[[], tuple]) -> Dict:
+    with _lock_construccion:
+        inicio = time.perf_counter()
+        # Pedidos y memoria se firman antes de construir: si cambian
+        # mientras tanto, el contexto queda con la firma vieja y se
+        # reconstruye en la próxima consulta. Solo la marca del clima se
+        # relee después, porque construir() puede refrescarlo.
+        antes = obtener_firma()
+        contexto = construir()
+        despues = obtener_firma()
+        firma = (
+            antes[:INDICE_MARCA_CLIMA] + despues[INDICE_MARCA_CLIMA:INDICE_MARCA_CLIMA + 1]
+            + antes[INDICE_MARCA_CLIMA + 1:]
+        )
+        with _lock:
+            _estado.update(contexto=contexto, firma=firma, construido_en=time.monotonic())
+            _estadisticas["construcciones"] += 1
+        logger.info(f"Contexto de negocio construido en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return contexto
+
+
+def _reconstruir_en_fondo(construir: Callable[[], Dict], obtener_firma: Callable[[], tuple]):
+    try:
+        _construir(construir, obtener_firma)
+    except Exception as e:
+        logger.error(f"Error reconstruyendo contexto de negocio: {e}")
+        with _lock:
+            _estadisticas["errores"] += 1
+    finally:
+        with _lock:
+            _estado["reconstruyendo"] = False
+
+
+def obtener_contexto(
+    construir: Callable[[], Dict],
+    obtener_firma: Callable[[], tuple],
+    esperar_vigente: bool = False,
+) -> Dict:
+    """Contexto cacheado. Con `esperar_vigente=True` (procesos de fondo que
+    prefieren datos al día antes que rapidez) un contexto desactualizado se
+    reconstruye en línea en vez de en segundo plano."""
+    firma = obtener_firma()
+    lanzar = False
+    with _lock:
+        contexto = _estado["contexto"]
+        vigente = (
+            contexto is not None
+            and firma == _estado["firma"]
+            and time.monotonic() - _estado["construido_en"] < MAX_EDAD_SEGUNDOS
+        )
+        if vigente:
+            _estadisticas["aciertos"] += 1
+            return contexto
+        if contexto is not None:
+            _estadisticas["obsoletos"] += 1
+            if not esperar_vigente and not _estado["reconstruyendo"]:
+                _estado["reconstruyendo"] = True
+                lanzar = True
+
+    if contexto is None or esperar_vigente:
+        return _construir(construir, obtener_firma)
+    if lanzar:
+        threading.Thread(
+            target=_reconstruir_en_fondo, args=(construir, obtener_firma),
+            name="contexto-negocio", daemon=True,
+        ).start()
+    return contexto
+
+
+def estadisticas_contexto() -> Dict:
+    with _lock:
+        return {
+            **_estadisticas,
+            "edad_segundos": round(time.monotonic() - _estado["construido_en"], 1) if _estado["contexto"] else None,
+            "reconstruyendo": _estado["reconstruyendo"],
+        }
+
+
+def invalidar_contexto():
+    with _lock:
+        _estado.update(contexto=None, firma=None, construido_en=0.0)
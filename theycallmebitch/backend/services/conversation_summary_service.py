@@ -0,0 +1,134 @@
+"""
+Resúmenes de conversación cacheados para la guardia de tokens del chat.
+
+El frontend reenvía el historial completo en cada mensaje. Cuando una
+conversación larga pasa el umbral de tokens, los turnos viejos son casi
+siempre los mismos que en el mensaje anterior más uno o dos nuevos: no
+tiene sentido volver a resumirlos en cada turno, y menos con una llamada
+al LLM que bloquea la respuesta.
+
+Cada resumen se guarda con la firma del prefijo de mensajes que cubre
+(hash encadenado mensaje a mensaje). Al comprimir se usa el resumen del
+prefijo más largo que ya esté en caché y lo que falta se resume en un
+hilo de fondo, extendiendo el resumen anterior con los turnos nuevos
+(resumen de resumen + turnos nuevos), listo para el mensaje siguiente.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_RESUMENES = 256
+
+# firma del prefijo -> resumen
+_resumenes: "OrderedDict[str, str]" = OrderedDict()
+_en_curso: set = set()
+_estadisticas = {"aciertos": 0, "parciales": 0, "sin_resumen": 0, "generados": 0, "errores": 0}
+_lock = threading.Lock()
+_pool = None
+
+
+def _obtener_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resumen")
+    return _pool
+
+
+def firmas_prefijo(mensajes: List[Dict]) -> List[str]:
+    """firmas[k] identifica mensajes[:k + 1]."""
+    firmas, anterior = [], ""
+    for mensaje in mensajes:
+        contenido = json.dumps(
+            {"role": mensaje.get("role"), "content": mensaje.get("content")},
+            ensure_ascii=False, sort_keys=True,
+        )
+        anterior = hashlib.md5(f"{anterior}|{contenido}".encode()).hexdigest()
+        firmas.append(anterior)
+    return firmas
+
+
+def _mas_largo_cacheado(firmas: List[str]) -> Tuple[Optional[str], int]:
+    for k in range(len(firmas), 0, -1):
+        resumen = _resumenes.get(firmas[k - 1])
+        if resumen is not None:
+            _resumenes.move_to_end(firmas[k - 1])
+            return resumen, k
+    return None, 0
+
+
+def obtener_resumen(mensajes: List[Dict]) -> Tuple[Optional[str], int]:
+    """(resumen, cantidad de mensajes que cubre) del prefijo más largo de
+    `mensajes` ya resumido; (None, 0) si no hay ninguno."""
+    firmas = firmas_prefijo(mensajes)
+    with _lock:
+        resumen, cubiertos = _mas_largo_cacheado(firmas)
+        if cubiertos == len(mensajes):
+            _estadisticas["aciertos"] += 1
+        elif cubiertos:
+            _estadisticas["parciales"] += 1
+        else:
+            _estadisticas["sin_resumen"] += 1
+    return resumen, cubiertos
+
+
+def _guardar(firma: str, resumen: str):
+    with _lock:
+        _resumenes[firma] = resumen
+        _resumenes.move_to_end(firma)
+        while len(_resumenes) > MAX_RESUMENES:
+            _resumenes.popitem(last=False)
+        _estadisticas["generados"] += 1
+
+
+def _extender(mensajes: List[Dict], firmas: List[str], resumir: Callable[[Optional[str], List[Dict]], str]):
+    try:
+        with _lock:
+            previo, cubiertos = _mas_largo_cacheado(firmas)
+        if cubiertos < len(mensajes):
+            _guardar(firmas[-1], resumir(previo, mensajes[cubiertos:]))
+    except Exception as e:
+        logger.warning(f"No se pudo resumir historial: {e}")
+        with _lock:
+            _estadisticas["errores"] += 1
+    finally:
+        with _lock:
+            _en_curso.discard(firmas[-1])
+
+
+def programar_resumen(
+    mensajes: List[Dict],
+    resumir: Callable[[Optional[str], List[Dict]], str],
+    en_segundo_plano: bool = True,
+):
+    """Resume `mensajes` partiendo del resumen cacheado más largo.
+    `resumir(resumen_previo, mensajes_nuevos)` hace la llamada al LLM. Un
+    mismo prefijo no se resume dos veces a la vez."""
+    if not mensajes:
+        return
+    firmas = firmas_prefijo(mensajes)
+    with _lock:
+        if firmas[-1] in _resumenes or firmas[-1] in _en_curso:
+            return
+        _en_curso.add(firmas[-1])
+    if en_segundo_plano:
+        _obtener_pool().submit(_extender, mensajes, firmas, resumir)
+    else:
+        _extender(mensajes, firmas, resumir)
+
+
+def estadisticas_resumenes() -> Dict:
+    with _lock:
+        return {**_estadisticas, "resumenes": len(_resumenes), "en_curso": len(_en_curso)}
+
+
+def limpiar_resumenes():
+    with _lock:
+        _resumenes.clear()
+        for clave in _estadisticas:
+            _estadisticas[clave] = 0
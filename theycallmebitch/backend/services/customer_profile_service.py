@@ -12,8 +12,12 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 
+from services.geocoding_service import geocodificar_desde_cache
+from services.sla_compliance_service import calcular_cumplimiento_horario
+
 logger = logging.getLogger(__name__)
 
 
@@ -28,6 +32,14 @@ def _parsear_fecha(fecha_str: Optional[str]):
     return None
 
 
+# Campos de cada pedido que se devuelven en la ficha de un cliente (sin
+# tokens de notificación ni datos internos del repartidor).
+CAMPOS_PEDIDO_FICHA = [
+    'id', 'fecha', 'hora', 'precio', 'ordenpedido', 'metodopago', 'status',
+    'retirolocal', 'dire', 'horaagenda', 'horaentrega', 'despachador', 'calific',
+]
+
+
 def construir_perfiles_clientes(pedidos: List[Dict]) -> List[Dict]:
     """Devuelve una fila por cliente único (agrupado por `usuario`), con
     contacto tomado del pedido más reciente y totales reales agregados."""
@@ -67,3 +79,66 @@ def construir_perfiles_clientes(pedidos: List[Dict]) -> List[Dict]:
         })
 
     return perfiles
+
+
+def _ubicacion_cliente(pedidos_ordenados: List[Dict]) -> Optional[Dict]:
+    """Coordenadas del pedido más reciente que las tenga; si ninguno trae
+    lat/lon, la dirección más reciente desde el caché de geocoding (sin red)."""
+    for pedido in pedidos_ordenados:
+        lat = pd.to_numeric(pedido.get('lat'), errors='coerce')
+        lon = pd.to_numeric(pedido.get('lon'), errors='coerce')
+        if pd.notna(lat) and pd.notna(lon) and (lat, lon) != (0, 0):
+            return {'lat': float(lat), 'lon': float(lon), 'direccion': str(pedido.get('dire', '') or ''), 'fuente': 'pedido'}
+    for pedido in pedidos_ordenados:
+        direccion = str(pedido.get('dire', '') or '').strip()
+        if not direccion:
+            continue
+        coords = geocodificar_desde_cache(direccion)
+        if coords:
+            return {'lat': coords['lat'], 'lon': coords['lon'], 'direccion': direccion, 'fuente': 'geocoding'}
+    return None
+
+
+def construir_ficha_cliente(usuario: str, pedidos_cliente: List[Dict], segmento: Optional[str] = None,
+                            riesgo: Optional[Dict] = None) -> Optional[Dict]:
+    """Vista 360 de UN cliente a partir solo de sus propios pedidos (ya
+    resueltos por el índice de data_adapter). `segmento` y `riesgo` vienen
+    de los análisis globales (RFM y customer_risk_service), que dependen de
+    todos los clientes y se calculan fuera. None si no tiene pedidos."""
+    fechados = []
+    for pedido in pedidos_cliente:
+        if str(pedido.get('nombrelocal', '')).strip().lower() not in ('', 'aguas ancud'):
+            continue
+        fecha = _parsear_fecha(pedido.get('fecha'))
+        if fecha:
+            fechados.append((fecha, pedido))
+    if not fechados:
+        return None
+    fechados.sort(key=lambda fp: fp[0], reverse=True)
+    pedidos_ordenados = [p for _, p in fechados]
+
+    perfil = construir_perfiles_clientes(pedidos_ordenados)
+    fechas = sorted(f for f, _ in fechados)
+    intervalos = [(fechas[i] - fechas[i - 1]).days for i in range(1, len(fechas))]
+
+    return {
+        **(perfil[0] if perfil else {'usuario': usuario}),
+        'segmento_rfm': segmento,
+        'riesgo': {
+            'estado': riesgo['estado'],
+            'dias_atraso': riesgo['dias_atraso'],
+            'probabilidad_reorden': riesgo['probabilidad_reorden'],
+            'valor_en_juego': riesgo['valor_en_juego'],
+        } if riesgo else None,
+        'cadencia': {
+            'mediana_dias': float(np.median(intervalos)) if intervalos else None,
+            'promedio_dias': round(float(np.mean(intervalos)), 1) if intervalos else None,
+            'ultimos_intervalos_dias': intervalos[-5:],
+        },
+        'sla': calcular_cumplimiento_horario(pedidos_ordenados),
+        'ubicacion': _ubicacion_cliente(pedidos_ordenados),
+        'historial_pedidos': [
+            {campo: p.get(campo) for campo in CAMPOS_PEDIDO_FICHA if campo in p}
+            for p in pedidos_ordenados
+        ],
+    }
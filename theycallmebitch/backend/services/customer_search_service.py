@@ -0,0 +1,222 @@
+"""
+Servicio de búsqueda de clientes — índice invertido de trigramas.
+
+Indexa usuario (email), teléfono y dirección del pedido más reciente de
+cada cliente. Buscar por trigramas (no por substring exacto) tolera errores
+de tipeo y acentos: "lago rnco" encuentra "Lago Ranco 123".
+
+El índice vive en memoria y se sincroniza por versión de datos
+(data_adapter.version_datos): si la versión no cambió no se hace nada, y si
+cambió solo se re-indexan los clientes cuyo contacto cambió, en vez de
+reconstruirlo completo.
+"""
+import logging
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ('usuario', 'telefono', 'direccion')
+UMBRAL_SIMILITUD = 0.3
+UMBRAL_DIRECCION_CANONICA = 0.85
+UMBRAL_RESOLVER_USUARIO = 0.6
+MIN_DIGITOS_TELEFONO = 3
+
+_indice = {
+    "version": None,
+    "documentos": {},                 # usuario -> {campo: texto original}
+    "postings": defaultdict(set),     # trigrama -> {(usuario, campo)}
+    "tamanos": {},                    # (usuario, campo) -> n° de trigramas
+}
+
+# Sincronizar y buscar llegan desde el threadpool de FastAPI, los hilos de
+# las tools y el geocoding: el índice se modifica en el lugar, así que todo
+# acceso pasa por este lock (reentrante: resolver_usuario busca dentro).
+_lock = threading.RLock()
+
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+
+def _parsear_fecha(fecha_str: Optional[str]):
+    if not fecha_str:
+        return None
+    for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(fecha_str)[:10], fmt)
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas, sin tildes, solo letras/dígitos separados por un espacio."""
+    sin_tildes = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode()
+    return _NO_ALFANUMERICO.sub(' ', sin_tildes.lower()).strip()
+
+
+def _normalizar_campo(campo: str, texto: str) -> str:
+    if campo == 'telefono':
+        return re.sub(r'\D', '', str(texto or ''))
+    return normalizar_texto(texto)
+
+
+def _trigramas(texto_normalizado: str) -> set:
+    """Trigramas por palabra con relleno al estilo pg_trgm ("  w "), para
+    que el inicio de cada palabra pese más que su interior."""
+    trigramas = set()
+    for palabra in texto_normalizado.split():
+        relleno = f"  {palabra} "
+        trigramas.update(relleno[i:i + 3] for i in range(len(relleno) - 2))
+    return trigramas
+
+
+def _documentos_desde_pedidos(pedidos: List[Dict]) -> Dict[str, Dict[str, str]]:
+    """Contacto del pedido más reciente de cada cliente (Aguas Ancud)."""
+    mas_reciente: Dict[str, tuple] = {}
+    for pedido in pedidos:
+        if str(pedido.get('nombrelocal', '')).strip().lower() not in ('', 'aguas ancud'):
+            continue
+        usuario = str(pedido.get('usuario', '') or '').strip()
+        if not usuario:
+            continue
+        fecha = _parsear_fecha(pedido.get('fecha')) or datetime.min
+        if usuario not in mas_reciente or fecha >= mas_reciente[usuario][0]:
+            mas_reciente[usuario] = (fecha, pedido)
+
+    return {
+        usuario: {
+            'usuario': usuario,
+            'telefono': str(pedido.get('telefonou', '') or ''),
+            'direccion': str(pedido.get('dire', '') or ''),
+        }
+        for usuario, (_, pedido) in mas_reciente.items()
+    }
+
+
+def _quitar_documento(usuario: str):
+    for campo in CAMPOS:
+        clave = (usuario, campo)
+        if _indice["tamanos"].pop(clave, None) is None:
+            continue
+        texto = _indice["documentos"][usuario][campo]
+        for trigrama in _trigramas(_normalizar_campo(campo, texto)):
+            postings = _indice["postings"].get(trigrama)
+            if postings is not None:
+                postings.discard(clave)
+                if not postings:
+                    del _indice["postings"][trigrama]
+    del _indice["documentos"][usuario]
+
+
+def _agregar_documento(documento: Dict[str, str]):
+    usuario = documento['usuario']
+    _indice["documentos"][usuario] = documento
+    for campo in CAMPOS:
+        trigramas = _trigramas(_normalizar_campo(campo, documento[campo]))
+        if not trigramas:
+            continue
+        clave = (usuario, campo)
+        _indice["tamanos"][clave] = len(trigramas)
+        for trigrama in trigramas:
+            _indice["postings"][trigrama].add(clave)
+
+
+def sincronizar_indice(pedidos: List[Dict], version: Optional[str]) -> Dict:
+    """Pone el índice al día con `pedidos`. Con la misma `version` ya
+    indexada no hace nada; si cambió, solo toca los clientes nuevos, con
+    contacto distinto o que ya no existen."""
+    with _lock:
+        if version is not None and version == _indice["version"]:
+            return {"agregados": 0, "actualizados": 0, "eliminados": 0}
+
+        nuevos = _documentos_desde_pedidos(pedidos)
+        actuales = _indice["documentos"]
+        eliminados = [u for u in actuales if u not in nuevos]
+        actualizados = [u for u, doc in nuevos.items() if u in actuales and actuales[u] != doc]
+        agregados = [u for u in nuevos if u not in actuales]
+
+        for usuario in eliminados + actualizados:
+            _quitar_documento(usuario)
+        for usuario in actualizados + agregados:
+            _agregar_documento(nuevos[usuario])
+
+        _indice["version"] = version
+        if eliminados or actualizados or agregados:
+            logger.info(
+                f"Índice de búsqueda de clientes: +{len(agregados)} ~{len(actualizados)} -{len(eliminados)} "
+                f"({len(_indice['documentos'])} clientes)"
+            )
+        return {"agregados": len(agregados), "actualizados": len(actualizados), "eliminados": len(eliminados)}
+
+
+def buscar_clientes(consulta: str, limite: int = 20, campos: tuple = CAMPOS) -> List[Dict]:
+    """Clientes ordenados por similitud con `consulta`. El puntaje combina
+    qué fracción de los trigramas de la consulta aparecen en el campo
+    (cobertura, pesa más: permite buscar por un pedazo de la dirección) y
+    la similitud de Jaccard (desempata a favor del campo más parecido
+    completo). Se queda con el mejor campo de cada cliente."""
+    trigramas_por_campo = {}
+    for campo in campos:
+        texto = _normalizar_campo(campo, consulta)
+        if campo == 'telefono' and len(texto) < MIN_DIGITOS_TELEFONO:
+            continue
+        trigramas = _trigramas(texto)
+        if trigramas:
+            trigramas_por_campo[campo] = trigramas
+
+    with _lock:
+        mejores: Dict[str, tuple] = {}
+        for campo, trigramas in trigramas_por_campo.items():
+            compartidos = Counter()
+            for trigrama in trigramas:
+                for clave in _indice["postings"].get(trigrama, ()):
+                    if clave[1] == campo:
+                        compartidos[clave] += 1
+            for (usuario, _), n in compartidos.items():
+                cobertura = n / len(trigramas)
+                jaccard = n / (len(trigramas) + _indice["tamanos"][(usuario, campo)] - n)
+                puntaje = 0.8 * cobertura + 0.2 * jaccard
+                if puntaje >= UMBRAL_SIMILITUD and puntaje > mejores.get(usuario, (0, None))[0]:
+                    mejores[usuario] = (puntaje, campo)
+
+        ranking = sorted(mejores.items(), key=lambda item: (-item[1][0], item[0]))[:limite]
+        return [
+            {**_indice["documentos"][usuario], 'campo': campo, 'puntaje': round(puntaje, 3)}
+            for usuario, (puntaje, campo) in ranking
+        ]
+
+
+def _numeros(texto: str) -> List[str]:
+    return re.findall(r'\d+', normalizar_texto(texto))
+
+
+def direcciones_similares(direccion: str, umbral: float = UMBRAL_DIRECCION_CANONICA, limite: int = 5) -> List[str]:
+    """Direcciones de clientes conocidos casi idénticas a `direccion`
+    (misma calle escrita distinto: tildes, abreviaturas, un typo). Los
+    números deben coincidir exactos: "Lago Ranco 12" no es "Lago Ranco 1234"
+    aunque sus trigramas se parezcan."""
+    numeros = _numeros(direccion)
+    return [
+        r['direccion']
+        for r in buscar_clientes(direccion, limite=limite, campos=('direccion',))
+        if r['puntaje'] >= umbral and _numeros(r['direccion']) == numeros
+    ]
+
+
+def resolver_usuario(texto: str) -> Optional[str]:
+    """Usuario (email) al que se refiere `texto`: coincidencia exacta o el
+    mejor resultado de la búsqueda si es suficientemente claro."""
+    texto = str(texto or '').strip()
+    if not texto:
+        return None
+    with _lock:
+        if texto in _indice["documentos"]:
+            return texto
+        resultados = buscar_clientes(texto, limite=1)
+    if resultados and resultados[0]['puntaje'] >= UMBRAL_RESOLVER_USUARIO:
+        return resultados[0]['usuario']
+    return None
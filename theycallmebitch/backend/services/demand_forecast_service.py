@@ -2,12 +2,21 @@
 Servicio de pronóstico de demanda — XGBoost con regresión por cuantiles.
 
 Predice pedidos esperados por día para los próximos N días, con un rango
-(P10-P90) en vez de un solo número. El modelo se entrena en cada llamada
-sobre los pedidos reales más recientes — no hay modelo serializado que
-pueda desactualizarse.
+(P10-P90) en vez de un solo número. Los modelos entrenados se guardan en
+disco (modelos_demanda/) con una huella de la serie de entrenamiento y de
+la configuración de features: solo se reentrena cuando cierra un día nuevo
+o cambia el historial, nunca por request.
 """
+import hashlib
+import json
 import logging
-from datetime import datetime, timedelta
+import os
+import threading
+import time
+from collections import deque
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional
 
 import numpy as np
@@ -19,6 +28,23 @@ logger = logging.getLogger(__name__)
 QUANTILES = {'p10': 0.1, 'p50': 0.5, 'p90': 0.9}
 FEATURES = ['dow', 'dom', 'month', 'is_weekend', 'lag7', 'lag14', 'lag30', 'temp', 'trend_day']
 MIN_DIAS_ENTRENAMIENTO = 14
+PARAMETROS_MODELO = {'n_estimators': 150, 'max_depth': 4, 'learning_rate': 0.08, 'random_state': 42}
+# 'multi': un solo XGBRegressor con los tres cuantiles (árboles con hojas
+# vectoriales: P10/P50/P90 comparten estructura y salen de una sola
+# predicción). 'tres': un modelo independiente por cuantil, el camino
+# anterior, para comparar (ver comparar_modos_cuantiles).
+MODO_CUANTILES = 'multi'
+# Hilos de XGBoost por entrenamiento (None = todos los núcleos). Los procesos
+# de un pool lo bajan a 1 para no sobre-suscribir la máquina. No es parte de
+# la huella: no cambia el modelo resultante.
+N_JOBS_ENTRENAMIENTO: Optional[int] = None
+# Subir si cambia cómo se calculan las features (invalida los modelos guardados).
+VERSION_FEATURES = 1
+
+RUTA_MODELOS = os.path.join(os.path.dirname(__file__), '..', 'modelos_demanda')
+MAX_MODELOS_EN_DISCO = 20
+
+_modelos_en_memoria: Dict[str, Dict[str, XGBRegressor]] = {}
 
 
 def _parsear_fecha(fecha_str: Optional[str]):
@@ -32,9 +58,11 @@ def _parsear_fecha(fecha_str: Optional[str]):
     return None
 
 
-def construir_serie_diaria(pedidos: List[Dict]) -> pd.DataFrame:
+def construir_serie_diaria(pedidos: List[Dict], fecha_fin: Optional[date] = None) -> pd.DataFrame:
     """Convierte la lista cruda de pedidos en una serie de un renglón por
-    día con el conteo de pedidos de ese día. Días sin pedidos quedan en 0."""
+    día con el conteo de pedidos de ese día. Días sin pedidos quedan en 0.
+    `fecha_fin` extiende la serie con ceros hasta esa fecha (para alinear
+    sub-series — un canal o zona — con la serie total)."""
     df = pd.DataFrame(pedidos)
     if df.empty or 'fecha' not in df.columns:
         return pd.DataFrame(columns=['fecha', 'pedidos'])
@@ -47,7 +75,8 @@ def construir_serie_diaria(pedidos: List[Dict]) -> pd.DataFrame:
     conteo = df.groupby(df['fecha_dt'].dt.date).size().rename('pedidos').reset_index()
     conteo = conteo.rename(columns={'fecha_dt': 'fecha'})
 
-    rango = pd.date_range(conteo['fecha'].min(), conteo['fecha'].max(), freq='D')
+    ultima = max(conteo['fecha'].max(), fecha_fin) if fecha_fin else conteo['fecha'].max()
+    rango = pd.date_range(conteo['fecha'].min(), ultima, freq='D')
     serie = pd.DataFrame({'fecha': rango.date})
     serie = serie.merge(conteo, on='fecha', how='left')
     serie['pedidos'] = serie['pedidos'].fillna(0).astype(int)
@@ -77,107 +106,365 @@ def agregar_features(serie: pd.DataFrame, temperaturas_por_fecha: Dict = None) -
     return serie
 
 
-def _entrenar_modelo_cuantil(X: pd.DataFrame, y: pd.Series, alpha: float) -> XGBRegressor:
+def _entrenar_modelo_cuantil(X: pd.DataFrame, y: pd.Series, alpha: float, n_jobs: Optional[int] = None) -> XGBRegressor:
+    modelo = XGBRegressor(
+        objective='reg:quantileerror', quantile_alpha=alpha,
+        n_jobs=n_jobs or N_JOBS_ENTRENAMIENTO, **PARAMETROS_MODELO,
+    )
+    modelo.fit(X, y)
+    return modelo
+
+
+def _entrenar_modelo_multicuantil(X: pd.DataFrame, y: pd.Series) -> XGBRegressor:
     modelo = XGBRegressor(
         objective='reg:quantileerror',
-        quantile_alpha=alpha,
-        n_estimators=150,
-        max_depth=4,
-        learning_rate=0.08,
-        random_state=42,
+        quantile_alpha=np.array(list(QUANTILES.values())),
+        tree_method='hist',
+        multi_strategy='multi_output_tree',
+        n_jobs=N_JOBS_ENTRENAMIENTO,
+        **PARAMETROS_MODELO,
     )
     modelo.fit(X, y)
     return modelo
 
 
-def entrenar_modelos(serie_features: pd.DataFrame) -> Dict[str, XGBRegressor]:
-    """Entrena un XGBRegressor por cuantil (P10/P50/P90)."""
+def _nombres_modelos(modo: str) -> List[str]:
+    return ['cuantiles'] if modo == 'multi' else list(QUANTILES)
+
+
+def entrenar_modelos(serie_features: pd.DataFrame, modo: Optional[str] = None) -> Dict[str, XGBRegressor]:
+    """Entrena los modelos de P10/P50/P90: uno multi-cuantil ({'cuantiles': m})
+    o uno por cuantil ({'p10': m, ...}) según `modo` (MODO_CUANTILES por defecto)."""
+    modo = modo or MODO_CUANTILES
     X = serie_features[FEATURES]
     y = serie_features['pedidos']
+    if modo == 'multi':
+        return {'cuantiles': _entrenar_modelo_multicuantil(X, y)}
     return {nombre: _entrenar_modelo_cuantil(X, y, alpha) for nombre, alpha in QUANTILES.items()}
 
 
-def predecir_proximos_dias(pedidos: List[Dict], dias: int = 7, temperaturas_futuras: Dict = None) -> List[Dict]:
+def predecir_cuantiles(modelos: Dict[str, XGBRegressor], X) -> np.ndarray:
+    """Matriz (n, 3) con P10/P50/P90 por fila, para cualquiera de los dos
+    modos: el multi-cuantil las entrega en una sola llamada."""
+    if 'cuantiles' in modelos:
+        return np.asarray(modelos['cuantiles'].predict(X)).reshape(-1, len(QUANTILES))
+    return np.column_stack([modelos[nombre].predict(X) for nombre in QUANTILES])
+
+
+def _hash_configuracion(modo: Optional[str] = None):
+    config = {
+        'features': FEATURES, 'quantiles': QUANTILES,
+        'parametros': PARAMETROS_MODELO, 'version_features': VERSION_FEATURES,
+    }
+    if modo:
+        config['modo'] = modo
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode())
+
+
+def _filas_serie(serie: pd.DataFrame) -> List[str]:
+    return serie['fecha'].astype(str).str.cat(serie['pedidos'].astype(str), sep=':').tolist()
+
+
+def huella_entrenamiento(serie: pd.DataFrame, modo: Optional[str] = None) -> str:
+    """Hash de la serie de entrenamiento (fecha y pedidos de cada día) más
+    la configuración de features y del modelo. Cambia solo si cambian los
+    datos con que se entrena o la forma de entrenar."""
+    h = _hash_configuracion(modo or MODO_CUANTILES)
+    h.update(','.join(_filas_serie(serie)).encode())
+    return h.hexdigest()[:24]
+
+
+def _huellas_prefijos(serie: pd.DataFrame, desde: int) -> Dict[int, str]:
+    """Huella de cada prefijo serie.iloc[:i] para i >= desde, en una sola
+    pasada incremental sobre la serie (sin re-hashear cada prefijo). No
+    depende de MODO_CUANTILES: la validación siempre usa un modelo P50."""
+    h = _hash_configuracion()
+    huellas = {}
+    for i, fila in enumerate(_filas_serie(serie), start=1):
+        h.update((fila if i == 1 else ',' + fila).encode())
+        if i >= desde:
+            huellas[i] = h.copy().hexdigest()[:24]
+    return huellas
+
+
+def _ruta_modelo(huella: str, nombre: str) -> str:
+    return os.path.join(RUTA_MODELOS, f"{huella}_{nombre}.json")
+
+
+def _cargar_modelos_de_disco(huella: str, modo: str) -> Optional[Dict[str, XGBRegressor]]:
+    rutas = {nombre: _ruta_modelo(huella, nombre) for nombre in _nombres_modelos(modo)}
+    if not all(os.path.exists(ruta) for ruta in rutas.values()):
+        return None
+    try:
+        modelos = {}
+        for nombre, ruta in rutas.items():
+            modelo = XGBRegressor()
+            modelo.load_model(ruta)
+            modelos[nombre] = modelo
+        return modelos
+    except Exception as e:
+        logger.warning(f"No se pudieron cargar los modelos de demanda {huella}: {e}")
+        return None
+
+
+def _guardar_modelos_en_disco(huella: str, modelos: Dict[str, XGBRegressor]):
+    try:
+        os.makedirs(RUTA_MODELOS, exist_ok=True)
+        for nombre, modelo in modelos.items():
+            modelo.save_model(_ruta_modelo(huella, nombre))
+        # Solo se conservan los juegos de modelos (huellas) más recientes.
+        archivos = sorted(
+            (os.path.join(RUTA_MODELOS, a) for a in os.listdir(RUTA_MODELOS) if a.endswith('.json')),
+            key=os.path.getmtime, reverse=True,
+        )
+        huellas_vigentes = []
+        for ruta in archivos:
+            huella_archivo = os.path.basename(ruta).split('_', 1)[0]
+            if huella_archivo not in huellas_vigentes:
+                huellas_vigentes.append(huella_archivo)
+            if huellas_vigentes.index(huella_archivo) >= MAX_MODELOS_EN_DISCO:
+                os.remove(ruta)
+    except Exception as e:
+        logger.warning(f"No se pudieron guardar los modelos de demanda {huella}: {e}")
+
+
+def obtener_modelos(serie: pd.DataFrame, modo: Optional[str] = None) -> Dict[str, XGBRegressor]:
+    """Modelos P10/P50/P90 para `serie`: de memoria, si no de disco, y solo
+    si no existen se entrenan (y se guardan para los próximos requests,
+    reinicios y la tool del chat)."""
+    modo = modo or MODO_CUANTILES
+    huella = huella_entrenamiento(serie, modo)
+    modelos = _modelos_en_memoria.get(huella) or _cargar_modelos_de_disco(huella, modo)
+    if modelos is None:
+        logger.info(f"Entrenando modelos de demanda ({len(serie)} días, modo {modo}, huella {huella})")
+        modelos = entrenar_modelos(agregar_features(serie), modo)
+        _guardar_modelos_en_disco(huella, modelos)
+    _modelos_en_memoria.pop(huella, None)
+    _modelos_en_memoria[huella] = modelos
+    while len(_modelos_en_memoria) > MAX_MODELOS_EN_DISCO:
+        _modelos_en_memoria.pop(next(iter(_modelos_en_memoria)))
+    return modelos
+
+
+def _serie_dias_cerrados(serie: pd.DataFrame) -> pd.DataFrame:
+    """Serie sin el día en curso: su conteo sigue creciendo durante el día y
+    haría reentrenar con cada pedido nuevo. Si no alcanza el mínimo de días
+    sin él, se usa la serie completa."""
+    cerrada = serie[serie['fecha'] < date.today()]
+    return cerrada if len(cerrada) >= MIN_DIAS_ENTRENAMIENTO else serie
+
+
+VENTANAS_LAG = {'lag7': 7, 'lag14': 14, 'lag30': 30}
+
+
+def predecir_proximos_dias(
+    pedidos: List[Dict],
+    dias: int = 7,
+    temperaturas_futuras: Dict = None,
+    fecha_fin: Optional[date] = None,
+) -> List[Dict]:
     """Devuelve una lista de `dias` diccionarios {fecha, p10, p50, p90} con
     el pronóstico de pedidos por día. Lista vacía si no hay historial
-    suficiente para entrenar un modelo razonable."""
-    serie = construir_serie_diaria(pedidos)
+    suficiente para entrenar un modelo razonable.
+
+    El pronóstico es recursivo (la mediana de cada día alimenta los lags del
+    siguiente), pero sin recalcular features sobre toda la serie: se llevan
+    sumas móviles de las ventanas de 7/14/30 días y cada día nuevo cuesta
+    O(1) — mismos valores que `agregar_features` para la fila siguiente.
+    `fecha_fin`: ver construir_serie_diaria."""
+    serie = construir_serie_diaria(pedidos, fecha_fin=fecha_fin)
     if len(serie) < MIN_DIAS_ENTRENAMIENTO:
         logger.warning(f"Historial insuficiente para pronóstico: {len(serie)} días (mínimo {MIN_DIAS_ENTRENAMIENTO})")
         return []
 
-    serie_features = agregar_features(serie)
-    modelos = entrenar_modelos(serie_features)
+    modelos = obtener_modelos(_serie_dias_cerrados(serie))
 
     temperaturas_futuras = temperaturas_futuras or {}
-    serie_extendida = serie.copy()
+    historial = serie['pedidos'].astype(float).tolist()
+    ventanas = {lag: deque(historial[-n:], maxlen=n) for lag, n in VENTANAS_LAG.items()}
+    sumas = {lag: sum(ventana) for lag, ventana in ventanas.items()}
     ultima_fecha = pd.to_datetime(serie['fecha'].iloc[-1])
+    trend_day = len(serie)
+
     resultado = []
+    fila = np.empty((1, len(FEATURES)))
+    for i in range(dias):
+        fecha_pred = (ultima_fecha + timedelta(days=i + 1)).date()
+        valores = {
+            'dow': fecha_pred.weekday(),
+            'dom': fecha_pred.day,
+            'month': fecha_pred.month,
+            'is_weekend': int(fecha_pred.weekday() >= 5),
+            'temp': temperaturas_futuras.get(fecha_pred, 15.0),
+            'trend_day': trend_day + i,
+        }
+        for lag, ventana in ventanas.items():
+            valores[lag] = sumas[lag] / len(ventana) if ventana else 0.0
+        fila[0] = [valores[f] for f in FEATURES]
+
+        # Una sola fila numpy (sin armar un DataFrame por día); con el modelo
+        # multi-cuantil, una sola llamada entrega los tres cuantiles.
+        cuantiles = [max(0.0, round(float(v), 1)) for v in predecir_cuantiles(modelos, fila)[0]]
+        # Los cuantiles pueden cruzarse levemente; se fuerza el orden
+        # p10 <= p50 <= p90.
+        p10, p50, p90 = sorted(cuantiles)
+        resultado.append({'fecha': str(fecha_pred), 'p10': p10, 'p50': p50, 'p90': p90})
+
+        # Encadenar la predicción: la mediana proyectada hace de "real" para
+        # los lags del día siguiente.
+        for lag, ventana in ventanas.items():
+            if len(ventana) == ventana.maxlen:
+                sumas[lag] -= ventana[0]
+            ventana.append(p50)
+            sumas[lag] += p50
 
-    for i in range(1, dias + 1):
-        fecha_pred = (ultima_fecha + timedelta(days=i)).date()
+    return resultado
 
-        # Para calcular los lags del día a predecir se agrega momentáneamente
-        # una fila con el promedio reciente como relleno.
-        relleno = serie_extendida['pedidos'].tail(7).mean() if len(serie_extendida) else 0
-        serie_para_features = pd.concat([
-            serie_extendida,
-            pd.DataFrame({'fecha': [fecha_pred], 'pedidos': [relleno]})
-        ], ignore_index=True)
 
-        features_dia = agregar_features(serie_para_features, temperaturas_futuras).iloc[[-1]]
+def comparar_modos_cuantiles(pedidos: List[Dict]) -> Dict:
+    """Entrena ambos modos sobre la misma serie y compara tiempo de
+    entrenamiento, % de días con cuantiles cruzados y cobertura real de
+    cada cuantil (en la serie de entrenamiento). No usa ni guarda caché."""
+    serie_features = agregar_features(_serie_dias_cerrados(construir_serie_diaria(pedidos)))
+    if len(serie_features) < MIN_DIAS_ENTRENAMIENTO:
+        return {}
+    X = serie_features[FEATURES]
+    y = serie_features['pedidos'].to_numpy()
+
+    comparacion = {}
+    for modo in ('multi', 'tres'):
+        inicio = time.perf_counter()
+        modelos = entrenar_modelos(serie_features, modo)
+        segundos = time.perf_counter() - inicio
+        predicciones = predecir_cuantiles(modelos, X)
+        cruces = (predicciones[:, 0] > predicciones[:, 1]) | (predicciones[:, 1] > predicciones[:, 2])
+        comparacion[modo] = {
+            'segundos_entrenamiento': round(segundos, 3),
+            'cruces_pct': round(float(cruces.mean()) * 100, 2),
+            'cobertura': {
+                nombre: round(float((y <= predicciones[:, j]).mean()), 3)
+                for j, nombre in enumerate(QUANTILES)
+            },
+        }
+    return comparacion
 
-        pred = {'fecha': str(fecha_pred)}
-        for nombre, modelo in modelos.items():
-            valor = float(modelo.predict(features_dia[FEATURES])[0])
-            pred[nombre] = max(0.0, round(valor, 1))
-
-        # Los tres modelos son independientes y pueden cruzarse levemente;
-        # se fuerza el orden p10 <= p50 <= p90.
-        p10, p50, p90 = sorted([pred['p10'], pred['p50'], pred['p90']])
-        pred['p10'], pred['p50'], pred['p90'] = p10, p50, p90
-        resultado.append(pred)
-
-        # Encadenar la predicción: usar la mediana proyectada como "real"
-        # para calcular los lags del día siguiente.
-        serie_extendida = pd.concat([
-            serie_extendida,
-            pd.DataFrame({'fecha': [fecha_pred], 'pedidos': [pred['p50']]})
-        ], ignore_index=True)
 
-    return resultado
+MIN_DIAS_VALIDACION = 45
+MIN_FOLDS_PARALELO = 4
+MAX_FOLDS_GUARDADOS = 2000
+
+RUTA_FOLDS = os.path.join(os.path.dirname(__file__), '..', 'validacion_demanda_cache.json')
+
+_folds = None
+# Escriben el precálculo, los hilos de tools del chat y los endpoints:
+# cargar, agregar folds y guardar el archivo van bajo este lock.
+_lock_folds = threading.Lock()
+
+
+def _cargar_folds() -> Dict[str, float]:
+    """Llamar con _lock_folds tomado."""
+    global _folds
+    if _folds is not None:
+        return _folds
+    try:
+        with open(RUTA_FOLDS, 'r', encoding='utf-8') as f:
+            _folds = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        _folds = {}
+    return _folds
+
+
+def _guardar_folds():
+    """Llamar con _lock_folds tomado."""
+    # Los más antiguos primero (orden de inserción): se descartan al pasar el máximo.
+    for clave in list(_folds)[:max(0, len(_folds) - MAX_FOLDS_GUARDADOS)]:
+        del _folds[clave]
+    try:
+        with open(RUTA_FOLDS, 'w', encoding='utf-8') as f:
+            json.dump(_folds, f)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar validacion_demanda_cache.json: {e}")
+
+
+def _inicializar_trabajador():
+    global N_JOBS_ENTRENAMIENTO
+    N_JOBS_ENTRENAMIENTO = 1
+
+
+def pool_entrenamiento(n_tareas: int) -> ProcessPoolExecutor:
+    """Pool de procesos para entrenar en paralelo: un proceso por núcleo
+    (como máximo uno por tarea), cada uno con un solo hilo de XGBoost.
+    Se usa 'spawn' (igual que en Windows): hacer fork de un proceso que ya
+    inicializó OpenMP puede colgar a los hijos."""
+    return ProcessPoolExecutor(
+        max_workers=max(1, min(n_tareas, os.cpu_count() or 1)),
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_inicializar_trabajador,
+    )
 
 
-MIN_DIAS_VALIDACION = 45
+def _prediccion_fold(features_train: pd.DataFrame, features_objetivo: pd.DataFrame) -> float:
+    """Entrena el P50 con los días anteriores y predice el día objetivo.
+    Nivel de módulo para poder correr en un proceso aparte."""
+    modelo = _entrenar_modelo_cuantil(features_train[FEATURES], features_train['pedidos'], 0.5)
+    return max(0.0, float(modelo.predict(features_objetivo[FEATURES])[0]))
+
+
+def _calcular_folds(tareas: List[tuple]) -> List[float]:
+    """Predicciones de los folds pendientes. Con pocos se calculan en línea;
+    en arranque en frío se reparten en un pool de procesos (un hilo de
+    XGBoost por proceso para no sobre-suscribir los núcleos)."""
+    if len(tareas) < MIN_FOLDS_PARALELO:
+        return [_prediccion_fold(train, objetivo) for train, objetivo in tareas]
+    try:
+        with pool_entrenamiento(len(tareas)) as pool:
+            futuros = [pool.submit(_prediccion_fold, train, objetivo) for train, objetivo in tareas]
+            return [futuro.result() for futuro in futuros]
+    except Exception as e:
+        logger.warning(f"Validación en paralelo falló, se calcula en serie: {e}")
+        return [_prediccion_fold(train, objetivo) for train, objetivo in tareas]
 
 
 def validar_precision(pedidos: List[Dict], dias_test: int = 30) -> Dict:
     """Walk-forward validation: para cada uno de los últimos `dias_test`
     días, entrena un modelo P50 solo con datos anteriores a ese día y
     predice ese día puntual, comparando contra lo que realmente pasó.
-    Devuelve el error porcentual promedio real (MAPE), no inventado."""
+    Devuelve el error porcentual promedio real (MAPE), no inventado.
+
+    La predicción de cada fold depende solo de los días anteriores, así que
+    se guarda en disco por huella de ese prefijo: en régimen normal solo se
+    entrena el fold del día más nuevo. Las features se calculan una vez
+    sobre la serie completa — lags desplazados, índice de tendencia y
+    calendario de la fila i solo dependen de las filas anteriores, así que
+    las del prefijo son exactamente las primeras i filas."""
     serie = construir_serie_diaria(pedidos)
     if len(serie) < MIN_DIAS_VALIDACION:
         return {'mape_pct': None, 'dias_evaluados': 0}
 
-    errores = []
     inicio_test = max(MIN_DIAS_ENTRENAMIENTO, len(serie) - dias_test)
+    features = agregar_features(serie)
+    huellas = _huellas_prefijos(serie, inicio_test)
+    # Copia local de los folds que se usan: el entrenamiento corre fuera del
+    # lock y otra validación puede descartar entradas viejas mientras tanto.
+    with _lock_folds:
+        folds = _cargar_folds()
+        prediccion_por_fold = {i: folds[huellas[i]] for i in range(inicio_test, len(serie)) if huellas[i] in folds}
+
+    pendientes = [i for i in range(inicio_test, len(serie)) if i not in prediccion_por_fold]
+    if pendientes:
+        predicciones = _calcular_folds([(features.iloc[:i], features.iloc[[i]]) for i in pendientes])
+        prediccion_por_fold.update(zip(pendientes, predicciones))
+        with _lock_folds:
+            folds = _cargar_folds()
+            for i, prediccion in zip(pendientes, predicciones):
+                folds[huellas[i]] = prediccion
+            _guardar_folds()
 
+    errores = []
     for i in range(inicio_test, len(serie)):
-        entrenamiento = serie.iloc[:i]
-        if len(entrenamiento) < MIN_DIAS_ENTRENAMIENTO:
-            continue
-
         real = serie['pedidos'].iloc[i]
-        features_train = agregar_features(entrenamiento)
-        modelo = _entrenar_modelo_cuantil(features_train[FEATURES], features_train['pedidos'], 0.5)
-
-        fila_objetivo = pd.concat([entrenamiento, serie.iloc[[i]]], ignore_index=True)
-        features_pred = agregar_features(fila_objetivo).iloc[[-1]]
-        prediccion = max(0.0, float(modelo.predict(features_pred[FEATURES])[0]))
-
         base = max(real, 1)  # evita división por cero en días con 0 pedidos reales
-        errores.append(abs(prediccion - real) / base)
+        errores.append(abs(prediccion_por_fold[i] - real) / base)
 
     if not errores:
         return {'mape_pct': None, 'dias_evaluados': 0}
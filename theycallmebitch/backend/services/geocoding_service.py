@@ -14,6 +14,8 @@ import time
 import logging
 import requests
 
+from services.customer_search_service import direcciones_similares
+
 logger = logging.getLogger(__name__)
 
 NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
@@ -78,6 +80,15 @@ def geocodificar(direccion: str):
     if clave in cache:
         return cache[clave]
 
+    # Misma dirección escrita distinto (tildes, typo) que otro cliente ya
+    # tiene geocodificada: se reutilizan sus coordenadas sin golpear la API.
+    # No se guardan en disco bajo esta clave: el préstamo depende del índice
+    # de búsqueda del momento y la API debe poder dar la coordenada propia.
+    for similar in direcciones_similares(direccion):
+        coords_similar = cache.get(similar.strip().lower())
+        if coords_similar:
+            return coords_similar
+
     espera = INTERVALO_MIN_SEGUNDOS - (time.time() - _ultima_solicitud)
     if espera > 0:
         time.sleep(espera)
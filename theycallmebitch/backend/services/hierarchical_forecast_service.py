@@ -0,0 +1,225 @@
+"""
+Servicio de pronóstico jerárquico de demanda — por canal y por zona.
+
+Además del total diario, pronostica por separado el retiro en local vs el
+reparto a domicilio (retirolocal) y cada zona de reparto
+(zone_engine._detectar_zona), para planificar el mostrador y las rutas por
+separado. Cada sub-serie usa el mismo motor que el total
+(demand_forecast_service, con sus modelos persistidos) y se entrenan en
+paralelo en un pool de procesos.
+
+Los hijos se reconcilian contra el total: la mediana de cada canal y de
+cada zona se escala para que sumen exactamente la mediana total (el P10/P90
+de cada hijo se escala con el mismo factor — los cuantiles no son aditivos,
+así que solo la mediana queda coherente). Un hijo sin pronóstico recibe su
+participación histórica en el volumen de los últimos DIAS_PARTICIPACION
+días, no una parte igual: una zona casi vacía no puede llevarse lo mismo
+que el canal principal.
+
+El cálculo nunca corre en el camino de un request: se dispara en segundo
+plano y el resultado queda guardado en disco
+(pronostico_jerarquico_cache.json) hasta que cambien los datos.
+"""
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from services import demand_forecast_service
+from services.zone_engine import _detectar_zona
+
+logger = logging.getLogger(__name__)
+
+DIAS_HORIZONTE = 14
+# Zonas con menos pedidos que esto en el historial se agrupan en "otras":
+# una serie casi vacía no da un pronóstico útil.
+MIN_PEDIDOS_ZONA = 200
+# Ventana para la participación histórica de cada hijo en el total.
+DIAS_PARTICIPACION = 28
+
+RUTA_CACHE = os.path.join(os.path.dirname(__file__), '..', 'pronostico_jerarquico_cache.json')
+
+_cache = None
+_lock_calculo = threading.Lock()
+
+
+def _cargar_cache() -> Dict:
+    global _cache
+    if _cache is not None:
+        return _cache
+    try:
+        with open(RUTA_CACHE, 'r', encoding='utf-8') as f:
+            _cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        _cache = {}
+    return _cache
+
+
+def _guardar_cache(resultado: Dict):
+    global _cache
+    _cache = resultado
+    try:
+        with open(RUTA_CACHE, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar pronostico_jerarquico_cache.json: {e}")
+
+
+def agrupar_series(pedidos: List[Dict]) -> Dict[str, Dict[str, List[str]]]:
+    """Fechas de pedido agrupadas por nivel: {'total': {'total': [...]},
+    'canales': {'local': [...], 'domicilio': [...]}, 'zonas': {zona: [...]}}."""
+    df = pd.DataFrame(pedidos)
+    if df.empty or 'fecha' not in df.columns:
+        return {'total': {}, 'canales': {}, 'zonas': {}}
+    if 'nombrelocal' in df.columns:
+        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
+
+    retiro = df['retirolocal'] if 'retirolocal' in df.columns else pd.Series('', index=df.index)
+    canal = retiro.astype(str).str.strip().str.lower().map(lambda v: 'local' if v == 'si' else 'domicilio')
+
+    direcciones = df['dire'] if 'dire' in df.columns else pd.Series('', index=df.index)
+    # Una detección por dirección distinta, no por pedido.
+    zonas_por_direccion = {d: _detectar_zona(d) for d in direcciones.unique()}
+    zona = direcciones.map(zonas_por_direccion)
+    conteo_zonas = zona.value_counts()
+    zona = zona.where(zona.map(conteo_zonas) >= MIN_PEDIDOS_ZONA, 'otras')
+
+    fechas = df['fecha'].astype(str)
+    return {
+        'total': {'total': fechas.tolist()},
+        'canales': {nombre: grupo.tolist() for nombre, grupo in fechas.groupby(canal)},
+        'zonas': {nombre: grupo.tolist() for nombre, grupo in fechas.groupby(zona)},
+    }
+
+
+def _pronosticar_serie(fechas: List[str], dias: int, fecha_fin: date) -> List[Dict]:
+    """Nivel de módulo para poder correr en un proceso del pool."""
+    return demand_forecast_service.predecir_proximos_dias(
+        [{'fecha': f} for f in fechas], dias=dias, fecha_fin=fecha_fin
+    )
+
+
+def _pronosticar_todas(tareas: Dict[tuple, List[str]], dias: int, fecha_fin: date) -> Dict[tuple, List[Dict]]:
+    try:
+        with demand_forecast_service.pool_entrenamiento(len(tareas)) as pool:
+            futuros = {clave: pool.submit(_pronosticar_serie, fechas, dias, fecha_fin) for clave, fechas in tareas.items()}
+            return {clave: futuro.result() for clave, futuro in futuros.items()}
+    except Exception as e:
+        logger.warning(f"Pronóstico jerárquico en paralelo falló, se calcula en serie: {e}")
+        return {clave: _pronosticar_serie(fechas, dias, fecha_fin) for clave, fechas in tareas.items()}
+
+
+def participaciones_historicas(fechas_por_hijo: Dict[str, List[str]], fecha_fin: date, dias: int = DIAS_PARTICIPACION) -> Dict[str, float]:
+    """Fracción de los pedidos de los últimos `dias` (hasta `fecha_fin`)
+    que corresponde a cada hijo; con la ventana vacía, sobre todo el
+    historial. Suman 1 (o son todas 0 si no hay pedidos)."""
+    desde = pd.Timestamp(fecha_fin) - pd.Timedelta(days=dias)
+    conteos, totales = {}, {}
+    for nombre, fechas in fechas_por_hijo.items():
+        fechas_dt = pd.to_datetime(pd.Series(fechas, dtype=str), format='%d-%m-%Y', errors='coerce')
+        conteos[nombre] = int((fechas_dt > desde).sum())
+        totales[nombre] = int(fechas_dt.notna().sum())
+    base = conteos if sum(conteos.values()) else totales
+    suma = sum(base.values())
+    return {nombre: (n / suma if suma else 0.0) for nombre, n in base.items()}
+
+
+def reconciliar(
+    total: List[Dict], hijos: Dict[str, List[Dict]], participaciones: Optional[Dict[str, float]] = None,
+) -> Dict[str, List[Dict]]:
+    """Escala cada día de los hijos para que sus medianas sumen la mediana
+    total. Un hijo sin pronóstico (historial insuficiente o error) recibe
+    su participación histórica del total y el resto se reparte entre los
+    que sí tienen; sin `participaciones` cuenta como 0. Si ningún hijo
+    tiene señal ese día, todo el total se reparte por participación (en
+    partes iguales solo si tampoco hay historial)."""
+    participaciones = participaciones or {}
+    reconciliados = {nombre: [] for nombre in hijos}
+    for i, dia_total in enumerate(total):
+        dias_hijos = {nombre: (serie[i] if i < len(serie) else None) for nombre, serie in hijos.items()}
+        suma_p50 = sum(d['p50'] for d in dias_hijos.values() if d)
+        if suma_p50 > 0:
+            sin_pronostico = [n for n, d in dias_hijos.items() if not d]
+            reservado = min(1.0, sum(participaciones.get(n, 0.0) for n in sin_pronostico))
+            factor = dia_total['p50'] * (1 - reservado) / suma_p50
+            cuotas = {n: participaciones.get(n, 0.0) for n in sin_pronostico}
+        else:
+            factor = None
+            suma_participaciones = sum(participaciones.get(n, 0.0) for n in dias_hijos)
+            cuotas = {
+                n: (participaciones.get(n, 0.0) / suma_participaciones if suma_participaciones else 1 / len(dias_hijos))
+                for n in dias_hijos
+            }
+        for nombre, dia in dias_hijos.items():
+            if factor is not None and dia:
+                valores = {q: round(dia[q] * factor, 1) for q in ('p10', 'p50', 'p90')}
+            else:
+                valores = {q: round(dia_total[q] * cuotas[nombre], 1) for q in ('p10', 'p50', 'p90')}
+            reconciliados[nombre].append({'fecha': dia_total['fecha'], **valores})
+    return reconciliados
+
+
+def calcular_pronostico_jerarquico(pedidos: List[Dict], dias: int = DIAS_HORIZONTE) -> Dict:
+    """Pronostica total, canales y zonas (en paralelo) y reconcilia los
+    hijos contra el total."""
+    series = agrupar_series(pedidos)
+    if not series['total']:
+        return {'total': [], 'canales': {}, 'zonas': {}}
+
+    tareas = {(nivel, nombre): fechas for nivel, grupo in series.items() for nombre, fechas in grupo.items()}
+    fecha_fin = date.today()
+    pronosticos = _pronosticar_todas(tareas, dias, fecha_fin=fecha_fin)
+
+    total = pronosticos[('total', 'total')]
+    por_nivel = {
+        nivel: {nombre: pronosticos[(nivel, nombre)] for nombre in series[nivel]}
+        for nivel in ('canales', 'zonas')
+    }
+    return {
+        'total': total,
+        **{
+            nivel: reconciliar(total, por_nivel[nivel], participaciones_historicas(series[nivel], fecha_fin))
+            for nivel in ('canales', 'zonas')
+        },
+    }
+
+
+def obtener_pronostico_jerarquico() -> Optional[Dict]:
+    """Último pronóstico guardado (memoria o disco), o None si nunca se calculó."""
+    return _cargar_cache() or None
+
+
+def esta_vigente(version_datos: Optional[str]) -> bool:
+    cache = _cargar_cache()
+    return bool(cache) and cache.get('version_datos') == version_datos and \
+        cache.get('calculado_en', '')[:10] == date.today().isoformat()
+
+
+def actualizar_pronostico_jerarquico(pedidos: List[Dict], version_datos: Optional[str]) -> Optional[Dict]:
+    """Recalcula y guarda el pronóstico. Pensado para BackgroundTasks o el
+    programador nocturno; si ya hay un cálculo en curso no lanza otro."""
+    if not _lock_calculo.acquire(blocking=False):
+        return None
+    try:
+        if esta_vigente(version_datos):
+            return _cargar_cache()
+        inicio = datetime.now()
+        resultado = calcular_pronostico_jerarquico(pedidos)
+        resultado['version_datos'] = version_datos
+        resultado['calculado_en'] = datetime.now().isoformat(timespec='seconds')
+        _guardar_cache(resultado)
+        logger.info(f"Pronóstico jerárquico actualizado en {(datetime.now() - inicio).total_seconds():.1f}s")
+        return resultado
+    except Exception as e:
+        logger.error(f"Error calculando pronóstico jerárquico: {e}", exc_info=True)
+        return None
+    finally:
+        _lock_calculo.release()
+
+
+def calculo_en_curso() -> bool:
+    return _lock_calculo.locked()
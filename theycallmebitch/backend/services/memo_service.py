@@ -0,0 +1,96 @@
+"""
+Servicio de memoización por versión de datos.
+
+Las tools del chat (ai_engine._execute_tool) y el contexto del loop
+autónomo recalculan RFM, riesgo, zonas, pronóstico... sobre los mismos
+pedidos una y otra vez: en un mismo turno (get_customer_segments y
+analyze_campaign calculan el mismo RFM) y entre turnos. Aquí se guarda
+cada resultado por (nombre, argumentos normalizados, versión de datos,
+día): mientras data_adapter.version_datos no cambie, repetir un cálculo
+no cuesta nada.
+
+Solo se memoiza si los pedidos recibidos SON los de data_adapter (misma
+lista): con cualquier otra lista no hay versión confiable y se calcula
+directo. Tamaño acotado (LRU); al aparecer una versión nueva se descarta
+todo lo de la anterior. Se devuelven copias: quien llama puede modificar
+el resultado sin ensuciar el memo.
+"""
+import copy
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRADAS = 128
+
+_memo: "OrderedDict[tuple, Any]" = OrderedDict()
+_version_actual = {"valor": None}
+_estadisticas = {"aciertos": 0, "fallos": 0, "desalojos": 0}
+_lock = threading.Lock()
+
+
+def version_de(pedidos: Optional[List[Dict]]) -> Optional[str]:
+    """version_datos si `pedidos` es la lista cacheada de data_adapter; si
+    no, None (no se puede memoizar)."""
+    from data_adapter import data_adapter
+    if pedidos is not None and pedidos is data_adapter.pedidos_antiguos_cache:
+        return data_adapter.version_datos
+    return None
+
+
+def normalizar_args(args: Optional[Dict]) -> str:
+    """Mismos argumentos en otro orden, con espacios de más o con valores
+    vacíos explícitos producen la misma clave."""
+    limpios = {
+        k: v.strip() if isinstance(v, str) else v
+        for k, v in (args or {}).items()
+        if v is not None and v != ""
+    }
+    return json.dumps(limpios, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def memorizar(nombre: str, args: Optional[Dict], pedidos: Optional[List[Dict]], calcular: Callable[[], Any]) -> Any:
+    """Resultado de `calcular()` memoizado por (nombre, args, versión, día).
+    Resultados con 'error' no se guardan."""
+    version = version_de(pedidos)
+    if version is None:
+        return calcular()
+    clave = (nombre, normalizar_args(args), version, date.today())
+
+    with _lock:
+        if version != _version_actual["valor"]:
+            _memo.clear()
+            _version_actual["valor"] = version
+        if clave in _memo:
+            _memo.move_to_end(clave)
+            _estadisticas["aciertos"] += 1
+            return copy.deepcopy(_memo[clave])
+        _estadisticas["fallos"] += 1
+
+    resultado = calcular()
+    if isinstance(resultado, dict) and "error" in resultado:
+        return resultado
+
+    with _lock:
+        if version == _version_actual["valor"]:
+            _memo[clave] = resultado
+            _memo.move_to_end(clave)
+            while len(_memo) > MAX_ENTRADAS:
+                _memo.popitem(last=False)
+                _estadisticas["desalojos"] += 1
+    return copy.deepcopy(resultado)
+
+
+def estadisticas_memo() -> Dict:
+    with _lock:
+        return {**_estadisticas, "entradas": len(_memo), "version_datos": _version_actual["valor"]}
+
+
+def limpiar_memo():
+    with _lock:
+        _memo.clear()
+        _version_actual["valor"] = None
@@ -13,6 +13,19 @@ logger = logging.getLogger(__name__)
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "agent_memory.db")
 
+# Contador de escrituras que cambian lo que lee el contexto del agente
+# (insights, snapshots, briefing, recomendaciones). Lo usa
+# context_cache_service para saber cuándo reconstruir el contexto.
+_version = {"valor": 0}
+
+
+def version_memoria() -> int:
+    return _version["valor"]
+
+
+def _marcar_cambio():
+    _version["valor"] += 1
+
 
 def _get_conn():
     conn = sqlite3.connect(DB_PATH)
@@ -81,6 +94,16 @@ def inicializar_db():
             )
         """)
 
+        # Segmento RFM de cada cliente al cierre de cada mes (para transiciones)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS rfm_snapshots (
+                mes TEXT NOT NULL,
+                usuario TEXT NOT NULL,
+                segmento TEXT NOT NULL,
+                PRIMARY KEY (mes, usuario)
+            )
+        """)
+
         conn.commit()
         conn.close()
         logger.info("Base de datos de memoria inicializada")
@@ -107,6 +130,7 @@ def guardar_insight(insight: Dict, contexto: Dict = None):
         ))
         conn.commit()
         conn.close()
+        _marcar_cambio()
     except Exception as e:
         logger.error(f"Error guardando insight: {e}")
 
@@ -133,6 +157,7 @@ def guardar_snapshot_kpis(contexto: Dict):
         ))
         conn.commit()
         conn.close()
+        _marcar_cambio()
     except Exception as e:
         logger.error(f"Error guardando snapshot KPIs: {e}")
 
@@ -190,6 +215,7 @@ def guardar_briefing(contenido: str, metricas: Dict):
         """, (fecha_hoy, contenido, json.dumps(metricas, ensure_ascii=False), datetime.now().isoformat()))
         conn.commit()
         conn.close()
+        _marcar_cambio()
     except Exception as e:
         logger.error(f"Error guardando briefing: {e}")
 
@@ -241,6 +267,7 @@ def guardar_recomendacion(rec: dict) -> int:
         conn.commit()
         rec_id = cursor.lastrowid
         conn.close()
+        _marcar_cambio()
         return rec_id
     except Exception as e:
         logger.error(f"Error guardando recomendación: {e}")
@@ -263,6 +290,7 @@ def actualizar_recomendacion(rec_id: int, ejecutada: bool, resultado: str = ""):
         ))
         conn.commit()
         conn.close()
+        _marcar_cambio()
     except Exception as e:
         logger.error(f"Error actualizando recomendación {rec_id}: {e}")
 
@@ -282,3 +310,40 @@ def get_recent_recommendations(limit: int = 3) -> List[Dict]:
     except Exception as e:
         logger.error(f"Error obteniendo recomendaciones: {e}")
         return []
+
+
+def guardar_snapshots_rfm(snapshots: Dict[str, Dict[str, str]]):
+    """Persiste segmentos RFM por mes cerrado: {'YYYY-MM': {usuario: segmento}}."""
+    if not snapshots:
+        return
+    try:
+        conn = _get_conn()
+        conn.executemany("""
+            INSERT OR REPLACE INTO rfm_snapshots (mes, usuario, segmento)
+            VALUES (?, ?, ?)
+        """, [
+            (mes, usuario, segmento)
+            for mes, segmentos in snapshots.items()
+            for usuario, segmento in segmentos.items()
+        ])
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"Error guardando snapshots RFM: {e}")
+
+
+def obtener_snapshots_rfm() -> Dict[str, Dict[str, str]]:
+    """Retorna todos los snapshots RFM mensuales guardados."""
+    try:
+        conn = _get_conn()
+        rows = conn.execute("""
+            SELECT mes, usuario, segmento FROM rfm_snapshots ORDER BY mes
+        """).fetchall()
+        conn.close()
+        snapshots: Dict[str, Dict[str, str]] = {}
+        for r in rows:
+            snapshots.setdefault(r["mes"], {})[r["usuario"]] = r["segmento"]
+        return snapshots
+    except Exception as e:
+        logger.error(f"Error leyendo snapshots RFM: {e}")
+        return {}
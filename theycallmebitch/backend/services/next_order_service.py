@@ -0,0 +1,272 @@
+"""
+Servicio de próximo pedido — tabla de predicción por cliente.
+
+customer_risk_service dice quién ya está atrasado; para planificar el
+reparto hace falta la fecha esperada del PRÓXIMO pedido de cada cliente.
+Esta tabla la calcula para todos los clientes en una pasada vectorizada:
+
+1. Cadencia personal: mediana de días entre pedidos del cliente, encogida
+   (en escala logarítmica) hacia la mediana global según cuántos
+   intervalos tiene — un cliente con 1 intervalo pesa poco, uno con 20
+   casi nada de la global. Clientes con un solo pedido usan la global.
+2. Estacionalidad: factor por mes del año (mediana de intervalo/cadencia
+   de los intervalos que empezaron ese mes, relativa a la de todo el año).
+3. Curva de supervivencia (Kaplan-Meier) de intervalo/cadencia, con todos
+   los intervalos completos como eventos y la espera actual de cada
+   cliente como dato censurado. Cada cliente se condiciona a lo que ya
+   lleva esperando: P10/P50/P90 de la fecha del próximo pedido y
+   probabilidad de que pida en los próximos 7 días. Si la curva no baja lo
+   suficiente (el cliente ya esperó más que casi todos), el cuantil queda
+   en None: más probable que se haya ido que que vuelva.
+4. Día preferido: si al menos la mitad de sus pedidos cae en el mismo día
+   de la semana, la fecha P50 se mueve a ese día más cercano.
+
+Se refresca en forma incremental: solo se recalculan las estadísticas de
+los clientes cuyos pedidos cambiaron (cantidad, primera o última fecha);
+la curva global y el condicionamiento a "hoy" son pasos vectorizados
+baratos que se rehacen en cada refresco. Endpoints y tools leen la tabla
+(obtener_tabla_proximos_pedidos) en vez de recalcular.
+"""
+import logging
+import threading
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+CADENCIA_RESPALDO_DIAS = 30.0   # sin ningún intervalo en todo el historial
+PESO_CADENCIA_GLOBAL = 2        # intervalos "virtuales" de la mediana global
+MIN_INTERVALOS_MES = 30         # para estimar el factor estacional de un mes
+FACTOR_MES_MIN, FACTOR_MES_MAX = 0.7, 1.4
+CUOTA_DIA_PREFERIDO = 0.5
+MIN_PEDIDOS_DIA_PREFERIDO = 4
+HORIZONTE_PROBABILIDAD_DIAS = 7
+CUANTILES = {'p10': 0.1, 'p50': 0.5, 'p90': 0.9}
+DIAS_SEMANA = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+
+_lock = threading.Lock()
+_estado = {
+    'clave': None,          # (version_datos, hoy) de la última tabla
+    'tabla': None,
+    'firmas': None,         # DataFrame por usuario: pedidos, primera, ultima
+    'clientes': None,       # DataFrame por usuario: estadísticas propias
+    'intervalos': None,     # DataFrame: usuario, dias, mes_inicio
+}
+
+
+def _parsear_fechas(fechas: pd.Series) -> pd.Series:
+    """DD-MM-YYYY primero, YYYY-MM-DD como respaldo, NaT si ninguno calza."""
+    texto = fechas.astype(str).str[:10]
+    dmy = pd.to_datetime(texto, format="%d-%m-%Y", errors="coerce")
+    ymd = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    return dmy.fillna(ymd)
+
+
+def _dias_de_compra(pedidos: List[Dict]) -> pd.DataFrame:
+    """(usuario, fecha) únicos, ordenados: dos pedidos el mismo día son una
+    sola compra para la cadencia."""
+    df = pd.DataFrame(pedidos)
+    if df.empty or 'usuario' not in df.columns or 'fecha' not in df.columns:
+        return pd.DataFrame(columns=['usuario', 'fecha'])
+    if 'nombrelocal' in df.columns:
+        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
+    df = pd.DataFrame({'usuario': df['usuario'].astype(str).str.strip(), 'fecha': _parsear_fechas(df['fecha'])})
+    df = df[(df['usuario'] != '') & df['fecha'].notna()]
+    return df.drop_duplicates().sort_values(['usuario', 'fecha'], kind='stable').reset_index(drop=True)
+
+
+def _estadisticas_clientes(dias: pd.DataFrame):
+    """Estadísticas propias de cada cliente en `dias` (vectorizado):
+    (DataFrame por usuario, DataFrame de intervalos)."""
+    por_usuario = dias.groupby('usuario', sort=False)['fecha']
+    gap = por_usuario.diff().dt.days
+    previa = por_usuario.shift(1)
+    intervalos = pd.DataFrame({
+        'usuario': dias['usuario'], 'dias': gap, 'mes_inicio': previa.dt.month,
+    }).dropna(subset=['dias'])
+    intervalos = intervalos[intervalos['dias'] > 0]
+
+    dow = dias['fecha'].dt.dayofweek
+    conteo_dow = pd.crosstab(dias['usuario'], dow)
+    clientes = pd.DataFrame({
+        'pedidos': por_usuario.size(),
+        'ultima': por_usuario.max(),
+        'mediana_intervalo': intervalos.groupby('usuario')['dias'].median(),
+        'n_intervalos': intervalos.groupby('usuario').size(),
+        'dia_preferido': conteo_dow.idxmax(axis=1),
+        'cuota_dia_preferido': conteo_dow.max(axis=1) / conteo_dow.sum(axis=1),
+    })
+    clientes['n_intervalos'] = clientes['n_intervalos'].fillna(0).astype(int)
+    return clientes, intervalos
+
+
+def _firmas(dias: pd.DataFrame) -> pd.DataFrame:
+    return dias.groupby('usuario')['fecha'].agg(['size', 'min', 'max'])
+
+
+def _refrescar_estadisticas(dias: pd.DataFrame) -> int:
+    """Actualiza _estado['clientes'] / ['intervalos'] recalculando solo los
+    clientes cuya firma cambió. Devuelve cuántos se recalcularon."""
+    firmas = _firmas(dias)
+    previas = _estado['firmas']
+    if previas is None or _estado['clientes'] is None:
+        cambiados = firmas.index
+        clientes, intervalos = _estadisticas_clientes(dias)
+    else:
+        comunes = firmas.index.intersection(previas.index)
+        iguales = (firmas.loc[comunes] == previas.loc[comunes]).all(axis=1)
+        sin_cambio = comunes[iguales.values]
+        cambiados = firmas.index.difference(sin_cambio)
+        viejos_intervalos = _estado['intervalos']
+        clientes = _estado['clientes'].loc[sin_cambio]
+        intervalos = viejos_intervalos[viejos_intervalos['usuario'].isin(sin_cambio)]
+        if len(cambiados):
+            nuevos_clientes, nuevos_intervalos = _estadisticas_clientes(dias[dias['usuario'].isin(cambiados)])
+            clientes = pd.concat([clientes, nuevos_clientes])
+            intervalos = pd.concat([intervalos, nuevos_intervalos])
+    _estado.update({'firmas': firmas, 'clientes': clientes, 'intervalos': intervalos})
+    return len(cambiados)
+
+
+def _curva_supervivencia(eventos: np.ndarray, censurados: np.ndarray):
+    """Kaplan-Meier: (valores ordenados, supervivencia justo después de cada uno)."""
+    valores = np.concatenate([eventos, censurados])
+    es_evento = np.concatenate([np.ones(len(eventos)), np.zeros(len(censurados))])
+    # En empates, los eventos antes que los censurados (convención KM).
+    orden = np.lexsort((1 - es_evento, valores))
+    valores, es_evento = valores[orden], es_evento[orden]
+    en_riesgo = len(valores) - np.arange(len(valores))
+    supervivencia = np.cumprod(np.where(es_evento == 1, 1 - 1 / en_riesgo, 1.0))
+    return valores, supervivencia
+
+
+def _supervivencia_en(valores: np.ndarray, supervivencia: np.ndarray, x: np.ndarray) -> np.ndarray:
+    idx = np.searchsorted(valores, x, side='right') - 1
+    return np.where(idx >= 0, supervivencia[np.clip(idx, 0, None)], 1.0)
+
+
+def _cuantil_condicional(valores, supervivencia, s_actual: np.ndarray, q: float) -> np.ndarray:
+    """Menor valor donde la supervivencia cae a s_actual * (1 - q); NaN si
+    la curva nunca baja tanto."""
+    objetivo = s_actual * (1 - q)
+    idx = np.searchsorted(-supervivencia, -objetivo, side='left')
+    return np.where(idx < len(valores), valores[np.clip(idx, 0, len(valores) - 1)], np.nan)
+
+
+def _factores_mes(ratios: pd.Series, meses: pd.Series) -> Dict[int, float]:
+    global_ = ratios.median()
+    por_mes = ratios.groupby(meses).agg(['median', 'size'])
+    por_mes = por_mes[por_mes['size'] >= MIN_INTERVALOS_MES]
+    return {
+        int(mes): float(np.clip(fila['median'] / global_, FACTOR_MES_MIN, FACTOR_MES_MAX))
+        for mes, fila in por_mes.iterrows()
+    } if global_ > 0 else {}
+
+
+def _fecha_o_none(ultima: pd.Series, dias: np.ndarray, hoy: pd.Timestamp) -> List[Optional[str]]:
+    fechas = ultima + pd.to_timedelta(np.ceil(dias), unit='D')
+    fechas = fechas.where(fechas >= hoy, hoy)
+    return [None if pd.isna(d) or pd.isna(f) else f.date().isoformat() for d, f in zip(dias, fechas)]
+
+
+def construir_tabla(clientes: pd.DataFrame, intervalos: pd.DataFrame, hoy: date) -> Dict:
+    """Predicción de próximo pedido para cada cliente a partir de sus
+    estadísticas (todo vectorizado sobre clientes)."""
+    if clientes.empty:
+        return {'clientes': [], 'resumen': {'clientes': 0, 'pedidos_esperados_7_dias': 0.0}, 'factores_mes': {}}
+    hoy_ts = pd.Timestamp(hoy)
+
+    mediana_global = float(intervalos['dias'].median()) if len(intervalos) else CADENCIA_RESPALDO_DIAS
+    n = clientes['n_intervalos'].to_numpy(dtype=float)
+    log_personal = np.log(clientes['mediana_intervalo'].fillna(mediana_global).to_numpy(dtype=float))
+    cadencia = np.exp((n * log_personal + PESO_CADENCIA_GLOBAL * np.log(mediana_global)) / (n + PESO_CADENCIA_GLOBAL))
+    cadencia = pd.Series(cadencia, index=clientes.index)
+
+    ratios = intervalos['dias'] / intervalos['usuario'].map(cadencia)
+    factores = _factores_mes(ratios, intervalos['mes_inicio'])
+    cadencia_hoy = cadencia * factores.get(hoy.month, 1.0)
+
+    espera = (hoy_ts - clientes['ultima']).dt.days.to_numpy(dtype=float)
+    x = espera / cadencia_hoy.to_numpy()
+    valores, supervivencia = _curva_supervivencia(ratios.to_numpy(dtype=float), x)
+    s_actual = _supervivencia_en(valores, supervivencia, x)
+    s_horizonte = _supervivencia_en(valores, supervivencia, x + HORIZONTE_PROBABILIDAD_DIAS / cadencia_hoy.to_numpy())
+    probabilidad = np.where(s_actual > 0, 1 - s_horizonte / np.where(s_actual > 0, s_actual, 1), 0.0)
+
+    dias_cuantil = {
+        nombre: np.ceil(np.round(_cuantil_condicional(valores, supervivencia, s_actual, q) * cadencia_hoy.to_numpy(), 6))
+        for nombre, q in CUANTILES.items()
+    }
+    # El ajuste al día preferido no puede sacar la mediana del rango P10-P90.
+    ajustado = _ajustar_a_dia_preferido(clientes, dias_cuantil['p50'], hoy_ts)
+    dias_cuantil['p50'] = np.fmin(np.fmax(ajustado, dias_cuantil['p10']), dias_cuantil['p90'])
+    predicciones = {nombre: _fecha_o_none(clientes['ultima'], dias, hoy_ts) for nombre, dias in dias_cuantil.items()}
+
+    preferido = (clientes['cuota_dia_preferido'] >= CUOTA_DIA_PREFERIDO) & (clientes['pedidos'] >= MIN_PEDIDOS_DIA_PREFERIDO)
+    filas = []
+    for i, usuario in enumerate(clientes.index):
+        filas.append({
+            'usuario': usuario,
+            'ultima_compra': clientes['ultima'].iloc[i].date().isoformat(),
+            'pedidos': int(clientes['pedidos'].iloc[i]),
+            'cadencia_dias': round(float(cadencia_hoy.iloc[i]), 1),
+            'dias_esperando': int(espera[i]),
+            'proximo_pedido': {nombre: predicciones[nombre][i] for nombre in CUANTILES},
+            'probabilidad_7_dias': round(float(probabilidad[i]), 3),
+            'dia_preferido': DIAS_SEMANA[int(clientes['dia_preferido'].iloc[i])] if preferido.iloc[i] else None,
+        })
+    return {
+        'clientes': filas,
+        'resumen': {
+            'clientes': len(filas),
+            'pedidos_esperados_7_dias': round(float(probabilidad.sum()), 1),
+        },
+        'factores_mes': {str(m): round(f, 2) for m, f in sorted(factores.items())},
+    }
+
+
+def _ajustar_a_dia_preferido(clientes: pd.DataFrame, dias: np.ndarray, hoy: pd.Timestamp) -> np.ndarray:
+    """Mueve la fecha P50 al día preferido más cercano (±3 días), sin
+    dejarla antes de hoy."""
+    aplica = ((clientes['cuota_dia_preferido'] >= CUOTA_DIA_PREFERIDO) &
+              (clientes['pedidos'] >= MIN_PEDIDOS_DIA_PREFERIDO)).to_numpy() & ~np.isnan(dias)
+    fechas = clientes['ultima'] + pd.to_timedelta(np.ceil(np.nan_to_num(dias)), unit='D')
+    desplazamiento = (clientes['dia_preferido'].to_numpy() - fechas.dt.dayofweek.to_numpy() + 3) % 7 - 3
+    ajustados = np.ceil(np.nan_to_num(dias)) + desplazamiento
+    minimo = (hoy - clientes['ultima']).dt.days.to_numpy()
+    ajustados = np.where(ajustados < minimo, ajustados + 7, ajustados)
+    return np.where(aplica, ajustados, dias)
+
+
+def obtener_tabla_proximos_pedidos(pedidos: List[Dict], version_datos: Optional[str], hoy: Optional[date] = None) -> Dict:
+    """La tabla de próximo pedido, cacheada por versión de datos y día.
+    Con datos nuevos, solo se recalculan los clientes que cambiaron."""
+    hoy = hoy or date.today()
+    clave = (version_datos, hoy)
+    with _lock:
+        if version_datos is not None and _estado['clave'] == clave:
+            return _estado['tabla']
+        recalculados = _refrescar_estadisticas(_dias_de_compra(pedidos))
+        tabla = construir_tabla(_estado['clientes'], _estado['intervalos'], hoy)
+        tabla['clientes_recalculados'] = recalculados
+        tabla['fecha_referencia'] = hoy.isoformat()
+        if version_datos is not None:
+            _estado.update({'clave': clave, 'tabla': tabla})
+        return tabla
+
+
+def proximos_pedidos(tabla: Dict, dias: int = 7, limite: Optional[int] = 50) -> List[Dict]:
+    """Clientes cuyo P50 cae dentro de los próximos `dias`, por fecha y
+    luego por probabilidad de pedir en la semana."""
+    hasta = (date.fromisoformat(tabla.get('fecha_referencia', date.today().isoformat())) + timedelta(days=dias)).isoformat()
+    seleccion = [c for c in tabla.get('clientes', []) if c['proximo_pedido']['p50'] and c['proximo_pedido']['p50'] <= hasta]
+    seleccion.sort(key=lambda c: (c['proximo_pedido']['p50'], -c['probabilidad_7_dias']))
+    return seleccion[:limite] if limite else seleccion
+
+
+def prediccion_cliente(tabla: Dict, usuario: str) -> Optional[Dict]:
+    usuario = str(usuario or '').strip()
+    return next((c for c in tabla.get('clientes', []) if c['usuario'] == usuario), None)
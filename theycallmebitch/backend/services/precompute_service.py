@@ -0,0 +1,119 @@
+"""
+Servicio de precálculo — programador de los endpoints pesados.
+
+El Predictor (pronóstico + validación walk-forward, riesgo de clientes)
+no debería hacer esperar al primer visitante que llega con el caché frío.
+Un loop en segundo plano recalcula estos resultados cuando cierra el día
+(primera pasada después de medianoche) y cuando llegan pedidos nuevos
+(cambia data_adapter.version_datos), y los deja en disco
+(precalculos_cache.json) con su hora de cálculo. Los endpoints responden
+desde ahí y solo calculan en línea si nunca se ha precalculado nada.
+
+"Otro día" se mide en hora de Chile: el servidor corre en UTC y, con su
+reloj, la pasada de medianoche caería a las 20:00/21:00 locales.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from services.sla_compliance_service import CHILE_TZ
+
+logger = logging.getLogger(__name__)
+
+RUTA_CACHE = os.path.join(os.path.dirname(__file__), '..', 'precalculos_cache.json')
+INTERVALO_REVISION_SEGUNDOS = 300
+
+_cache = None
+_lock_archivo = threading.Lock()
+
+
+def _cargar_cache() -> Dict:
+    global _cache
+    if _cache is not None:
+        return _cache
+    try:
+        with open(RUTA_CACHE, 'r', encoding='utf-8') as f:
+            _cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        _cache = {}
+    return _cache
+
+
+def _ahora_chile() -> datetime:
+    """Hora local de Chile sin zona (mismo formato que se guardaba antes)."""
+    return datetime.now(CHILE_TZ).replace(tzinfo=None)
+
+
+def guardar_precalculo(nombre: str, resultado: Dict, version_datos: Optional[str]) -> Dict:
+    """Guarda `resultado` con su hora de cálculo y la versión de datos usada."""
+    entrada = {
+        'resultado': resultado,
+        'calculado_en': _ahora_chile().isoformat(timespec='seconds'),
+        'version_datos': version_datos,
+    }
+    with _lock_archivo:
+        cache = _cargar_cache()
+        cache[nombre] = entrada
+        try:
+            with open(RUTA_CACHE, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+        except Exception as e:
+            logger.warning(f"No se pudo guardar precalculos_cache.json: {e}")
+    return entrada
+
+
+def obtener_precalculo(nombre: str) -> Optional[Dict]:
+    """{'resultado', 'calculado_en', 'version_datos'} o None si nunca se calculó."""
+    return _cargar_cache().get(nombre)
+
+
+def necesita_precalculo(nombre: str, version_datos: Optional[str]) -> bool:
+    """True si no existe, si se calculó otro día o con otros datos."""
+    entrada = obtener_precalculo(nombre)
+    if entrada is None:
+        return True
+    return entrada.get('version_datos') != version_datos or \
+        entrada.get('calculado_en', '')[:10] != _ahora_chile().date().isoformat()
+
+
+def ejecutar_precalculos(tareas: Dict[str, Callable[[], Optional[Dict]]], version_datos: Optional[str]) -> List[str]:
+    """Recalcula las tareas desactualizadas. Un error en una tarea no
+    impide las demás ni borra su último resultado bueno. Una tarea que
+    devuelve None maneja su propio caché: se ejecuta en cada pasada y no se
+    guarda aquí."""
+    actualizadas = []
+    for nombre, calcular in tareas.items():
+        if not necesita_precalculo(nombre, version_datos):
+            continue
+        try:
+            inicio = datetime.now()
+            resultado = calcular()
+            if resultado is None:
+                continue
+            guardar_precalculo(nombre, resultado, version_datos)
+            actualizadas.append(nombre)
+            logger.info(f"Precálculo '{nombre}' listo en {(datetime.now() - inicio).total_seconds():.1f}s")
+        except Exception as e:
+            logger.error(f"Error en precálculo '{nombre}': {e}", exc_info=True)
+    return actualizadas
+
+
+async def programador_precalculos(
+    tareas: Dict[str, Callable[[], Optional[Dict]]],
+    obtener_version: Callable[[], Optional[str]],
+    intervalo_segundos: int = INTERVALO_REVISION_SEGUNDOS,
+):
+    """Loop de fondo: cada `intervalo_segundos` revisa la versión de datos
+    y recalcula lo desactualizado en un hilo aparte (no bloquea el event
+    loop de FastAPI)."""
+    while True:
+        try:
+            version = await asyncio.to_thread(obtener_version)
+            await asyncio.to_thread(ejecutar_precalculos, tareas, version)
+        except Exception as e:
+            logger.error(f"Error en programador de precálculos: {e}")
+        await asyncio.sleep(intervalo_segundos)
@@ -4,6 +4,7 @@ Clasifica cada cliente y detecta churn en tiempo real.
 """
 import pandas as pd
 import numpy as np
+from collections import Counter
 from datetime import datetime, timedelta
 from typing import List, Dict
 import logging
@@ -95,7 +96,7 @@ def calcular_rfm(pedidos: List[Dict]) -> Dict:
         rfm['rfm_score'] = rfm['r_score'] + rfm['f_score'] + rfm['m_score']
 
         # Clasificar segmento
-        rfm['segmento'] = rfm.apply(_clasificar_segmento, axis=1)
+        rfm['segmento'] = _clasificar_segmentos(rfm['r_score'], rfm['f_score'], rfm['m_score'])
 
         # Probabilidad de churn (0-100%)
         rfm['churn_prob'] = rfm.apply(lambda row: _calcular_churn(row), axis=1)
@@ -164,6 +165,111 @@ def calcular_rfm(pedidos: List[Dict]) -> Dict:
         return _respuesta_vacia()
 
 
+def calcular_segmentos_por_mes(pedidos: List[Dict], desde_mes: str = None) -> Dict[str, Dict[str, str]]:
+    """
+    RFM "as-of" al cierre de cada mes, en un solo barrido del historial.
+
+    Recorre los pedidos ordenados por fecha una única vez, acumulando por
+    cliente última compra, frecuencia y monto; en cada frontera de mes
+    cerrado toma una foto y clasifica con los mismos quintiles y reglas que
+    `calcular_rfm` (la recencia se mide contra el cierre del mes, no contra
+    hoy). Devuelve {'YYYY-MM': {usuario: segmento}} solo para meses ya
+    cerrados y posteriores a `desde_mes`, para poder extender lo guardado
+    sin reclasificar meses anteriores.
+    """
+    if not pedidos:
+        return {}
+
+    df = pd.DataFrame(pedidos)
+    if 'nombrelocal' in df.columns:
+        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
+    for col in ['usuario', 'fecha', 'precio']:
+        if col not in df.columns:
+            return {}
+
+    df = df[df['usuario'].astype(str).str.strip() != '']
+    df = df.assign(
+        fecha_dt=df['fecha'].apply(_parsear_fecha),
+        precio_num=pd.to_numeric(df['precio'], errors='coerce').fillna(0),
+    ).dropna(subset=['fecha_dt'])
+    if df.empty:
+        return {}
+    df = df.sort_values('fecha_dt', kind='stable')
+
+    codigos, usuarios = pd.factorize(df['usuario'])
+    dias = (df['fecha_dt'].values.astype('datetime64[D]')).astype(np.int64)
+    montos = df['precio_num'].to_numpy(dtype=float)
+
+    primer_mes = df['fecha_dt'].iloc[0].to_period('M')
+    mes_actual = pd.Timestamp(datetime.now()).to_period('M')
+    meses = pd.period_range(primer_mes, mes_actual - 1, freq='M')
+    if desde_mes:
+        meses = meses[meses > pd.Period(desde_mes, freq='M')]
+    if len(meses) == 0:
+        return {}
+
+    n = len(usuarios)
+    ultima = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+    frecuencia = np.zeros(n, dtype=np.int64)
+    monetario = np.zeros(n, dtype=float)
+
+    snapshots = {}
+    inicio = 0
+    for mes in meses:
+        cierre = (mes + 1).to_timestamp()
+        cierre_dias = np.datetime64(cierre.date(), 'D').astype(np.int64)
+        fin = int(np.searchsorted(dias, cierre_dias, side='left'))
+        if fin > inicio:
+            tramo = codigos[inicio:fin]
+            np.maximum.at(ultima, tramo, dias[inicio:fin])
+            np.add.at(frecuencia, tramo, 1)
+            np.add.at(monetario, tramo, montos[inicio:fin])
+            inicio = fin
+
+        activos = np.flatnonzero(frecuencia > 0)
+        if len(activos) == 0:
+            continue
+        foto = pd.DataFrame({
+            'recencia_dias': cierre_dias - ultima[activos],
+            'frecuencia': frecuencia[activos],
+            'monetario': monetario[activos],
+        })
+        r = _score_quintil(foto['recencia_dias'], inverso=True)
+        f = _score_quintil(foto['frecuencia'], inverso=False)
+        m = _score_quintil(foto['monetario'], inverso=False)
+        snapshots[str(mes)] = dict(zip(usuarios[activos], _clasificar_segmentos(r, f, m)))
+
+    return snapshots
+
+
+def matriz_transicion_segmentos(snapshots: Dict[str, Dict[str, str]]) -> Dict:
+    """Cuenta, para cada par de meses consecutivos, cuántos clientes pasaron
+    del segmento X (mes t) al segmento Y (mes t+1). Clientes sin historial
+    en t aparecen con origen 'sin_historial'."""
+    meses = sorted(snapshots)
+    origenes = list(SEGMENTOS) + ['sin_historial']
+    matriz = {o: {d: 0 for d in SEGMENTOS} for o in origenes}
+    por_mes = []
+
+    for anterior, siguiente in zip(meses, meses[1:]):
+        foto_anterior, foto_siguiente = snapshots[anterior], snapshots[siguiente]
+        conteo = Counter(
+            (foto_anterior.get(usuario, 'sin_historial'), segmento)
+            for usuario, segmento in foto_siguiente.items()
+        )
+        transiciones = {}
+        for (origen, destino), cantidad in conteo.items():
+            matriz[origen][destino] += cantidad
+            transiciones.setdefault(origen, {})[destino] = cantidad
+        por_mes.append({'desde': anterior, 'hasta': siguiente, 'transiciones': transiciones})
+
+    return {
+        'meses': meses,
+        'matriz': matriz,
+        'transiciones_por_mes': por_mes,
+    }
+
+
 def _score_quintil(serie: pd.Series, inverso: bool) -> pd.Series:
     """Asigna score 1-5 por quintiles."""
     try:
@@ -173,24 +279,20 @@ def _score_quintil(serie: pd.Series, inverso: bool) -> pd.Series:
         return pd.Series([3] * len(serie), index=serie.index)
 
 
-def _clasificar_segmento(row) -> str:
-    r, f, m = row['r_score'], row['f_score'], row['m_score']
-    if r >= 4 and f >= 4 and m >= 4:
-        return 'campeon'
-    elif r >= 3 and f >= 3:
-        return 'leal'
-    elif r >= 4 and f <= 2:
-        return 'nuevo'
-    elif r >= 3 and f <= 2:
-        return 'prometedor'
-    elif r <= 2 and f >= 3 and m >= 3:
-        return 'en_riesgo'
-    elif r <= 2 and f >= 2:
-        return 'necesita_atencion'
-    elif r == 1:
-        return 'perdido'
-    else:
-        return 'potencial_leal'
+def _clasificar_segmentos(r: pd.Series, f: pd.Series, m: pd.Series) -> np.ndarray:
+    """Segmento por cliente a partir de sus scores R/F/M (vectorizado; el
+    orden de las condiciones define la prioridad entre segmentos)."""
+    condiciones = [
+        (r >= 4) & (f >= 4) & (m >= 4),
+        (r >= 3) & (f >= 3),
+        (r >= 4) & (f <= 2),
+        (r >= 3) & (f <= 2),
+        (r <= 2) & (f >= 3) & (m >= 3),
+        (r <= 2) & (f >= 2),
+        r == 1,
+    ]
+    segmentos = ['campeon', 'leal', 'nuevo', 'prometedor', 'en_riesgo', 'necesita_atencion', 'perdido']
+    return np.select(condiciones, segmentos, default='potencial_leal')
 
 
 def _calcular_churn(row) -> float:
@@ -8,7 +8,6 @@ misma época todos los años — un cliente así no debería recibir la misma
 urgencia que alguien realmente perdido.
 """
 import logging
-from datetime import datetime
 from typing import Dict, List
 
 import pandas as pd
@@ -19,56 +18,78 @@ MIN_ANOS_HISTORIAL = 2
 MIN_PEDIDOS_POR_CLIENTE = 3
 
 
-def _parsear_fecha(fecha_str):
-    if not fecha_str:
-        return None
-    for fmt in ("%d-%m-%Y", "%Y-%m-%d"):
-        try:
-            return datetime.strptime(str(fecha_str)[:10], fmt)
-        except (ValueError, TypeError):
-            continue
-    return None
-
-
-def _es_patron_estacional(fechas: list) -> bool:
-    if len(fechas) < MIN_PEDIDOS_POR_CLIENTE:
-        return False
-    anos = set(f.year for f in fechas)
-    if len(anos) < MIN_ANOS_HISTORIAL:
-        return False
-    # Solo se consideran los dos años más recientes del historial del cliente.
-    # Un trimestre es "estacional" únicamente si está activo en AMBOS de esos
-    # dos años — no basta con que coincida en dos años cualesquiera de un
-    # historial largo (eso produciría falsos positivos por pura coincidencia).
-    dos_anos_recientes = sorted(anos)[-2:]
-    ano_anterior, ano_reciente = dos_anos_recientes[0], dos_anos_recientes[1]
-
-    trimestres_por_ano = {ano_anterior: set(), ano_reciente: set()}
-    for f in fechas:
-        if f.year in trimestres_por_ano:
-            trimestre = (f.month - 1) // 3  # trimestre 0-3
-            trimestres_por_ano[f.year].add(trimestre)
-
-    interseccion = trimestres_por_ano[ano_anterior] & trimestres_por_ano[ano_reciente]
-    return len(interseccion) > 0
+def _parsear_fechas(fechas: pd.Series) -> pd.Series:
+    """Versión vectorizada de `_parsear_fecha` de los demás servicios:
+    DD-MM-YYYY primero, YYYY-MM-DD como respaldo, NaT si ninguno calza."""
+    texto = fechas.astype(str).str[:10]
+    dmy = pd.to_datetime(texto, format="%d-%m-%Y", errors="coerce")
+    ymd = pd.to_datetime(texto, format="%Y-%m-%d", errors="coerce")
+    return dmy.fillna(ymd)
+
+
+def _usuarios_estacionales(df: pd.DataFrame) -> set:
+    """Clasifica a TODOS los clientes de `df` en una sola pasada vectorizada.
+
+    Cada (cliente, año) se reduce a un bitmap de 4 bits con los trimestres
+    en que compró. Solo se consideran los dos años más recientes del
+    historial del cliente: un trimestre es "estacional" únicamente si está
+    activo en AMBOS de esos dos años — no basta con que coincida en dos años
+    cualesquiera de un historial largo (eso produciría falsos positivos por
+    pura coincidencia)."""
+    if df.empty:
+        return set()
+
+    pedidos_por_usuario = df.groupby('usuario').size()
+    candidatos = pedidos_por_usuario[pedidos_por_usuario >= MIN_PEDIDOS_POR_CLIENTE].index
+    df = df[df['usuario'].isin(candidatos)]
+    if df.empty:
+        return set()
+
+    presencia = pd.DataFrame({
+        'usuario': df['usuario'].values,
+        'ano': df['fecha_dt'].dt.year.values,
+        'bit': 1 << ((df['fecha_dt'].dt.month.values - 1) // 3),  # trimestre 0-3
+    }).drop_duplicates()
+    # Con los bits ya deduplicados por (cliente, año), la suma equivale al OR.
+    bitmaps = presencia.groupby(['usuario', 'ano'])['bit'].sum().reset_index()
+
+    anos_por_usuario = bitmaps.groupby('usuario')['ano'].transform('size')
+    bitmaps = bitmaps[anos_por_usuario >= MIN_ANOS_HISTORIAL]
+    if bitmaps.empty:
+        return set()
+
+    # groupby ordena por (usuario, ano): los dos últimos renglones de cada
+    # cliente son sus dos años más recientes.
+    dos_anos_recientes = bitmaps.groupby('usuario').tail(2).groupby('usuario')['bit']
+    interseccion = dos_anos_recientes.first().values & dos_anos_recientes.last().values
+    usuarios = dos_anos_recientes.first().index
+    return set(usuarios[interseccion != 0])
 
 
 def clasificar_churn_estacional(pedidos: List[Dict], clientes_inactivos: List[Dict]) -> Dict:
     if not clientes_inactivos:
         return {"clientes": []}
 
+    usuarios_inactivos = {cliente.get('usuario') for cliente in clientes_inactivos}
+
     df = pd.DataFrame(pedidos)
-    if not df.empty and 'nombrelocal' in df.columns:
-        df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
-    if not df.empty:
-        df['fecha_dt'] = df['fecha'].apply(_parsear_fecha)
-        df = df.dropna(subset=['fecha_dt'])
-
-    resultado = []
-    for cliente in clientes_inactivos:
-        usuario = cliente.get('usuario')
-        fechas = sorted(df[df['usuario'] == usuario]['fecha_dt'].tolist()) if not df.empty else []
-        clasificacion = "estacional" if _es_patron_estacional(fechas) else "real"
-        resultado.append({"usuario": usuario, "clasificacion": clasificacion})
+    if df.empty or 'usuario' not in df.columns or 'fecha' not in df.columns:
+        df = pd.DataFrame(columns=['usuario', 'fecha_dt'])
+    else:
+        # Se recorta primero a los clientes inactivos (lookup por hash), así
+        # el costo escala con sus pedidos y no con el historial completo.
+        df = df[df['usuario'].isin(usuarios_inactivos)]
+        if 'nombrelocal' in df.columns:
+            df = df[df['nombrelocal'].astype(str).str.strip().str.lower() == 'aguas ancud']
+        df = df.assign(fecha_dt=_parsear_fechas(df['fecha'])).dropna(subset=['fecha_dt'])
+
+    estacionales = _usuarios_estacionales(df)
 
+    resultado = [
+        {
+            "usuario": cliente.get('usuario'),
+            "clasificacion": "estacional" if cliente.get('usuario') in estacionales else "real",
+        }
+        for cliente in clientes_inactivos
+    ]
     return {"clientes": resultado}
@@ -0,0 +1,218 @@
+"""
+Forma de los resultados de tools antes de entrar a la conversación.
+
+Lo que devuelve una tool se agrega entero a los mensajes y se reenvía en
+cada vuelta siguiente del loop. Varias devuelven mucho más de lo que el
+modelo usa: get_customer_risk lista a todos los clientes con dirección y
+teléfono (~90 KB con la base actual), get_customer_segments incluye
+segmento_por_cliente con cada cliente. Aquí, por tool:
+
+1. Se quitan campos que el modelo no necesita (FORMAS_TOOL["quitar"] y
+   ["quitar_en_items"]).
+2. Las listas ya vienen ordenadas por relevancia: se dejan las primeras
+   `top_k` y se informa cuántas había ("_recortes").
+3. Números compactos: floats enteros como int, el resto con 3 cifras
+   significativas (sin decimales sobre 1000; una tasa de 0.004 sigue
+   siendo 0.004), NaN/inf como null.
+
+Las claves de "quitar" y "top_k" pueden ser rutas con punto
+("rentabilidad.insights") para resultados que anidan varios reportes.
+4. Si aún supera su presupuesto de tokens, se parte a la mitad la lista
+   más larga hasta entrar (o no quedar listas que recortar).
+
+Los tokens se cuentan con tiktoken (o200k_base, el de gpt-4o-mini); sin
+tiktoken, o si no puede cargar el encoding, se estima con len/4. El
+resultado original no se modifica: las recomendaciones y el memo siguen
+guardando el completo.
+"""
+import json
+import logging
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRESUPUESTO_TOKENS = 1500
+PRESUPUESTO_POR_TOOL = {
+    "get_rentabilidad_reportes": 2000,
+    "get_demand_forecast": 2000,
+}
+MIN_ITEMS_LISTA = 3
+CIFRAS_SIGNIFICATIVAS = 3
+
+FORMAS_TOOL: Dict[str, Dict] = {
+    "get_customer_segments": {
+        "quitar": ["segmento_por_cliente"],
+        "top_k": {"clientes_en_riesgo": 15, "clientes_campeon": 10},
+    },
+    "get_customer_risk": {
+        "top_k": {"clientes": 25},
+        "quitar_en_items": ["direccion"],
+    },
+    "get_seasonal_churn_classification": {
+        "top_k": {"clientes": 30},
+        "contar_por": {"clientes": "clasificacion"},
+    },
+    "get_route_intelligence": {
+        "top_k": {"celdas": 15},
+    },
+    "get_rentabilidad_reportes": {
+        # Escenarios ±20% y ROI proyectado se derivan de las métricas que
+        # quedan; las fechas de generación no aportan al análisis.
+        "quitar": [
+            "rentabilidad.analisis_avanzado.escenarios_rentabilidad",
+            "rentabilidad.analisis_avanzado.roi",
+            "rentabilidad.fecha_analisis",
+            "reporte_ejecutivo.fecha_generacion",
+        ],
+        "top_k": {
+            "rentabilidad.insights": 3,
+            "rentabilidad.recomendaciones": 3,
+            "reporte_ejecutivo.insights": 3,
+            "reporte_ejecutivo.recomendaciones": 3,
+        },
+    },
+}
+
+_codificador = {"cargado": False, "valor": None}
+_lock = threading.Lock()
+# nombre -> {llamadas, tokens_originales, tokens_enviados}
+ESTADISTICAS_FORMA: Dict[str, Dict] = {}
+
+
+def _obtener_codificador():
+    if not _codificador["cargado"]:
+        _codificador["cargado"] = True
+        try:
+            import tiktoken
+            _codificador["valor"] = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.info(f"tiktoken no disponible ({e}); tokens estimados con len/4")
+    return _codificador["valor"]
+
+
+def contar_tokens(texto: str) -> int:
+    codificador = _obtener_codificador()
+    if codificador is None:
+        return len(texto) // 4
+    return len(codificador.encode(texto))
+
+
+def _serializar(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def _compactar(obj: Any) -> Any:
+    """Copia con números compactos."""
+    if isinstance(obj, dict):
+        return {k: _compactar(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_compactar(v) for v in obj]
+    if isinstance(obj, float):
+        if math.isnan(obj) or math.isinf(obj):
+            return None
+        if obj.is_integer() and abs(obj) < 1e15:
+            return int(obj)
+        if abs(obj) >= 1000:
+            return round(obj)
+        return round(obj, CIFRAS_SIGNIFICATIVAS - 1 - math.floor(math.log10(abs(obj))))
+    return obj
+
+
+def _en_ruta(resultado: Dict, ruta: str) -> Tuple[Optional[Dict], str]:
+    """(dict contenedor, clave) de una ruta con punto; (None, clave) si
+    algún tramo no existe."""
+    *padres, clave = ruta.split(".")
+    contenedor = resultado
+    for parte in padres:
+        contenedor = contenedor.get(parte) if isinstance(contenedor, dict) else None
+    return (contenedor if isinstance(contenedor, dict) else None), clave
+
+
+def _aplicar_forma(resultado: Dict, forma: Dict, recortes: Dict):
+    for ruta in forma.get("quitar", []):
+        contenedor, clave = _en_ruta(resultado, ruta)
+        if contenedor is not None:
+            contenedor.pop(clave, None)
+    for clave, campo in forma.get("contar_por", {}).items():
+        conteo: Dict[str, int] = {}
+        for item in resultado.get(clave) or []:
+            valor = str(item.get(campo)) if isinstance(item, dict) else "?"
+            conteo[valor] = conteo.get(valor, 0) + 1
+        resultado[f"{clave}_por_{campo}"] = conteo
+    for ruta, k in forma.get("top_k", {}).items():
+        contenedor, clave = _en_ruta(resultado, ruta)
+        lista = contenedor.get(clave) if contenedor is not None else None
+        if isinstance(lista, list) and len(lista) > k:
+            recortes[ruta] = {"mostrados": k, "total": len(lista)}
+            contenedor[clave] = lista[:k]
+    quitar_items = forma.get("quitar_en_items", [])
+    if quitar_items:
+        for valor in resultado.values():
+            if isinstance(valor, list):
+                for item in valor:
+                    if isinstance(item, dict):
+                        for campo in quitar_items:
+                            item.pop(campo, None)
+
+
+def _listas(obj: Any, ruta: str = "") -> List[Tuple[str, Dict, str]]:
+    """(ruta, dict contenedor, clave) de cada lista anidada en dicts."""
+    encontradas = []
+    if isinstance(obj, dict):
+        for clave, valor in obj.items():
+            sub = f"{ruta}.{clave}" if ruta else clave
+            if isinstance(valor, list):
+                encontradas.append((sub, obj, clave))
+            encontradas.extend(_listas(valor, sub))
+    return encontradas
+
+
+def _ajustar_a_presupuesto(resultado: Dict, presupuesto: int, recortes: Dict) -> str:
+    texto = _serializar(resultado)
+    while contar_tokens(texto) > presupuesto:
+        candidatas = [
+            (len(_serializar(contenedor[clave])), ruta, contenedor, clave)
+            for ruta, contenedor, clave in _listas(resultado)
+            if len(contenedor[clave]) > MIN_ITEMS_LISTA
+        ]
+        if not candidatas:
+            break
+        _, ruta, contenedor, clave = max(candidatas, key=lambda c: c[0])
+        lista = contenedor[clave]
+        total = recortes.get(ruta, {}).get("total", len(lista))
+        nuevo = max(MIN_ITEMS_LISTA, len(lista) // 2)
+        contenedor[clave] = lista[:nuevo]
+        recortes[ruta] = {"mostrados": nuevo, "total": total}
+        resultado["_recortes"] = recortes
+        texto = _serializar(resultado)
+    return texto
+
+
+def formar_resultado(nombre: str, resultado: Any, presupuesto: Optional[int] = None) -> str:
+    """JSON listo para el mensaje `tool`, dentro del presupuesto de tokens
+    de la tool."""
+    original = _serializar(resultado)
+    if not isinstance(resultado, dict) or "error" in resultado:
+        return original
+
+    presupuesto = presupuesto or PRESUPUESTO_POR_TOOL.get(nombre, PRESUPUESTO_TOKENS)
+    formado = _compactar(resultado)
+    recortes: Dict[str, Dict] = {}
+    _aplicar_forma(formado, FORMAS_TOOL.get(nombre, {}), recortes)
+    if recortes:
+        formado["_recortes"] = recortes
+    texto = _ajustar_a_presupuesto(formado, presupuesto, recortes)
+
+    tokens_antes, tokens_despues = contar_tokens(original), contar_tokens(texto)
+    with _lock:
+        stats = ESTADISTICAS_FORMA.setdefault(
+            nombre, {"llamadas": 0, "tokens_originales": 0, "tokens_enviados": 0}
+        )
+        stats["llamadas"] += 1
+        stats["tokens_originales"] += tokens_antes
+        stats["tokens_enviados"] += tokens_despues
+    if tokens_despues < tokens_antes:
+        logger.info(f"Tool '{nombre}': {tokens_antes} → {tokens_despues} tokens ({tokens_antes - tokens_despues} ahorrados)")
+    return texto
@@ -36,6 +36,12 @@ def _cache_valido() -> bool:
     return (datetime.now().timestamp() - _cache["timestamp"]) < CACHE_SEGUNDOS
 
 
+def marca_clima():
+    """Timestamp del clima cacheado mientras siga vigente; None si venció o
+    no hay. Cambia cuando obtener_clima() tiene datos nuevos que traer."""
+    return _cache["timestamp"] if _cache_valido() else None
+
+
 def _multiplicador_demanda(temp_c: float) -> float:
     """
     Calcula cuánto sube/baja la demanda de agua según temperatura.
@@ -0,0 +1,239 @@
+"""
+Servidor local compatible con la API de chat de OpenAI, para medir el chat
+sin red ni costo.
+
+Responde POST /v1/chat/completions como lo haría gpt-4o-mini, siguiendo un
+guion: para cada pregunta del usuario, qué tools pide el modelo en cada
+vuelta del loop y qué respuesta da al final (también en streaming). Las
+llamadas auxiliares del chat se reconocen por su prompt: preguntas
+sugeridas devuelven un JSON array y los resúmenes de historial, una
+oración. Las demoras son configurables para imitar la latencia real.
+
+`usage` trae prompt_tokens estimados (len/4) y cached_tokens simulados:
+el prefijo común más largo con las requests recientes, desde 1024 tokens
+y en bloques de 128, como el caché de prefijos de OpenAI.
+
+Uso independiente (p.ej. para desarrollar el frontend sin API key):
+
+    python stub_openai_server.py --puerto 8099 --guion guion.json
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub uvicorn main:app
+
+Formato del guion: {"pregunta": {"rondas": [[{"name": ..., "arguments": {...}}], ...],
+"respuesta": "..."}}. Una pregunta sin guion responde sin tools.
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+RESPUESTA_POR_DEFECTO = (
+    "**Diagnóstico:** Las ventas siguen la tendencia del mes.\n"
+    "**Causa:** Sin cambios relevantes en la demanda.\n"
+    "**Acción:** Mantener la ruta actual.\n"
+    "**Impacto:** $0 CLP."
+)
+PREGUNTAS_SUGERIDAS = ["¿Qué zona crece más?", "¿Quién está en riesgo?", "¿Cómo cierra el mes?"]
+MIN_TOKENS_CACHE = 1024
+BLOQUE_TOKENS_CACHE = 128
+PREFIJOS_RECORDADOS = 64
+
+
+class StubOpenAI:
+    """Estado del servidor: guion, demoras y prefijos vistos."""
+
+    def __init__(
+        self,
+        guion: Optional[Dict] = None,
+        latencia_respuesta: float = 0.25,
+        latencia_primer_token: float = 0.2,
+        latencia_token: float = 0.01,
+    ):
+        self.guion = guion or {}
+        self.latencia_respuesta = latencia_respuesta
+        self.latencia_primer_token = latencia_primer_token
+        self.latencia_token = latencia_token
+        self.prefijos: List[str] = []
+        self.solicitudes = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._servidor: Optional[ThreadingHTTPServer] = None
+
+    # ─── Contenido ────────────────────────────────────────────────────────
+    def _uso(self, cuerpo: Dict, texto_respuesta: str) -> Dict:
+        serializado = json.dumps(
+            {"tools": cuerpo.get("tools"), "messages": cuerpo.get("messages")},
+            ensure_ascii=False, sort_keys=False,
+        )
+        with self._lock:
+            comun = max((len(os.path.commonprefix([serializado, p])) for p in self.prefijos), default=0)
+            self.prefijos = (self.prefijos + [serializado])[-PREFIJOS_RECORDADOS:]
+        prompt_tokens = len(serializado) // 4
+        cacheados = comun // 4
+        cacheados = cacheados - cacheados % BLOQUE_TOKENS_CACHE if cacheados >= MIN_TOKENS_CACHE else 0
+        completion = max(1, len(texto_respuesta) // 4)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion,
+            "total_tokens": prompt_tokens + completion,
+            "prompt_tokens_details": {"cached_tokens": cacheados},
+        }
+
+    def _mensaje(self, cuerpo: Dict) -> Dict:
+        """{'content', 'tool_calls'} que devolvería el modelo."""
+        mensajes = cuerpo.get("messages", [])
+        sistema = mensajes[0].get("content", "") if mensajes else ""
+        if "preguntas de seguimiento" in sistema:
+            return {"content": json.dumps(PREGUNTAS_SUGERIDAS, ensure_ascii=False), "tool_calls": None}
+        if "Resume esta conversación" in sistema:
+            return {"content": "El usuario revisó ventas, zonas y clientes en riesgo.", "tool_calls": None}
+
+        ultima_pregunta = max((i for i, m in enumerate(mensajes) if m.get("role") == "user"), default=-1)
+        pregunta = mensajes[ultima_pregunta].get("content", "") if ultima_pregunta >= 0 else ""
+        guion = self.guion.get(pregunta, {})
+        if cuerpo.get("tools"):
+            ronda = sum(1 for m in mensajes[ultima_pregunta + 1:] if m.get("role") == "assistant" and m.get("tool_calls"))
+            rondas = guion.get("rondas", [])
+            if ronda < len(rondas):
+                return {
+                    "content": None,
+                    "tool_calls": [
+                        {
+                            "id": f"call_{next(self._ids)}",
+                            "type": "function",
+                            "function": {"name": t["name"], "arguments": json.dumps(t.get("arguments", {}), ensure_ascii=False)},
+                        }
+                        for t in rondas[ronda]
+                    ],
+                }
+        return {"content": guion.get("respuesta", RESPUESTA_POR_DEFECTO), "tool_calls": None}
+
+    # ─── Respuestas HTTP ──────────────────────────────────────────────────
+    def responder(self, cuerpo: Dict) -> Dict:
+        time.sleep(self.latencia_respuesta)
+        mensaje = self._mensaje(cuerpo)
+        return {
+            "id": f"chatcmpl-stub-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": cuerpo.get("model", "gpt-4o-mini"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", **mensaje},
+                "finish_reason": "tool_calls" if mensaje["tool_calls"] else "stop",
+            }],
+            "usage": self._uso(cuerpo, mensaje["content"] or ""),
+        }
+
+    def fragmentos(self, cuerpo: Dict):
+        """Chunks del stream (sin el prefijo 'data: ')."""
+        mensaje = self._mensaje(cuerpo)
+        texto = mensaje["content"] or ""
+        base = {
+            "id": f"chatcmpl-stub-{next(self._ids)}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": cuerpo.get("model", "gpt-4o-mini"),
+        }
+        time.sleep(self.latencia_primer_token)
+        palabras = texto.split(" ")
+        for i, palabra in enumerate(palabras):
+            if i:
+                time.sleep(self.latencia_token)
+            delta = {"content": palabra if i == len(palabras) - 1 else palabra + " "}
+            if i == 0:
+                delta["role"] = "assistant"
+            yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        if (cuerpo.get("stream_options") or {}).get("include_usage"):
+            yield {**base, "choices": [], "usage": self._uso(cuerpo, texto)}
+
+    # ─── Servidor ─────────────────────────────────────────────────────────
+    def iniciar(self, puerto: int = 0) -> str:
+        """Levanta el servidor en un hilo; devuelve la base_url (…/v1)."""
+        stub = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                largo = int(self.headers.get("Content-Length") or 0)
+                cuerpo = json.loads(self.rfile.read(largo) or b"{}")
+                with stub._lock:
+                    stub.solicitudes += 1
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                if cuerpo.get("stream"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.close_connection = True
+                    for fragmento in stub.fragmentos(cuerpo):
+                        self.wfile.write(f"data: {json.dumps(fragmento, ensure_ascii=False)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                    return
+                datos = json.dumps(stub.responder(cuerpo), ensure_ascii=False).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(datos)))
+                self.end_headers()
+                self.wfile.write(datos)
+
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, name="stub-openai", daemon=True).start()
+        return f"http://127.0.0.1:{self._servidor.server_address[1]}/v1"
+
+    def detener(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+
+@contextmanager
+def servidor_stub(guion: Optional[Dict] = None, **latencias):
+    """Servidor stub en un puerto libre durante el bloque `with`."""
+    stub = StubOpenAI(guion, **latencias)
+    base_url = stub.iniciar()
+    try:
+        yield stub, base_url
+    finally:
+        stub.detener()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--puerto', type=int, default=8099)
+    parser.add_argument('--guion', help='JSON con el guion de preguntas')
+    parser.add_argument('--latencia-respuesta', type=float, default=0.25)
+    parser.add_argument('--latencia-primer-token', type=float, default=0.2)
+    parser.add_argument('--latencia-token', type=float, default=0.01)
+    args = parser.parse_args()
+
+    guion = None
+    if args.guion:
+        with open(args.guion, 'r', encoding='utf-8') as f:
+            guion = json.load(f)
+    stub = StubOpenAI(guion, args.latencia_respuesta, args.latencia_primer_token, args.latencia_token)
+    print(f"Stub OpenAI en {stub.iniciar(args.puerto)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.detener()
+
+
+if __name__ == '__main__':
+    main()
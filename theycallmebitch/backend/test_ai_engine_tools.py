@@ -1,13 +1,24 @@
+import asyncio
 import json
 import os
-from unittest.mock import patch
+import threading
+import time
+from unittest.mock import AsyncMock, patch
 
 from datetime import datetime, timedelta
 
 from services.ai_engine import (
+    ESTADISTICAS_PROMPT,
+    ESTADISTICAS_TOOLS,
+    TOOLS,
+    _conversacion_inicial,
+    _ejecutar_tool_calls,
     _execute_tool,
+    esperar_tools_en_curso,
     run_chat_query,
     run_chat_query_prepare,
+    run_chat_query_prepare_async,
+    stream_respuesta,
     run_chat_query_with_rec_id,
     simulate_scenario,
 )
@@ -97,6 +108,99 @@ def test_run_chat_query_with_rec_id_propaga_id_real_de_draft_campaign_message():
         mock_guardar.assert_called_once()
 
 
+
+def test_tool_calls_corren_en_paralelo_y_conservan_el_orden():
+    """Varias tool calls en una respuesta se ejecutan juntas; los resultados
+    vuelven en el orden en que el modelo las pidió."""
+    # Las tres deben estar en curso a la vez para pasar la barrera, y
+    # terminan en orden inverso al pedido.
+    barrera = threading.Barrier(3, timeout=5)
+    terminadas = {n: threading.Event() for n in ("c1", "c2", "c3")}
+    espera_a = {"c1": "c2", "c2": "c3"}
+
+    def tool_concurrente(name, args, pedidos, ctx):
+        barrera.wait()
+        if args["id"] in espera_a:
+            assert terminadas[espera_a[args["id"]]].wait(5)
+        terminadas[args["id"]].set()
+        return {"tool": name}
+
+    calls = [
+        _mock_tool_call("c1", "get_customer_segments", {"id": "c1"}),
+        _mock_tool_call("c2", "get_zone_analysis", {"id": "c2"}),
+        _mock_tool_call("c3", "get_customer_risk", {"id": "c3"}),
+    ]
+    with patch("services.ai_engine._execute_tool", side_effect=tool_concurrente):
+        resultados = _ejecutar_tool_calls(calls, [], {})
+
+    assert [tc.id for tc, *_ in resultados] == ["c1", "c2", "c3"]
+    assert [r["tool"] for *_, r in resultados] == [
+        "get_customer_segments", "get_zone_analysis", "get_customer_risk",
+    ]
+    assert ESTADISTICAS_TOOLS["get_zone_analysis"]["llamadas"] >= 1
+
+
+def test_tool_que_excede_su_timeout_devuelve_error_sin_bloquear_las_demas():
+    liberar = threading.Event()
+
+    def tool(name, args, pedidos, ctx):
+        if name == "get_demand_forecast":
+            liberar.wait(5)
+        return {"ok": name}
+
+    calls = [
+        _mock_tool_call("c1", "get_demand_forecast", {}),
+        _mock_tool_call("c2", "get_inventory", {}),
+    ]
+    with patch("services.ai_engine._execute_tool", side_effect=tool), \
+         patch.dict("services.ai_engine.TIMEOUT_POR_TOOL", {"get_demand_forecast": 0.1}):
+        try:
+            resultados = _ejecutar_tool_calls(calls, [], {})
+        finally:
+            # El hilo vencido no debe seguir corriendo en los tests siguientes
+            liberar.set()
+            assert esperar_tools_en_curso(timeout=5)
+
+    assert "error" in resultados[0][3]
+    assert resultados[1][3] == {"ok": "get_inventory"}
+    assert ESTADISTICAS_TOOLS["get_demand_forecast"]["timeouts"] >= 1
+
+
+def test_tools_lentas_acumuladas_no_ocupan_los_hilos_de_las_rapidas(monkeypatch):
+    from data_adapter import data_adapter
+    pedidos = [{"id": "1"}]
+    monkeypatch.setattr(data_adapter, "pedidos_antiguos_cache", pedidos)
+    monkeypatch.setattr(data_adapter, "version_datos", "v-test")
+    liberar = threading.Event()
+    ejecutadas = []
+
+    def tool(name, args, pedidos_cache, ctx):
+        ejecutadas.append(name)
+        if name in ("get_demand_forecast", "web_search"):
+            liberar.wait(5)
+        return {"ok": name}
+
+    # Más pronósticos y búsquedas vencidas que hilos tiene el pool general,
+    # dos de ellas idénticas
+    lentas = [_mock_tool_call(f"f{i}", "get_demand_forecast", {"dias": 7 + i % 3}) for i in range(4)]
+    lentas += [_mock_tool_call(f"w{i}", "web_search", {"query": f"q{i}"}) for i in range(4)]
+    with patch("services.ai_engine._execute_tool", side_effect=tool), \
+         patch.dict("services.ai_engine.TIMEOUT_POR_TOOL", {"get_demand_forecast": 0.05, "web_search": 0.05}), \
+         patch("services.ai_engine.TIMEOUT_TOOL_SEGUNDOS", 2):
+        try:
+            vencidas = _ejecutar_tool_calls(lentas, pedidos, {})
+            rapidas = _ejecutar_tool_calls([_mock_tool_call("r1", "get_kpis", {})], pedidos, {})
+        finally:
+            liberar.set()
+            assert esperar_tools_en_curso(timeout=5)
+
+    assert all("error" in r for *_, r in vencidas)
+    assert rapidas[0][3] == {"ok": "get_kpis"}
+    # f0 y f3 piden el mismo pronóstico: se calcula una sola vez
+    assert ejecutadas.count("get_demand_forecast") == 3
+    assert ESTADISTICAS_TOOLS["get_demand_forecast"]["compartidas"] >= 1
+
+
 def test_run_chat_query_with_rec_id_es_none_sin_recomendacion():
     """Si no se usa draft_campaign_message/simulate_scenario, rec_id debe ser None."""
     resp_stop = _mock_response(_mock_choice("stop", content="Tus ventas van bien."))
@@ -159,6 +263,116 @@ def test_run_chat_query_prepare_devuelve_tupla_de_3_con_rec_id():
         assert isinstance(conversation, list)
 
 
+
+def test_run_chat_query_prepare_async_mismo_contrato_que_la_version_sincronica():
+    tool_call = _mock_tool_call(
+        "call_1", "draft_campaign_message",
+        {"segment": "perdido", "offer": "bidón gratis"},
+    )
+    resp_tool_calls = _mock_response(_mock_choice("tool_calls", content=None, tool_calls=[tool_call]))
+    resp_stop = _mock_response(_mock_choice("stop", content=None))
+
+    with patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"}), \
+         patch("services.ai_engine.AsyncOpenAI") as MockAsyncOpenAI, \
+         patch("services.memory_service.guardar_recomendacion", return_value=99):
+        MockAsyncOpenAI.return_value.chat.completions.create = AsyncMock(side_effect=[resp_tool_calls, resp_stop])
+
+        conversation, tools_used, rec_id = asyncio.run(run_chat_query_prepare_async(
+            {}, "redacta un mensaje para clientes perdidos", history=[], pedidos_cache=[]
+        ))
+
+    assert tools_used == ["draft_campaign_message"]
+    assert rec_id == 99
+    assert conversation[-1]["role"] == "tool"
+
+
+def test_stream_respuesta_no_bloquea_el_event_loop():
+    """Mientras llegan los tokens, otras corrutinas del mismo loop (p.ej. una
+    request del dashboard) siguen avanzando."""
+    class StreamLento:
+        def __init__(self, tokens):
+            self.tokens = list(tokens)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            if not self.tokens:
+                raise StopAsyncIteration
+            await asyncio.sleep(0.02)
+            delta = type("obj", (), {"content": self.tokens.pop(0)})()
+            return type("obj", (), {"choices": [type("obj", (), {"delta": delta})()]})()
+
+    async def escenario():
+        ticks = []
+
+        async def dashboard():
+            for _ in range(5):
+                ticks.append(len(tokens))
+                await asyncio.sleep(0.015)
+
+        tokens = []
+
+        async def leer():
+            async for delta in stream_respuesta([{"role": "user", "content": "hola"}]):
+                tokens.append(delta)
+
+        await asyncio.gather(leer(), dashboard())
+        return tokens, ticks
+
+    with patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"}), \
+         patch("services.ai_engine.AsyncOpenAI") as MockAsyncOpenAI:
+        MockAsyncOpenAI.return_value.chat.completions.create = AsyncMock(
+            return_value=StreamLento(["Ven", "tas ", "ok", "."])
+        )
+        tokens, ticks = asyncio.run(escenario())
+
+    assert "".join(tokens) == "Ventas ok."
+    # El "dashboard" corrió intercalado con el stream, no antes ni después
+    assert any(0 < t < 4 for t in ticks)
+
+
+
+def test_prefijo_del_prompt_es_identico_entre_preguntas_y_contextos():
+    """Lo volátil (contexto, intención) va al final: el system prompt y las
+    tools son los mismos bytes en toda request, y el historial se conserva
+    como prefijo en el turno siguiente."""
+    conv_a, tools_a = _conversacion_inicial({"ventas_mensuales": 100}, "¿cómo van las zonas?", [])
+    conv_b, tools_b = _conversacion_inicial({"ventas_mensuales": 999}, "redacta una campaña", [])
+
+    assert json.dumps(tools_a) == json.dumps(tools_b) == json.dumps(TOOLS)
+    assert conv_a[0] == conv_b[0]
+    assert "CONTEXTO ACTUAL" not in conv_a[0]["content"]
+    assert "get_zone_analysis" in conv_a[-2]["content"]
+
+    historial = [{"role": "user", "content": "¿cómo van las zonas?"}, {"role": "agent", "content": "Bien."}]
+    conv_c, _ = _conversacion_inicial({"ventas_mensuales": 100}, "¿y macul?", historial)
+    assert conv_c[:3] == [conv_a[0], {"role": "user", "content": "¿cómo van las zonas?"},
+                          {"role": "assistant", "content": "Bien."}]
+
+
+def test_registra_tokens_cacheados_por_tipo_de_llamada():
+    uso = type("obj", (), {
+        "prompt_tokens": 4000,
+        "prompt_tokens_details": type("obj", (), {"cached_tokens": 3840})(),
+    })()
+    resp = type("obj", (), {
+        "choices": [_mock_choice("stop", content="ok")],
+        "usage": uso,
+    })()
+    antes = dict(ESTADISTICAS_PROMPT.get("seguimiento", {"llamadas": 0, "cached_tokens": 0}))
+
+    historial = [{"role": "user", "content": "hola"}, {"role": "agent", "content": "hola"}]
+    with patch.dict(os.environ, {"OPENAI_API_KEY": "test-key"}), \
+         patch("services.ai_engine.OpenAI") as MockOpenAI:
+        MockOpenAI.return_value.chat.completions.create.return_value = resp
+        run_chat_query_prepare({}, "¿y las ventas de hoy?", history=historial, pedidos_cache=[])
+
+    despues = ESTADISTICAS_PROMPT["seguimiento"]
+    assert despues["llamadas"] == antes["llamadas"] + 1
+    assert despues["cached_tokens"] == antes["cached_tokens"] + 3840
+
+
 def test_web_search_tool_devuelve_resultado_estructurado():
     from services.ai_engine import _execute_tool
     with patch("services.ai_engine._buscar_web") as mock_buscar:
@@ -1,7 +1,18 @@
-from datetime import datetime, timedelta
+import random
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from services import anomaly_detection_service as ads
 from services.anomaly_detection_service import detectar_anomalias
 
 
+@pytest.fixture(autouse=True)
+def detector_limpio():
+    ads.reiniciar_detector()
+
+
 def _pedidos_serie(conteos_por_dia):
     pedidos = []
     hoy = datetime.now()
@@ -27,3 +38,108 @@ def test_no_detecta_nada_si_el_patron_es_normal():
 
 def test_historial_insuficiente_no_rompe():
     assert detectar_anomalias(_pedidos_serie([5, 5, 5])) == []
+
+
+def test_welford_coincide_con_numpy_incluso_al_corregir_valores():
+    est = ads._nueva_estadistica()
+    valores = [random.Random(i).randint(0, 40) for i in range(200)]
+    for v in valores:
+        ads._agregar(est, v)
+    ads._quitar(est, valores[10])
+    ads._agregar(est, 99)
+    esperado = valores[:10] + valores[11:] + [99]
+    assert est['media'] == pytest.approx(np.mean(esperado))
+    assert ads._desviacion(est) == pytest.approx(np.std(esperado))
+
+
+def test_sincronizacion_incremental_equivale_a_recalcular_desde_cero():
+    conteos = [10, 11, 9, 0, 12, 9, 10, 11, 9, 10, 12, 9, 10, 11, 9, 10, 12, 9, 10, 11]
+    pedidos = _pedidos_serie(conteos)
+    ads.sincronizar_detector(pedidos[:150], 'v1')
+    ads.sincronizar_detector(pedidos, 'v2')
+    incremental = ads.puntaje_z_actual()
+
+    ads.reiniciar_detector()
+    ads.sincronizar_detector(pedidos, 'v2')
+    completo = ads.puntaje_z_actual()
+    assert incremental['z_score'] == pytest.approx(completo['z_score'])
+    assert incremental['dias_historial'] == completo['dias_historial'] == len(conteos) - 1
+    assert completo['media'] == pytest.approx(np.mean(conteos[:-1]))
+    assert ads.puntaje_z_actual(por_dia_semana=True)['dias_historial'] in (2, 3)
+
+
+def test_misma_version_de_datos_no_recorre_los_pedidos():
+    pedidos = _pedidos_serie([10, 11, 9, 10, 12, 9, 10] * 2 + [1])
+    primera = detectar_anomalias(pedidos, version_datos='v1')
+    assert primera and primera[0]['tipo'] == 'caida_pedidos'
+    assert detectar_anomalias(None, version_datos='v1') == primera
+
+
+def _pedidos_con_hora(dias, hoy, pedidos_hoy_por_hora=None):
+    """`dias` días cerrados antes de `hoy` con ~2-4 pedidos por hora entre
+    9 y 17, más los pedidos de hoy indicados {hora: cantidad}."""
+    rng = random.Random(7)
+    pedidos = []
+    for i in range(dias, 0, -1):
+        fecha = (hoy - timedelta(days=i)).strftime('%d-%m-%Y')
+        for hora in range(9, 18):
+            pedidos += [{'fecha': fecha, 'hora': f'{hora:02d}:15:00'}] * rng.randint(2, 4)
+    for hora, n in (pedidos_hoy_por_hora or {}).items():
+        pedidos += [{'fecha': hoy.strftime('%d-%m-%Y'), 'hora': f'{hora:02d}:05:00'}] * n
+    return pedidos
+
+
+def test_intradia_detecta_caida_a_media_jornada_y_no_alarma_un_dia_normal():
+    ahora = datetime(2026, 3, 11, 12, 30)
+    vacio = _pedidos_con_hora(42, ahora.date())
+    caida = ads.detectar_anomalias_intradia(vacio, version_datos='v1', ahora=ahora)
+    assert [a['tipo'] for a in caida] == ['caida_pedidos_intradia']
+    assert 'Hasta las 12:00 van 0 pedidos' in caida[0]['descripcion']
+
+    normal = _pedidos_con_hora(42, ahora.date(), {9: 3, 10: 3, 11: 3})
+    assert ads.detectar_anomalias_intradia(normal, version_datos='v2', ahora=ahora) == []
+    # Contra días completos, el mismo día a medio camino sí parece una caída.
+    assert ads.detectar_anomalias(normal)[0]['tipo'] == 'caida_pedidos'
+
+
+def test_intradia_usa_hora_de_chile_aunque_el_servidor_este_en_utc(monkeypatch):
+    # 15:30 UTC = 11:30 en Chile (UTC-4): la última hora completa es la de las 10
+    instante_utc = datetime(2026, 3, 11, 15, 30, tzinfo=timezone.utc)
+    pedidos = _pedidos_con_hora(42, instante_utc.date(), {9: 3, 10: 3, 12: 4})
+    ads.sincronizar_detector(pedidos, 'v1')
+
+    explicito = ads.puntaje_z_intradia(instante_utc)
+    assert explicito['hasta_hora'] == '11:00'
+    assert explicito['pedidos'] == 6
+
+    class RelojUTC(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return instante_utc.astimezone(tz) if tz else instante_utc.replace(tzinfo=None)
+
+    monkeypatch.setattr(ads, 'datetime', RelojUTC)
+    assert ads.puntaje_z_intradia() == explicito
+
+
+def test_intradia_sin_hora_o_con_poco_historial_devuelve_none():
+    ahora = datetime(2026, 3, 11, 12, 30)
+    sin_hora = [{k: v for k, v in p.items() if k != 'hora'} for p in _pedidos_con_hora(42, ahora.date())]
+    assert ads.detectar_anomalias_intradia(sin_hora, ahora=ahora) is None
+    ads.reiniciar_detector()
+    assert ads.detectar_anomalias_intradia(_pedidos_con_hora(10, ahora.date()), ahora=ahora) is None
+
+
+def test_linea_base_intradia_incremental_equivale_a_recalcular():
+    ahora = datetime(2026, 3, 11, 15, 0)
+    pedidos = _pedidos_con_hora(42, ahora.date(), {9: 2, 10: 5})
+    ads.sincronizar_detector(pedidos[:len(pedidos) // 2], 'v1')
+    ads.puntaje_z_intradia(ahora)  # cierra los días viejos
+    ads.sincronizar_detector(pedidos, 'v2')
+    incremental = ads.puntaje_z_intradia(ahora)
+
+    ads.reiniciar_detector()
+    ads.sincronizar_detector(pedidos, 'v2')
+    completo = ads.puntaje_z_intradia(ahora)
+    assert incremental['pedidos'] == completo['pedidos'] == 7
+    assert incremental['esperado'] == pytest.approx(completo['esperado'])
+    assert incremental['desviacion'] == pytest.approx(completo['desviacion'])
@@ -0,0 +1,52 @@
+import json
+
+import httpx
+
+import benchmark_chat
+from stub_openai_server import servidor_stub
+
+
+def test_stub_sigue_el_guion_de_tools_y_streaming():
+    guion = {"¿ventas?": {"rondas": [[{"name": "get_kpis", "arguments": {}}]], "respuesta": "Todo bien hoy"}}
+    with servidor_stub(guion, latencia_respuesta=0, latencia_primer_token=0, latencia_token=0) as (stub, url):
+        pregunta = {"model": "gpt-4o-mini", "tools": [{"type": "function"}],
+                    "messages": [{"role": "user", "content": "¿ventas?"}]}
+        primera = httpx.post(f"{url}/chat/completions", json=pregunta, trust_env=False).json()
+        llamada = primera["choices"][0]["message"]["tool_calls"][0]
+        assert llamada["function"]["name"] == "get_kpis"
+
+        pregunta["messages"] += [
+            {"role": "assistant", "content": None, "tool_calls": [llamada]},
+            {"role": "tool", "tool_call_id": llamada["id"], "content": "{}"},
+        ]
+        pregunta.update(stream=True, stream_options={"include_usage": True})
+        with httpx.stream("POST", f"{url}/chat/completions", json=pregunta, trust_env=False) as resp:
+            chunks = [json.loads(l[6:]) for l in resp.iter_lines() if l.startswith("data: {")]
+        texto = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        assert texto == "Todo bien hoy"
+        assert chunks[-1]["usage"]["prompt_tokens"] > 0
+        assert stub.solicitudes == 2
+
+
+def test_benchmark_corre_sin_red_y_reporta_metricas():
+    from data_adapter import data_adapter
+    from services import memo_service
+
+    version_previa = data_adapter.version_datos
+    conversaciones = [benchmark_chat.CONVERSACIONES[0][:1]] * 2
+    reporte = benchmark_chat.correr_benchmark(
+        clientes=40, meses=3, repeticiones=1, latencia_respuesta=0,
+        latencia_primer_token=0, latencia_token=0, conversaciones=conversaciones,
+    )
+
+    assert len(reporte["turnos"]) == 4
+    assert reporte["resumen"]["/chat/stream"]["segundos_primer_token"]["p50"] > 0
+    assert set(reporte["tools"]) == {"get_kpis", "get_customer_risk", "get_customer_segments"}
+    # La misma pregunta repetida sale del caché de respuestas
+    assert reporte["metricas"]["cache_respuestas"]["aciertos"] >= 1
+    assert all(t["tools"] for t in reporte["turnos"] if t["endpoint"] == "/chat/stream")
+
+    # Al salir, índice y cachés vuelven a describir los datos reales
+    assert data_adapter.version_datos == version_previa
+    assert not any(u.endswith("@sintetico.cl") for u in data_adapter.indice_por_usuario)
+    assert memo_service.estadisticas_memo()["entradas"] == 0
@@ -0,0 +1,34 @@
+"""Tests para benchmark_pronostico con un historial sintético chico."""
+import benchmark_pronostico as bench
+from services import demand_forecast_service as dfs
+
+
+def test_configuraciones_varian_un_eje_a_la_vez_o_todo_el_grid():
+    configs = bench.configuraciones()
+    assert configs[0] == bench.CONFIG_BASE
+    assert all(sum(c[k] != bench.CONFIG_BASE[k] for k in c) == 1 for c in configs[1:])
+    assert len(bench.configuraciones(grid_completo=True)) == 3 * 2 * 2 * 2
+
+
+def test_medicion_en_frio_reporta_etapas_y_no_toca_los_caches_reales():
+    ruta_modelos, parametros = dfs.RUTA_MODELOS, dfs.PARAMETROS_MODELO
+    pedidos = bench.generar_historial_sintetico(0.3, 10)
+    config = {'n_estimators': 20, 'horizonte': 7, 'folds': 3, 'modo': 'tres'}
+
+    medicion = bench.medir_configuracion(pedidos, config)
+
+    assert set(medicion['etapas']) == {
+        'construir_serie_diaria', 'agregar_features', 'entrenar_modelos',
+        'predecir_proximos_dias', 'validar_precision',
+    }
+    assert all(e['segundos'] >= 0 and e['memoria_pico_mb'] >= 0 for e in medicion['etapas'].values())
+    assert medicion['mape_holdout_pct'] is not None and medicion['mape_walk_forward_pct'] is not None
+    assert dfs.RUTA_MODELOS == ruta_modelos and dfs.PARAMETROS_MODELO is parametros
+
+
+def test_comparar_detecta_regresiones_de_tiempo_y_precision():
+    previo = {'anos_historial': 1, 'pedidos_por_dia': 20, 'config': bench.CONFIG_BASE,
+              'segundos_total': 1.0, 'mape_holdout_pct': 10.0, 'mape_walk_forward_pct': 12.0}
+    actual = {**previo, 'segundos_total': 1.5, 'mape_walk_forward_pct': 12.5}
+    regresiones = bench.comparar_resultados({'resultados': [previo]}, {'resultados': [actual]})
+    assert [r['metrica'] for r in regresiones] == ['segundos_total']
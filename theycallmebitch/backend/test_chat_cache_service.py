@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from services import chat_cache_service as ccs
+
+
+@pytest.fixture(autouse=True)
+def _cache_limpio():
+    ccs.limpiar_cache_chat()
+    yield
+    ccs.limpiar_cache_chat()
+
+
+def test_preguntas_equivalentes_comparten_clave_y_el_historial_la_distingue():
+    a = ccs.clave_pregunta("¿Cómo van  las ventas?", "daily")
+    b = ccs.clave_pregunta("como van las ventas", "daily")
+    assert a == b
+    con_historial = ccs.clave_pregunta("como van las ventas", "daily", [{"role": "user", "content": "en Ancud"}])
+    assert con_historial != a
+
+
+def test_version_nueva_invalida_y_ttl_expira(monkeypatch):
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        return f"respuesta {len(llamadas)}", True
+
+    clave = ccs.clave_pregunta("ventas", "general")
+    assert ccs.resolver(clave, "v1", calcular) == ("respuesta 1", "calculada")
+    assert ccs.resolver(clave, "v1", calcular) == ("respuesta 1", "cache")
+    assert ccs.resolver(clave, "v2", calcular) == ("respuesta 2", "calculada")
+
+    monkeypatch.setattr(ccs, "TTL_SEGUNDOS", 0)
+    assert ccs.resolver(clave, "v2", calcular) == ("respuesta 3", "calculada")
+
+    stats = ccs.estadisticas_cache_chat()
+    assert stats["aciertos"] == 1
+    assert stats["invalidadas"] == 1
+    assert stats["expiradas"] == 1
+
+
+def test_lru_acotado_y_respuestas_no_cacheables(monkeypatch):
+    monkeypatch.setattr(ccs, "MAX_ENTRADAS", 2)
+    for pregunta in ("a", "b", "c"):
+        ccs.resolver(ccs.clave_pregunta(pregunta, "general"), "v1", lambda: ("ok", True))
+    ccs.resolver(ccs.clave_pregunta("campaña", "campaign"), "v1", lambda: ("borrador", False))
+
+    stats = ccs.estadisticas_cache_chat()
+    assert stats["entradas"] == 2
+    assert stats["desalojos"] == 1
+    assert stats["no_cacheables"] == 1
+    assert ccs.resolver(ccs.clave_pregunta("a", "general"), "v1", lambda: ("nuevo", True))[1] == "calculada"
+
+
+def test_preguntas_identicas_en_vuelo_se_calculan_una_vez():
+    llamadas = []
+
+    def calcular():
+        llamadas.append(1)
+        time.sleep(0.2)
+        return "respuesta", True
+
+    clave = ccs.clave_pregunta("¿cuánto vendimos?", "daily")
+    resultados = []
+    hilos = [
+        threading.Thread(target=lambda: resultados.append(ccs.resolver(clave, "v1", calcular)))
+        for _ in range(4)
+    ]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert len(llamadas) == 1
+    assert sorted(origen for _, origen in resultados) == ["calculada", "coalescida", "coalescida", "coalescida"]
+    assert ccs.estadisticas_cache_chat()["tasa_aciertos"] == 0.75
+
+
+def test_respuestas_no_cacheables_en_vuelo_no_se_comparten():
+    en_calculo, liberar = threading.Event(), threading.Event()
+    contador = iter(range(100))
+
+    def calcular():
+        n = next(contador)
+        if n == 0:
+            en_calculo.set()
+            liberar.wait(5)
+        return f"borrador {n}", False
+
+    clave = ccs.clave_pregunta("redacta una campaña", "campaign")
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(ccs.resolver(clave, "v1", calcular))) for _ in range(3)]
+    hilos[0].start()
+    en_calculo.wait(5)
+    for h in hilos[1:]:
+        h.start()
+    time.sleep(0.05)
+    liberar.set()
+    for h in hilos:
+        h.join()
+
+    assert sorted(resultados) == [("borrador 0", "calculada"), ("borrador 1", "calculada"), ("borrador 2", "calculada")]
+    assert ccs.estadisticas_cache_chat()["coalescidas"] == 0
+
+
+def test_error_del_lider_no_se_propaga_a_las_consultas_en_espera():
+    en_calculo, liberar = threading.Event(), threading.Event()
+
+    def falla():
+        en_calculo.set()
+        liberar.wait(5)
+        raise TimeoutError("LLM")
+
+    clave = ccs.clave_pregunta("¿cuánto vendimos?", "daily")
+    errores, resultados = [], []
+
+    def lider():
+        try:
+            ccs.resolver(clave, "v1", falla)
+        except TimeoutError as e:
+            errores.append(e)
+
+    hilo = threading.Thread(target=lider)
+    hilo.start()
+    en_calculo.wait(5)
+    seguidor = threading.Thread(target=lambda: resultados.append(ccs.resolver(clave, "v1", lambda: ("ok", True))))
+    seguidor.start()
+    time.sleep(0.05)
+    liberar.set()
+    hilo.join()
+    seguidor.join()
+
+    assert len(errores) == 1
+    assert resultados == [("ok", "calculada")]
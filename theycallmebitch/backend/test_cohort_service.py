@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from services import cohort_service
+from services.cohort_service import calcular_cohortes, obtener_cohortes, recortar_cohortes
+
+HOY = datetime(2026, 4, 15)
+
+
+def _pedido(usuario, fecha, nombrelocal='Aguas Ancud'):
+    return {'usuario': usuario, 'fecha': fecha, 'precio': '2000', 'nombrelocal': nombrelocal}
+
+
+def _pedidos():
+    return [
+        # Cohorte 2026-01: 2 clientes
+        _pedido('ana@fluvi.cl', '05-01-2026'),
+        _pedido('ana@fluvi.cl', '20-01-2026'),   # segunda compra el mismo mes (15 días)
+        _pedido('ana@fluvi.cl', '10-03-2026'),
+        _pedido('bruno@fluvi.cl', '10-01-2026'),
+        _pedido('bruno@fluvi.cl', '12-02-2026'),  # segunda compra al mes 1 (33 días)
+        # Cohorte 2026-03: 1 cliente, nunca volvió
+        _pedido('carla@fluvi.cl', '01-03-2026'),
+        # Otro local: no cuenta
+        _pedido('otro@fluvi.cl', '01-01-2026', nombrelocal='Otro Local'),
+    ]
+
+
+def test_matriz_de_retencion_por_cohorte():
+    resultado = calcular_cohortes(_pedidos(), hoy=HOY)
+    enero, marzo = resultado['cohortes']
+
+    assert enero['cohorte'] == '2026-01' and enero['clientes'] == 2
+    # ene: ambos; feb: bruno; mar: ana; abr: nadie (mes en curso, observable)
+    assert enero['retencion_pct'] == [100.0, 50.0, 50.0, 0.0]
+    assert enero['recompra_acumulada_pct'] == [50.0, 100.0, 100.0, 100.0]
+
+    # marzo solo tiene observables marzo y abril
+    assert marzo['cohorte'] == '2026-03'
+    assert marzo['retencion_pct'] == [100.0, 0.0]
+    assert marzo['recompra_acumulada_pct'] == [0.0, 0.0]
+
+
+def test_retencion_promedio_pondera_solo_cohortes_que_llegaron_a_ese_mes():
+    resultado = calcular_cohortes(_pedidos(), hoy=HOY)
+    # mes 1: enero (1 de 2) + marzo (0 de 1) -> 1/3; mes 2 y 3: solo enero
+    assert resultado['retencion_promedio_pct'] == [100.0, 33.3, 50.0, 0.0]
+
+
+def test_activacion_es_una_celda_de_la_misma_pasada():
+    activacion = calcular_cohortes(_pedidos(), ventana_activacion_dias=30, hoy=HOY)['activacion']
+    assert activacion['clientes_evaluados'] == 3
+    assert activacion['clientes_activados'] == 1  # solo ana volvió dentro de 30 días
+    assert activacion['tasa_activacion_pct'] == 33.3
+    assert activacion['dias_promedio_segunda_compra'] == 15.0
+
+
+def test_obtener_cohortes_cachea_por_version(monkeypatch):
+    monkeypatch.setattr(cohort_service, '_cache_cohortes', {"clave": None, "resultado": None})
+    llamadas = []
+    original = cohort_service.calcular_cohortes
+
+    def contar(*args, **kwargs):
+        llamadas.append(1)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(cohort_service, 'calcular_cohortes', contar)
+    obtener_cohortes(_pedidos(), 'v1')
+    obtener_cohortes(_pedidos(), 'v1')
+    assert len(llamadas) == 1
+    obtener_cohortes(_pedidos(), 'v2')
+    assert len(llamadas) == 2
+
+
+def test_recortar_cohortes_no_recalcula():
+    resultado = calcular_cohortes(_pedidos(), hoy=HOY)
+    recorte = recortar_cohortes(resultado, horizonte_meses=2, ultimas_cohortes=1)
+    assert [c['cohorte'] for c in recorte['cohortes']] == ['2026-03']
+    assert recorte['retencion_promedio_pct'] == [100.0, 33.3]
+
+
+def test_lista_vacia_no_rompe():
+    resultado = calcular_cohortes([])
+    assert resultado['cohortes'] == []
+    assert resultado['activacion']['tasa_activacion_pct'] is None
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pytest
+
+from services import context_cache_service as ccs
+
+
+@pytest.fixture(autouse=True)
+def _contexto_limpio():
+    ccs.invalidar_contexto()
+    yield
+    ccs.invalidar_contexto()
+
+
+def _constructor(espera=0.0):
+    construcciones = []
+    listo = threading.Event()
+
+    def construir():
+        time.sleep(espera)
+        construcciones.append(1)
+        listo.set()
+        return {"ventas_mensuales": len(construcciones)}
+    return construir, construcciones, listo
+
+
+def test_misma_firma_no_reconstruye():
+    construir, construcciones, _ = _constructor()
+    firma = lambda: ("v1", None, 0, "2026-10-19")
+    assert ccs.obtener_contexto(construir, firma) == {"ventas_mensuales": 1}
+    assert ccs.obtener_contexto(construir, firma) == {"ventas_mensuales": 1}
+    assert len(construcciones) == 1
+
+
+def test_firma_nueva_devuelve_el_anterior_y_reconstruye_en_fondo():
+    construir, construcciones, listo = _constructor(espera=0.2)
+    firma = {"valor": ("v1",)}
+    ccs.obtener_contexto(construir, lambda: firma["valor"])
+    listo.clear()
+
+    firma["valor"] = ("v2",)
+    inicio = time.perf_counter()
+    contexto = ccs.obtener_contexto(construir, lambda: firma["valor"])
+    assert time.perf_counter() - inicio < 0.05
+    assert contexto == {"ventas_mensuales": 1}
+
+    assert listo.wait(2)
+    for _ in range(50):
+        if not ccs.estadisticas_contexto()["reconstruyendo"]:
+            break
+        time.sleep(0.01)
+    assert ccs.obtener_contexto(construir, lambda: firma["valor"]) == {"ventas_mensuales": 2}
+    assert len(construcciones) == 2
+
+
+def test_esperar_vigente_reconstruye_en_linea(monkeypatch):
+    construir, construcciones, _ = _constructor()
+    ccs.obtener_contexto(construir, lambda: ("v1",))
+    monkeypatch.setattr(ccs, "MAX_EDAD_SEGUNDOS", 0)
+    assert ccs.obtener_contexto(construir, lambda: ("v1",), esperar_vigente=True) == {"ventas_mensuales": 2}
+
+
+def test_escribir_en_la_memoria_cambia_la_firma(monkeypatch, tmp_path):
+    from services import memory_service
+    monkeypatch.setattr(memory_service, "DB_PATH", str(tmp_path / "memoria.db"))
+    memory_service.inicializar_db()
+    antes = ccs.firma_entradas("v1")
+    memory_service.guardar_recomendacion({"tipo": "draft_campaign_message", "descripcion": "x"})
+    assert ccs.firma_entradas("v1") != antes
+
+
+def test_datos_que_cambian_durante_la_construccion_no_quedan_como_vigentes():
+    firma = {"datos": "v1", "clima": None}
+    construcciones = []
+
+    def construir():
+        construcciones.append(1)
+        if len(construcciones) == 1:
+            # Llegan pedidos nuevos y se refresca el clima mientras se arma
+            firma.update(datos="v2", clima=123.0)
+        return {"ventas_mensuales": len(construcciones)}
+
+    obtener_firma = lambda: (firma["datos"], firma["clima"], 0, "2026-10-19")
+    ccs.obtener_contexto(construir, obtener_firma)
+    assert ccs._estado["firma"] == ("v1", 123.0, 0, "2026-10-19")
+
+    assert ccs.obtener_contexto(construir, obtener_firma, esperar_vigente=True) == {"ventas_mensuales": 2}
+    assert ccs.obtener_contexto(construir, obtener_firma) == {"ventas_mensuales": 2}
+    assert len(construcciones) == 2
@@ -0,0 +1,71 @@
+import pytest
+
+from services import conversation_summary_service as css
+
+
+@pytest.fixture(autouse=True)
+def _sin_resumenes():
+    css.limpiar_resumenes()
+    yield
+    css.limpiar_resumenes()
+
+
+def _turnos(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"mensaje {i}"} for i in range(n)]
+
+
+def test_resumen_se_extiende_con_los_turnos_nuevos():
+    llamadas = []
+
+    def resumir(previo, nuevos):
+        llamadas.append((previo, [m["content"] for m in nuevos]))
+        return f"resumen de {len(nuevos)} (previo: {previo})"
+
+    css.programar_resumen(_turnos(4), resumir, en_segundo_plano=False)
+    assert css.obtener_resumen(_turnos(4)) == ("resumen de 4 (previo: None)", 4)
+
+    # Turno siguiente: mismo prefijo + 2 mensajes — solo se resumen los nuevos
+    resumen, cubiertos = css.obtener_resumen(_turnos(6))
+    assert cubiertos == 4
+    css.programar_resumen(_turnos(6), resumir, en_segundo_plano=False)
+    assert llamadas[-1] == ("resumen de 4 (previo: None)", ["mensaje 4", "mensaje 5"])
+    assert css.obtener_resumen(_turnos(6))[1] == 6
+
+    stats = css.estadisticas_resumenes()
+    assert stats["generados"] == 2
+    assert stats["parciales"] == 1
+
+
+def test_prefijo_distinto_no_reutiliza_resumen():
+    css.programar_resumen(_turnos(4), lambda previo, nuevos: "r", en_segundo_plano=False)
+    otros = [{"role": "user", "content": "otra conversación"}] + _turnos(4)[1:]
+    assert css.obtener_resumen(otros) == (None, 0)
+
+
+def test_compress_no_llama_al_llm_en_linea(monkeypatch):
+    from services import ai_engine
+    programados = []
+    monkeypatch.setattr(
+        ai_engine, "programar_resumen",
+        lambda mensajes, resumir: programados.append(len(mensajes)),
+    )
+    largo = "x" * 3000
+    conversation = (
+        [{"role": "system", "content": "prompt"}]
+        + [{"role": "user", "content": largo} for _ in range(20)]
+        + [{"role": "system", "content": "contexto"}, {"role": "user", "content": "¿y hoy?"}]
+    )
+
+    comprimida = ai_engine._compress_if_needed(conversation)
+
+    # Sin resumen aún: los turnos viejos no caben y se omiten; el resumen
+    # queda programado para el próximo mensaje
+    assert programados == [len(conversation) - 9]
+    assert comprimida[0]["content"] == "prompt"
+    assert comprimida[-1]["content"] == "¿y hoy?"
+    assert len(comprimida) == 9
+
+    css.programar_resumen(conversation[1:-8], lambda previo, nuevos: "Ventas estables.", en_segundo_plano=False)
+    comprimida = ai_engine._compress_if_needed(conversation)
+    assert comprimida[1]["content"] == "[Resumen de conversación anterior: Ventas estables.]"
+    assert len(programados) == 1
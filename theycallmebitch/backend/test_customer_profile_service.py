@@ -59,3 +59,27 @@ def test_pedido_sin_usuario_se_ignora():
     pedidos = [_pedido('', '01-01-2025'), _pedido('ana@fluvi.cl', '01-01-2025')]
     perfiles = construir_perfiles_clientes(pedidos)
     assert len(perfiles) == 1
+
+
+def test_ficha_cliente_reune_pedidos_cadencia_y_ubicacion():
+    from services.customer_profile_service import construir_ficha_cliente
+    pedidos = [
+        {**_pedido('ana@fluvi.cl', '01-01-2026'), 'lat': '', 'lon': ''},
+        {**_pedido('ana@fluvi.cl', '11-01-2026'), 'lat': '-33.57', 'lon': '-70.58'},
+        {**_pedido('ana@fluvi.cl', '31-01-2026'), 'lat': '', 'lon': ''},
+    ]
+    riesgo = {'estado': 'en_riesgo', 'dias_atraso': 4, 'probabilidad_reorden': 0.5, 'valor_en_juego': 1000}
+    ficha = construir_ficha_cliente('ana@fluvi.cl', pedidos, segmento='leal', riesgo=riesgo)
+    assert ficha['pedidos'] == 3
+    assert ficha['segmento_rfm'] == 'leal'
+    assert ficha['riesgo']['estado'] == 'en_riesgo'
+    assert ficha['cadencia']['ultimos_intervalos_dias'] == [10, 20]
+    assert ficha['cadencia']['mediana_dias'] == 15.0
+    assert ficha['ubicacion'] == {'lat': -33.57, 'lon': -70.58, 'direccion': 'calle 1', 'fuente': 'pedido'}
+    assert [p['fecha'] for p in ficha['historial_pedidos']] == ['31-01-2026', '11-01-2026', '01-01-2026']
+    assert 'pedidos_evaluados' in ficha['sla']
+
+
+def test_ficha_cliente_sin_pedidos_validos_es_none():
+    from services.customer_profile_service import construir_ficha_cliente
+    assert construir_ficha_cliente('nadie@fluvi.cl', []) is None
@@ -0,0 +1,119 @@
+import pytest
+
+from services import customer_search_service
+from services.customer_search_service import (
+    buscar_clientes,
+    direcciones_similares,
+    resolver_usuario,
+    sincronizar_indice,
+)
+
+
+def _pedido(usuario, fecha, dire='calle 1', telefonou='912345678', nombrelocal='Aguas Ancud'):
+    return {'usuario': usuario, 'fecha': fecha, 'dire': dire, 'telefonou': telefonou, 'nombrelocal': nombrelocal}
+
+
+@pytest.fixture(autouse=True)
+def indice_vacio(monkeypatch):
+    monkeypatch.setattr(customer_search_service, '_indice', {
+        "version": None, "documentos": {},
+        "postings": customer_search_service.defaultdict(set), "tamanos": {},
+    })
+
+
+def _pedidos_base():
+    return [
+        _pedido('ana.perez@fluvi.cl', '01-01-2026', dire='Pasaje Los Álamos 1234', telefonou='+56 9 1111 2222'),
+        _pedido('bruno@fluvi.cl', '02-01-2026', dire='Avenida Lago Ranco 55', telefonou='933334444'),
+        _pedido('carla@fluvi.cl', '03-01-2026', dire='Calle Ñuble 890', telefonou='955556666'),
+    ]
+
+
+def test_busqueda_tolera_typos_y_tildes():
+    sincronizar_indice(_pedidos_base(), 'v1')
+    assert buscar_clientes('lago rnco')[0]['usuario'] == 'bruno@fluvi.cl'
+    assert buscar_clientes('los alamos')[0]['usuario'] == 'ana.perez@fluvi.cl'
+    assert buscar_clientes('nuble')[0]['usuario'] == 'carla@fluvi.cl'
+
+
+def test_busca_por_telefono_ignorando_formato():
+    sincronizar_indice(_pedidos_base(), 'v1')
+    resultado = buscar_clientes('9 1111 2222')[0]
+    assert resultado['usuario'] == 'ana.perez@fluvi.cl'
+    assert resultado['campo'] == 'telefono'
+
+
+def test_ranking_pone_primero_la_coincidencia_mas_completa():
+    pedidos = _pedidos_base() + [_pedido('diego@fluvi.cl', '04-01-2026', dire='Avenida Lago Ranco Sur 55')]
+    sincronizar_indice(pedidos, 'v1')
+    resultados = buscar_clientes('avenida lago ranco 55')
+    assert [r['usuario'] for r in resultados[:2]] == ['bruno@fluvi.cl', 'diego@fluvi.cl']
+    assert resultados[0]['puntaje'] > resultados[1]['puntaje']
+
+
+def test_usa_el_contacto_del_pedido_mas_reciente():
+    pedidos = [
+        _pedido('ana@fluvi.cl', '01-01-2025', dire='Direccion Vieja 1'),
+        _pedido('ana@fluvi.cl', '15-06-2026', dire='Direccion Nueva 2'),
+    ]
+    sincronizar_indice(pedidos, 'v1')
+    assert buscar_clientes('direccion nueva')[0]['direccion'] == 'Direccion Nueva 2'
+
+
+def test_sincronizacion_incremental_solo_toca_clientes_cambiados():
+    pedidos = _pedidos_base()
+    sincronizar_indice(pedidos, 'v1')
+    assert sincronizar_indice(pedidos, 'v1') == {"agregados": 0, "actualizados": 0, "eliminados": 0}
+
+    pedidos_v2 = pedidos[1:] + [
+        _pedido('bruno@fluvi.cl', '10-02-2026', dire='Camino Real 77', telefonou='933334444'),
+        _pedido('elena@fluvi.cl', '11-02-2026', dire='Los Aromos 12'),
+    ]
+    cambios = sincronizar_indice(pedidos_v2, 'v2')
+    assert cambios == {"agregados": 1, "actualizados": 1, "eliminados": 1}
+    assert buscar_clientes('lago ranco') == []
+    assert buscar_clientes('camino real')[0]['usuario'] == 'bruno@fluvi.cl'
+    assert all(r['usuario'] != 'ana.perez@fluvi.cl' for r in buscar_clientes('alamos'))
+
+
+def test_resolver_usuario_y_direcciones_similares():
+    sincronizar_indice(_pedidos_base(), 'v1')
+    assert resolver_usuario('carla@fluvi.cl') == 'carla@fluvi.cl'
+    assert resolver_usuario('ana perez') == 'ana.perez@fluvi.cl'
+    assert resolver_usuario('zzz qqq') is None
+    assert direcciones_similares('pasaje los alamos 1234') == ['Pasaje Los Álamos 1234']
+    assert direcciones_similares('Calle Lejana 1') == []
+    # Misma calle, otro número: no es la misma dirección
+    assert direcciones_similares('Avenida Lago Ranco 5') == []
+    assert direcciones_similares('avenida lago ranco 55') == ['Avenida Lago Ranco 55']
+
+
+def test_sincronizar_y_buscar_en_paralelo_no_rompe_el_indice():
+    import threading
+
+    con_ana = _pedidos_base()
+    sin_ana = _pedidos_base()[1:] + [_pedido(f'cliente{i}@fluvi.cl', '04-01-2026', dire=f'Calle Ñuble {i}') for i in range(50)]
+    errores = []
+
+    def sincronizar(n):
+        try:
+            for i in range(60):
+                sincronizar_indice(con_ana if (i + n) % 2 else sin_ana, f'v{(i + n) % 2}')
+        except Exception as e:
+            errores.append(e)
+
+    def buscar():
+        try:
+            for _ in range(200):
+                buscar_clientes('calle nuble')
+                resolver_usuario('ana perez')
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=sincronizar, args=(n,)) for n in range(2)] + [threading.Thread(target=buscar) for _ in range(2)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert errores == []
@@ -0,0 +1,45 @@
+from datetime import datetime
+
+from data_adapter import DataAdapter
+
+
+def _adapter_con_cache(pedidos):
+    adapter = DataAdapter()
+    adapter.pedidos_antiguos_cache = pedidos
+    adapter.cache_timestamp = datetime.now().timestamp()
+    adapter._indexar_pedidos(pedidos)
+    return adapter
+
+
+def test_indice_por_usuario_devuelve_solo_los_pedidos_del_cliente():
+    pedidos = [
+        {'id': '1', 'usuario': 'ana@fluvi.cl', 'fecha': '01-01-2026'},
+        {'id': '2', 'usuario': 'beto@fluvi.cl', 'fecha': '02-01-2026'},
+        {'id': '3', 'usuario': 'ana@fluvi.cl', 'fecha': '03-01-2026'},
+        {'id': '4', 'usuario': '', 'fecha': '04-01-2026'},
+    ]
+    adapter = _adapter_con_cache(pedidos)
+    assert [p['id'] for p in adapter.obtener_pedidos_de_usuario('ana@fluvi.cl')] == ['1', '3']
+    assert adapter.obtener_pedidos_de_usuario('nadie@fluvi.cl') == []
+    assert '' not in adapter.indice_por_usuario
+
+
+def test_version_de_datos_solo_cambia_si_cambian_los_pedidos():
+    pedidos = [{'id': '1', 'usuario': 'ana@fluvi.cl', 'fecha': '01-01-2026', 'status': 'pendiente'}]
+    version_inicial = _adapter_con_cache(pedidos).version_datos
+    assert _adapter_con_cache([dict(p) for p in pedidos]).version_datos == version_inicial
+    pedidos[0]['status'] = 'entregado'
+    assert _adapter_con_cache(pedidos).version_datos != version_inicial
+
+
+def test_indexar_pone_al_dia_el_indice_de_busqueda(monkeypatch):
+    from collections import defaultdict
+    from services import customer_search_service
+    monkeypatch.setattr(customer_search_service, '_indice', {
+        "version": None, "documentos": {}, "postings": defaultdict(set), "tamanos": {},
+    })
+
+    _adapter_con_cache([{'id': '1', 'usuario': 'ana@fluvi.cl', 'fecha': '01-01-2026', 'dire': 'Pasaje Los Álamos 1234'}])
+
+    # Sin pasar por /clientes/buscar, el geocoding ya encuentra la dirección
+    assert customer_search_service.direcciones_similares('pasaje los alamos 1234') == ['Pasaje Los Álamos 1234']
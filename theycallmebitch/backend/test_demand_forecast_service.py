@@ -1,6 +1,8 @@
 """Tests para demand_forecast_service. Usa datos sintéticos deterministas,
 no llama a ninguna API externa."""
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
 import pytest
 from services import demand_forecast_service as dfs
 
@@ -80,3 +82,151 @@ def test_validar_precision_con_poco_historial_devuelve_none():
     pedidos = _pedidos_sinteticos(dias=20)
     resultado = dfs.validar_precision(pedidos, dias_test=30)
     assert resultado == {'mape_pct': None, 'dias_evaluados': 0}
+
+
+@pytest.fixture(autouse=True)
+def modelos_aislados(tmp_path, monkeypatch):
+    monkeypatch.setattr(dfs, 'RUTA_MODELOS', str(tmp_path))
+    monkeypatch.setattr(dfs, '_modelos_en_memoria', {})
+    monkeypatch.setattr(dfs, 'RUTA_FOLDS', str(tmp_path / 'folds.json'))
+    monkeypatch.setattr(dfs, '_folds', None)
+    return tmp_path
+
+
+def test_modelos_se_reutilizan_desde_disco_sin_reentrenar(modelos_aislados, monkeypatch):
+    pedidos = _pedidos_sinteticos(dias=60)
+    primera = dfs.predecir_proximos_dias(pedidos, dias=7)
+    assert len(list(modelos_aislados.glob('*.json'))) == len(dfs._nombres_modelos(dfs.MODO_CUANTILES))
+
+    # Simula un reinicio: sin modelos en memoria y sin permitir entrenar.
+    monkeypatch.setattr(dfs, '_modelos_en_memoria', {})
+    monkeypatch.setattr(dfs, 'entrenar_modelos', lambda *_: pytest.fail('no debía reentrenar'))
+    assert dfs.predecir_proximos_dias(pedidos, dias=7) == primera
+
+
+def test_modelos_se_reentrenan_si_cambia_el_historial(modelos_aislados):
+    pedidos = _pedidos_sinteticos(dias=60)
+    serie = dfs.construir_serie_diaria(pedidos)
+    serie_con_un_dia_mas = dfs.construir_serie_diaria(_pedidos_sinteticos(dias=61))
+    assert dfs.huella_entrenamiento(serie) == dfs.huella_entrenamiento(serie.copy())
+    assert dfs.huella_entrenamiento(serie) != dfs.huella_entrenamiento(serie_con_un_dia_mas)
+
+    dfs.obtener_modelos(serie)
+    dfs.obtener_modelos(serie_con_un_dia_mas)
+    assert len(list(modelos_aislados.glob('*.json'))) == 2 * len(dfs._nombres_modelos(dfs.MODO_CUANTILES))
+
+
+def test_validar_precision_solo_calcula_el_fold_del_dia_nuevo(monkeypatch):
+    calculados = []
+    calcular_original = dfs._calcular_folds
+
+    def registrar(tareas):
+        calculados.append(len(tareas))
+        return calcular_original(tareas)
+
+    monkeypatch.setattr(dfs, '_calcular_folds', registrar)
+    primera = dfs.validar_precision(_pedidos_sinteticos(dias=90), dias_test=20)
+    assert calculados == [20]
+
+    # Reinicio: los folds se leen de disco, no se recalcula nada.
+    monkeypatch.setattr(dfs, '_folds', None)
+    assert dfs.validar_precision(_pedidos_sinteticos(dias=90), dias_test=20) == primera
+    assert calculados == [20]
+
+    dfs.validar_precision(_pedidos_sinteticos(dias=91), dias_test=20)
+    assert calculados == [20, 1]
+
+
+def test_validar_precision_en_paralelo_coincide_con_serie(monkeypatch):
+    pedidos = _pedidos_sinteticos(dias=90)
+    en_paralelo = dfs.validar_precision(pedidos, dias_test=6)
+
+    monkeypatch.setattr(dfs, '_folds', {})
+    monkeypatch.setattr(dfs, 'MIN_FOLDS_PARALELO', 10 ** 6)
+    assert dfs.validar_precision(pedidos, dias_test=6) == en_paralelo
+
+
+def test_validaciones_simultaneas_no_pierden_folds_ni_rompen_el_archivo(monkeypatch, modelos_aislados):
+    import json
+    import threading
+    import time
+
+    def calcular(tareas):
+        time.sleep(0.01)
+        return [float(len(train)) for train, _ in tareas]
+
+    monkeypatch.setattr(dfs, '_calcular_folds', calcular)
+    # Cada guardado descarta folds que la otra validación está usando
+    monkeypatch.setattr(dfs, 'MAX_FOLDS_GUARDADOS', 5)
+    historiales = [_pedidos_sinteticos(dias=90 + i) for i in range(4)]
+    esperados = [dfs.validar_precision(p, dias_test=10) for p in historiales]
+    monkeypatch.setattr(dfs, '_folds', {})
+
+    resultados, errores = {}, []
+
+    def validar(n):
+        try:
+            for _ in range(5):
+                resultados[n] = dfs.validar_precision(historiales[n], dias_test=10)
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=validar, args=(n,)) for n in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert errores == []
+    assert [resultados[n] for n in range(4)] == esperados
+    with open(modelos_aislados / 'folds.json', encoding='utf-8') as f:
+        assert len(json.load(f)) <= 5
+
+
+def test_features_recursivas_coinciden_con_agregar_features(monkeypatch):
+    """Las sumas móviles del pronóstico recursivo deben dar exactamente las
+    mismas features que recalcular `agregar_features` sobre la serie
+    extendida con las medianas ya pronosticadas."""
+    filas = []
+
+    class ModeloFijo:
+        def __init__(self, valor):
+            self.valor = valor
+
+        def predict(self, X):
+            if self.valor == 5.0:
+                filas.append(X[0].copy())
+            return [self.valor]
+
+    monkeypatch.setattr(dfs, 'obtener_modelos', lambda _serie: {
+        'p10': ModeloFijo(3.0), 'p50': ModeloFijo(5.0), 'p90': ModeloFijo(8.0),
+    })
+    pedidos = _pedidos_sinteticos(dias=40)
+    predicciones = dfs.predecir_proximos_dias(pedidos, dias=10)
+
+    serie = dfs.construir_serie_diaria(pedidos)
+    extendida = pd.concat([serie, pd.DataFrame({
+        'fecha': [datetime.strptime(p['fecha'], '%Y-%m-%d').date() for p in predicciones],
+        'pedidos': [p['p50'] for p in predicciones],
+    })], ignore_index=True)
+    esperadas = dfs.agregar_features(extendida)[dfs.FEATURES].iloc[len(serie):].to_numpy()
+    assert np.allclose(np.array(filas), esperadas)
+
+
+def test_modelo_multicuantil_entrega_los_tres_cuantiles_en_una_llamada():
+    features = dfs.agregar_features(dfs.construir_serie_diaria(_pedidos_sinteticos(dias=60)))
+    modelos = dfs.entrenar_modelos(features, 'multi')
+    assert list(modelos) == ['cuantiles']
+    predicciones = dfs.predecir_cuantiles(modelos, features[dfs.FEATURES].to_numpy())
+    assert predicciones.shape == (len(features), 3)
+
+
+def test_modo_tres_modelos_sigue_disponible_para_comparar(monkeypatch):
+    monkeypatch.setattr(dfs, 'MODO_CUANTILES', 'tres')
+    predicciones = dfs.predecir_proximos_dias(_pedidos_sinteticos(dias=60), dias=7)
+    assert len(predicciones) == 7
+    assert all(d['p10'] <= d['p50'] <= d['p90'] for d in predicciones)
+
+    comparacion = dfs.comparar_modos_cuantiles(_pedidos_sinteticos(dias=60))
+    assert set(comparacion) == {'multi', 'tres'}
+    assert set(comparacion['multi']['cobertura']) == set(dfs.QUANTILES)
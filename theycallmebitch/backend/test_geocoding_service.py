@@ -0,0 +1,12 @@
+from services import geocoding_service
+
+
+def test_coordenadas_prestadas_no_quedan_en_disco(monkeypatch):
+    guardados = []
+    monkeypatch.setattr(geocoding_service, '_cache', {'avenida lago ranco 1234': {'lat': -33.5, 'lon': -70.6}})
+    monkeypatch.setattr(geocoding_service, '_guardar_cache', lambda: guardados.append(True))
+    monkeypatch.setattr(geocoding_service, 'direcciones_similares', lambda d: ['Avenida Lago Ranco 1234'])
+
+    assert geocoding_service.geocodificar('Av. Lago Ranko 1234') == {'lat': -33.5, 'lon': -70.6}
+    assert 'av. lago ranko 1234' not in geocoding_service._cache
+    assert guardados == []
@@ -0,0 +1,107 @@
+"""Tests para hierarchical_forecast_service. Datos sintéticos, sin red."""
+from datetime import date, timedelta
+
+import pytest
+
+from services import demand_forecast_service as dfs
+from services import hierarchical_forecast_service as hfs
+
+
+@pytest.fixture(autouse=True)
+def caches_aislados(tmp_path, monkeypatch):
+    monkeypatch.setattr(dfs, 'RUTA_MODELOS', str(tmp_path / 'modelos'))
+    monkeypatch.setattr(dfs, '_modelos_en_memoria', {})
+    monkeypatch.setattr(hfs, 'RUTA_CACHE', str(tmp_path / 'jerarquico.json'))
+    monkeypatch.setattr(hfs, '_cache', None)
+    monkeypatch.setattr(hfs, 'MIN_PEDIDOS_ZONA', 30)
+    # Sin pool de procesos en los tests: mismo resultado, sin costo de arranque.
+    monkeypatch.setattr(hfs, '_pronosticar_todas', lambda tareas, dias, fecha_fin: {
+        clave: hfs._pronosticar_serie(fechas, dias, fecha_fin) for clave, fechas in tareas.items()
+    })
+
+
+def _pedidos(dias=45):
+    pedidos = []
+    inicio = date.today() - timedelta(days=dias)
+    for i in range(dias):
+        fecha = (inicio + timedelta(days=i)).strftime('%d-%m-%Y')
+        pedidos += [{'fecha': fecha, 'nombrelocal': 'Aguas Ancud', 'retirolocal': 'si', 'dire': ''}] * 2
+        pedidos += [{'fecha': fecha, 'nombrelocal': 'Aguas Ancud', 'retirolocal': 'no', 'dire': 'Av. Macul 123'}] * 3
+        pedidos += [{'fecha': fecha, 'nombrelocal': 'Aguas Ancud', 'retirolocal': 'no', 'dire': 'La Florida 456'}]
+        if i % 15 == 0:
+            pedidos.append({'fecha': fecha, 'nombrelocal': 'Aguas Ancud', 'retirolocal': 'no', 'dire': 'Tobalaba 1'})
+    return pedidos
+
+
+def test_agrupar_series_por_canal_y_zona_con_zonas_chicas_en_otras():
+    series = hfs.agrupar_series(_pedidos())
+    assert set(series['canales']) == {'local', 'domicilio'}
+    assert len(series['canales']['local']) == 90
+    # Tobalaba es Macul; la_florida (45 pedidos) queda; sin_direccion es el retiro en local
+    assert set(series['zonas']) == {'macul', 'la_florida', 'sin_direccion'}
+    assert sum(len(f) for f in series['zonas'].values()) == len(series['total']['total'])
+
+
+def test_reconciliar_hace_que_las_medianas_de_los_hijos_sumen_el_total():
+    total = [{'fecha': '2026-01-01', 'p10': 8.0, 'p50': 10.0, 'p90': 12.0}]
+    hijos = {
+        'a': [{'fecha': '2026-01-01', 'p10': 2.0, 'p50': 3.0, 'p90': 4.0}],
+        'b': [{'fecha': '2026-01-01', 'p10': 4.0, 'p50': 5.0, 'p90': 6.0}],
+        'sin_historial': [],
+    }
+    reconciliados = hfs.reconciliar(total, hijos)
+    assert reconciliados['a'][0]['p50'] + reconciliados['b'][0]['p50'] == pytest.approx(10.0, abs=0.1)
+    assert reconciliados['a'][0]['p90'] == pytest.approx(5.0)
+    assert reconciliados['sin_historial'][0]['p50'] == 0.0
+
+
+def test_actualizar_guarda_y_sirve_desde_cache(monkeypatch):
+    resultado = hfs.actualizar_pronostico_jerarquico(_pedidos(), 'v1')
+    assert len(resultado['total']) == hfs.DIAS_HORIZONTE
+    for nivel in ('canales', 'zonas'):
+        for i, dia in enumerate(resultado['total']):
+            suma = sum(serie[i]['p50'] for serie in resultado[nivel].values())
+            assert suma == pytest.approx(dia['p50'], abs=0.3)
+    assert hfs.esta_vigente('v1') and not hfs.esta_vigente('v2')
+
+    # Otro proceso (reinicio): lee de disco sin recalcular.
+    monkeypatch.setattr(hfs, '_cache', None)
+    monkeypatch.setattr(hfs, 'calcular_pronostico_jerarquico', lambda *_: pytest.fail('no debía recalcular'))
+    assert hfs.actualizar_pronostico_jerarquico(_pedidos(), 'v1')['calculado_en'] == resultado['calculado_en']
+    assert hfs.obtener_pronostico_jerarquico()['version_datos'] == 'v1'
+
+
+def test_hijo_sin_pronostico_recibe_su_participacion_historica_no_una_parte_igual():
+    total = [{'fecha': '2026-01-01', 'p10': 80.0, 'p50': 100.0, 'p90': 120.0}]
+    hijos = {
+        'principal': [{'fecha': '2026-01-01', 'p10': 70.0, 'p50': 90.0, 'p90': 110.0}],
+        'casi_vacia': [],
+    }
+    participaciones = {'principal': 0.95, 'casi_vacia': 0.05}
+    reconciliados = hfs.reconciliar(total, hijos, participaciones)
+    assert reconciliados['casi_vacia'][0]['p50'] == pytest.approx(5.0)
+    assert reconciliados['principal'][0]['p50'] == pytest.approx(95.0)
+
+    # Ningún hijo con señal: el total se reparte por participación, no 50/50.
+    hijos['principal'] = [{'fecha': '2026-01-01', 'p10': 0.0, 'p50': 0.0, 'p90': 0.0}]
+    reconciliados = hfs.reconciliar(total, hijos, participaciones)
+    assert reconciliados['principal'][0]['p50'] == pytest.approx(95.0)
+    assert reconciliados['casi_vacia'][0]['p90'] == pytest.approx(6.0)
+
+
+def test_participaciones_historicas_usan_la_ventana_reciente():
+    fin = date(2026, 3, 31)
+
+    def dia(atras):
+        return (fin - timedelta(days=atras)).strftime('%d-%m-%Y')
+
+    fechas = {
+        'principal': [dia(1)] * 9 + [dia(100)] * 50,
+        'casi_vacia': [dia(2)],
+        'antigua': [dia(200)] * 40,
+    }
+    participaciones = hfs.participaciones_historicas(fechas, fin, dias=28)
+    assert participaciones == pytest.approx({'principal': 0.9, 'casi_vacia': 0.1, 'antigua': 0.0})
+
+    # Sin pedidos en la ventana: se usa todo el historial.
+    assert hfs.participaciones_historicas({'a': [dia(100)], 'b': [dia(100)] * 3}, fin)['b'] == pytest.approx(0.75)
@@ -1,7 +1,10 @@
+import pytest
+
+
 def test_loop_no_llama_a_openai_si_no_hay_anomalias(monkeypatch):
     from main import _decidir_si_generar_insight
     import services.anomaly_detection_service as ads
-    monkeypatch.setattr(ads, "detectar_anomalias", lambda pedidos: [])
+    monkeypatch.setattr(ads, "detectar_anomalias", lambda pedidos, **_: [])
     llamo_openai = {"valor": False}
     def fake_run_autonomous_insight(context):
         llamo_openai["valor"] = True
@@ -13,7 +16,20 @@ def test_loop_no_llama_a_openai_si_no_hay_anomalias(monkeypatch):
 def test_loop_llama_a_openai_si_hay_anomalia_real(monkeypatch):
     from main import _decidir_si_generar_insight
     import services.anomaly_detection_service as ads
-    monkeypatch.setattr(ads, "detectar_anomalias", lambda pedidos: [{"tipo": "caida_pedidos"}])
+    monkeypatch.setattr(ads, "detectar_anomalias", lambda pedidos, **_: [{"tipo": "caida_pedidos"}])
+    llamo_openai = {"valor": False}
+    def fake_run_autonomous_insight(context):
+        llamo_openai["valor"] = True
+        return []
+    _decidir_si_generar_insight([], fake_run_autonomous_insight, {})
+    assert llamo_openai["valor"] is True
+
+
+def test_loop_usa_la_linea_base_intradia_cuando_existe(monkeypatch):
+    from main import _decidir_si_generar_insight
+    import services.anomaly_detection_service as ads
+    monkeypatch.setattr(ads, "detectar_anomalias_intradia", lambda pedidos, **_: [{"tipo": "caida_pedidos_intradia"}])
+    monkeypatch.setattr(ads, "detectar_anomalias", lambda pedidos, **_: pytest.fail("no debía usar la serie diaria"))
     llamo_openai = {"valor": False}
     def fake_run_autonomous_insight(context):
         llamo_openai["valor"] = True
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+
+def _eventos(texto):
+    return [json.loads(l[6:]) for l in texto.splitlines() if l.startswith("data: ") and l != "data: [DONE]"]
+
+
+def _preparar(monkeypatch, tokens, espera_token=0, esperar_sugeridas_tras=None):
+    """Con `esperar_sugeridas_tras=n`, el stream no entrega el token n+1
+    hasta que las preguntas sugeridas estén listas."""
+    import main
+    monkeypatch.setattr(main.data_adapter, "obtener_pedidos_combinados", lambda: [])
+    monkeypatch.setattr(main, "_build_full_context", lambda: {})
+
+    async def prepare(context, message, history, pedidos):
+        return [{"role": "user", "content": message}], [], None
+
+    # El Event se crea dentro del loop de la app (Python 3.9 lo ata al crearlo)
+    eventos = {}
+
+    def sugeridas_listas():
+        return eventos.setdefault("listas", asyncio.Event())
+
+    async def stream(conversation):
+        for i, t in enumerate(tokens):
+            if i == esperar_sugeridas_tras:
+                await asyncio.wait_for(sugeridas_listas().wait(), 5)
+            await asyncio.sleep(espera_token)
+            yield t
+
+    pedidas_con = []
+
+    async def sugeridas(question, respuesta):
+        pedidas_con.append(respuesta)
+        sugeridas_listas().set()
+        return ["¿Y en Ancud?", "¿Y el mes pasado?", "¿Qué hago?"]
+
+    monkeypatch.setattr(main, "run_chat_query_prepare_async", prepare)
+    monkeypatch.setattr(main, "stream_respuesta", stream)
+    monkeypatch.setattr(main, "generar_preguntas_sugeridas", sugeridas)
+    monkeypatch.setattr(main, "CARACTERES_PREGUNTAS_SUGERIDAS", 15)
+    return TestClient(main.app), pedidas_con
+
+
+def test_sugeridas_se_piden_durante_el_stream_y_no_alargan_la_respuesta(monkeypatch):
+    tokens = ["Las ventas ", "subieron ", "un 12% ", "esta semana ", "en Ancud."] * 4
+    # Si las sugeridas se pidieran recién al terminar, el stream se quedaría
+    # esperando en el token 3 y wait_for cortaría la respuesta.
+    client, pedidas_con = _preparar(monkeypatch, tokens, espera_token=0.01, esperar_sugeridas_tras=3)
+
+    resp = client.post("/chat/stream", json={"message": "¿cómo vamos?", "history": []})
+
+    eventos = _eventos(resp.text)
+    assert "".join(e["token"] for e in eventos if "token" in e) == "".join(tokens)
+    # Se pidieron con el comienzo de la respuesta, no con la respuesta completa
+    assert pedidas_con == ["Las ventas subieron "]
+    # Y se emitieron mientras seguían llegando tokens
+    posicion = next(i for i, e in enumerate(eventos) if "suggested_questions" in e)
+    assert eventos[posicion]["suggested_questions"][0] == "¿Y en Ancud?"
+    assert any("token" in e for e in eventos[posicion + 1:])
+
+
+def test_respuesta_corta_pide_sugeridas_al_terminar(monkeypatch):
+    client, pedidas_con = _preparar(monkeypatch, ["Hola."])
+
+    resp = client.post("/chat/stream", json={"message": "hola", "history": []})
+
+    eventos = _eventos(resp.text)
+    assert pedidas_con == ["Hola."]
+    assert any("suggested_questions" in e for e in eventos)
+    assert "meta" in eventos[-1]
@@ -0,0 +1,63 @@
+"""Tests para memo_service: memo por versión de datos, acotado y con copias."""
+import pytest
+
+from data_adapter import data_adapter
+from services import memo_service as ms
+
+
+@pytest.fixture()
+def pedidos_versionados(monkeypatch):
+    pedidos = [{'fecha': '01-01-2026', 'usuario': 'a@x.cl'}]
+    monkeypatch.setattr(data_adapter, 'pedidos_antiguos_cache', pedidos)
+    monkeypatch.setattr(data_adapter, 'version_datos', 'v1')
+    ms.limpiar_memo()
+    yield pedidos
+    ms.limpiar_memo()
+
+
+def test_repetir_con_los_mismos_datos_no_recalcula(pedidos_versionados):
+    llamadas = []
+    calcular = lambda: llamadas.append(1) or {'zonas': [{'zona': 'macul'}]}
+    primero = ms.memorizar('tool:zonas', {'zone': 'todas', 'extra': None}, pedidos_versionados, calcular)
+    primero['zonas'].clear()  # quien llama modifica su copia
+    segundo = ms.memorizar('tool:zonas', {'zone': ' todas '}, pedidos_versionados, calcular)
+    assert segundo == {'zonas': [{'zona': 'macul'}]}
+    assert len(llamadas) == 1
+
+
+def test_version_nueva_u_otra_lista_recalculan(pedidos_versionados, monkeypatch):
+    llamadas = []
+    calcular = lambda: llamadas.append(1) or {'ok': True}
+    ms.memorizar('rfm', None, pedidos_versionados, calcular)
+    ms.memorizar('rfm', None, list(pedidos_versionados), calcular)  # copia: sin versión confiable
+    monkeypatch.setattr(data_adapter, 'version_datos', 'v2')
+    ms.memorizar('rfm', None, pedidos_versionados, calcular)
+    ms.memorizar('rfm', None, pedidos_versionados, calcular)
+    assert len(llamadas) == 3
+    assert ms.estadisticas_memo()['entradas'] == 1
+
+
+def test_tamano_acotado_y_errores_no_se_guardan(pedidos_versionados, monkeypatch):
+    monkeypatch.setattr(ms, 'MAX_ENTRADAS', 3)
+    for i in range(5):
+        ms.memorizar('tool', {'i': i}, pedidos_versionados, lambda: {'i': i})
+    assert ms.estadisticas_memo()['entradas'] == 3
+    assert ms.estadisticas_memo()['desalojos'] == 2
+
+    llamadas = []
+    falla = lambda: llamadas.append(1) or {'error': 'sin datos'}
+    ms.memorizar('tool:x', None, pedidos_versionados, falla)
+    ms.memorizar('tool:x', None, pedidos_versionados, falla)
+    assert len(llamadas) == 2
+
+
+def test_tools_del_chat_comparten_el_rfm(pedidos_versionados, monkeypatch):
+    from services import ai_engine, rfm_engine
+    llamadas = []
+    monkeypatch.setattr(rfm_engine, 'calcular_rfm', lambda pedidos: llamadas.append(1) or {
+        'clientes_en_riesgo': [], 'clientes_campeon': [], 'segmentos': {},
+    })
+    ai_engine._execute_tool('get_customer_segments', {'segment': 'todos'}, pedidos_versionados, {})
+    ai_engine._execute_tool('analyze_campaign', {'segment': 'en_riesgo'}, pedidos_versionados, {})
+    ai_engine._execute_tool('get_customer_segments', {}, pedidos_versionados, {})
+    assert len(llamadas) == 1
@@ -0,0 +1,80 @@
+"""Tests para next_order_service con clientes sintéticos de cadencia conocida."""
+from datetime import date, timedelta
+
+import pytest
+
+from services import next_order_service as nos
+
+HOY = date(2026, 5, 20)  # miércoles
+
+
+@pytest.fixture(autouse=True)
+def estado_limpio(monkeypatch):
+    monkeypatch.setattr(nos, '_estado', {k: None for k in nos._estado})
+
+
+def _cliente(usuario, cadencia, n, ultima_hace):
+    ultima = HOY - timedelta(days=ultima_hace)
+    return [
+        {'usuario': usuario, 'fecha': (ultima - timedelta(days=cadencia * i)).strftime('%d-%m-%Y'), 'nombrelocal': 'Aguas Ancud'}
+        for i in range(n)
+    ]
+
+
+def _pedidos():
+    pedidos = []
+    for i in range(30):
+        pedidos += _cliente(f'semanal{i}@x.cl', 7, 12, ultima_hace=i % 7)
+        pedidos += _cliente(f'quincenal{i}@x.cl', 14, 8, ultima_hace=i % 14)
+    pedidos += _cliente('perdido@x.cl', 7, 10, ultima_hace=200)
+    pedidos += _cliente('nuevo@x.cl', 1, 1, ultima_hace=3)
+    return pedidos
+
+
+def test_cadencia_personal_y_proximo_pedido_condicionado_a_la_espera():
+    tabla = nos.obtener_tabla_proximos_pedidos(_pedidos(), 'v1', hoy=HOY)
+    semanal = nos.prediccion_cliente(tabla, 'semanal3@x.cl')   # pidió hace 3 días
+    assert semanal['cadencia_dias'] == pytest.approx(7, abs=0.5)
+    assert semanal['proximo_pedido']['p50'] == (HOY + timedelta(days=4)).isoformat()
+    assert semanal['proximo_pedido']['p10'] <= semanal['proximo_pedido']['p50']
+    quincenal = nos.prediccion_cliente(tabla, 'quincenal1@x.cl')
+    assert quincenal['probabilidad_7_dias'] < semanal['probabilidad_7_dias']
+
+    # Esperó mucho más que cualquier intervalo observado: sin fecha estimable.
+    perdido = nos.prediccion_cliente(tabla, 'perdido@x.cl')
+    assert perdido['proximo_pedido']['p50'] is None
+    assert perdido['probabilidad_7_dias'] < 0.05
+
+
+def test_dia_preferido_y_lista_de_esperados():
+    tabla = nos.obtener_tabla_proximos_pedidos(_pedidos(), 'v1', hoy=HOY)
+    semanal = nos.prediccion_cliente(tabla, 'semanal0@x.cl')
+    assert semanal['dia_preferido'] == 'miércoles'
+    esperados = nos.proximos_pedidos(tabla, dias=3)
+    assert esperados and all(c['proximo_pedido']['p50'] <= (HOY + timedelta(days=3)).isoformat() for c in esperados)
+    assert [c['proximo_pedido']['p50'] for c in esperados] == sorted(c['proximo_pedido']['p50'] for c in esperados)
+
+
+def test_refresco_incremental_solo_recalcula_clientes_con_pedidos_nuevos():
+    pedidos = _pedidos()
+    primera = nos.obtener_tabla_proximos_pedidos(pedidos, 'v1', hoy=HOY)
+    assert primera['clientes_recalculados'] == primera['resumen']['clientes']
+    assert nos.obtener_tabla_proximos_pedidos(pedidos, 'v1', hoy=HOY) is primera
+
+    nuevo_pedido = {'usuario': 'semanal3@x.cl', 'fecha': HOY.strftime('%d-%m-%Y'), 'nombrelocal': 'Aguas Ancud'}
+    incremental = nos.obtener_tabla_proximos_pedidos(pedidos + [nuevo_pedido], 'v2', hoy=HOY)
+    assert incremental['clientes_recalculados'] == 1
+
+    nos._estado.update({k: None for k in nos._estado})
+    completa = nos.obtener_tabla_proximos_pedidos(pedidos + [nuevo_pedido], 'v2', hoy=HOY)
+    por_usuario = lambda t: {c['usuario']: c for c in t['clientes']}
+    assert por_usuario(incremental) == por_usuario(completa)
+
+
+def test_endpoint_rechaza_dias_y_limite_fuera_de_rango():
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    assert client.get("/predictor/proximos-pedidos", params={"limite": -1}).status_code == 422
+    assert client.get("/predictor/proximos-pedidos", params={"dias": 100000}).status_code == 422
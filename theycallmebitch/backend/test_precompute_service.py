@@ -0,0 +1,80 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services import precompute_service as ps
+
+
+@pytest.fixture(autouse=True)
+def cache_aislado(tmp_path, monkeypatch):
+    monkeypatch.setattr(ps, 'RUTA_CACHE', str(tmp_path / 'precalculos.json'))
+    monkeypatch.setattr(ps, '_cache', None)
+
+
+def test_guarda_resultado_con_hora_de_calculo_y_sobrevive_reinicio(monkeypatch):
+    ps.guardar_precalculo('demanda', {'manana': 5}, 'v1')
+    monkeypatch.setattr(ps, '_cache', None)
+    entrada = ps.obtener_precalculo('demanda')
+    assert entrada['resultado'] == {'manana': 5}
+    assert entrada['version_datos'] == 'v1'
+    assert entrada['calculado_en'][:10] == ps._ahora_chile().date().isoformat()
+
+
+def test_solo_recalcula_si_cambian_los_datos_o_el_dia():
+    llamadas = []
+    tareas = {'demanda': lambda: llamadas.append(1) or {'ok': True}}
+
+    assert ps.ejecutar_precalculos(tareas, 'v1') == ['demanda']
+    assert ps.ejecutar_precalculos(tareas, 'v1') == []
+    assert ps.ejecutar_precalculos(tareas, 'v2') == ['demanda']
+
+    # Cierre del día: el cálculo de ayer ya no está vigente aunque los datos no cambien.
+    ps._cache['demanda']['calculado_en'] = (ps._ahora_chile().date() - timedelta(days=1)).isoformat() + 'T23:59:00'
+    assert ps.ejecutar_precalculos(tareas, 'v2') == ['demanda']
+    assert len(llamadas) == 3
+
+
+def test_el_cierre_del_dia_es_medianoche_de_chile_no_de_utc(monkeypatch):
+    reloj = {'utc': datetime(2026, 3, 11, 19, 0, tzinfo=timezone.utc)}  # 15:00 en Chile
+
+    class RelojUTC(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return reloj['utc'].astimezone(tz) if tz else reloj['utc'].replace(tzinfo=None)
+
+    monkeypatch.setattr(ps, 'datetime', RelojUTC)
+    ps.guardar_precalculo('demanda', {'manana': 5}, 'v1')
+    assert ps.obtener_precalculo('demanda')['calculado_en'] == '2026-03-11T15:00:00'
+
+    # 01:30 UTC del 12 = 21:30 del 11 en Chile: aún no cierra el día
+    reloj['utc'] = datetime(2026, 3, 12, 1, 30, tzinfo=timezone.utc)
+    assert not ps.necesita_precalculo('demanda', 'v1')
+    # 04:30 UTC = 00:30 del 12 en Chile
+    reloj['utc'] = datetime(2026, 3, 12, 4, 30, tzinfo=timezone.utc)
+    assert ps.necesita_precalculo('demanda', 'v1')
+
+
+def test_error_en_una_tarea_no_borra_el_ultimo_resultado_ni_frena_las_demas():
+    ps.guardar_precalculo('demanda', {'manana': 5}, 'v1')
+
+    def falla():
+        raise RuntimeError('xgboost explotó')
+
+    actualizadas = ps.ejecutar_precalculos({'demanda': falla, 'riesgo': lambda: {'clientes': []}}, 'v2')
+    assert actualizadas == ['riesgo']
+    assert ps.obtener_precalculo('demanda')['resultado'] == {'manana': 5}
+
+
+def test_programador_corre_en_segundo_plano_sin_bloquear(monkeypatch):
+    llamadas = []
+
+    async def correr():
+        tarea = asyncio.create_task(ps.programador_precalculos(
+            {'demanda': lambda: llamadas.append(1) or {'ok': True}}, lambda: 'v1', intervalo_segundos=0.01,
+        ))
+        await asyncio.sleep(0.1)
+        tarea.cancel()
+
+    asyncio.run(correr())
+    assert llamadas == [1]  # varias pasadas, un solo cálculo para la misma versión
@@ -44,3 +44,53 @@ def test_rfm_sigue_devolviendo_los_mismos_campos_de_siempre():
         'clientes_campeon',
     ):
         assert campo in resultado
+
+
+def _pedido_fecha(usuario, fecha, precio=2000):
+    return {'usuario': usuario, 'fecha': fecha.strftime('%d-%m-%Y'), 'precio': str(precio), 'nombrelocal': 'Aguas Ancud'}
+
+
+def _historial_varios_meses():
+    inicio = (datetime.now().replace(day=1) - timedelta(days=120)).replace(day=1)
+    pedidos = []
+    for i in range(12):
+        usuario = f'cliente{i}@fluvi.cl'
+        for semana in range(0, 16, 1 + i % 4):
+            pedidos.append(_pedido_fecha(usuario, inicio + timedelta(days=7 * semana + i), precio=2000 * (1 + i % 3)))
+    return pedidos
+
+
+def test_segmentos_por_mes_solo_incluye_meses_cerrados():
+    from services.rfm_engine import SEGMENTOS, calcular_segmentos_por_mes
+    snapshots = calcular_segmentos_por_mes(_historial_varios_meses())
+    mes_actual = datetime.now().strftime('%Y-%m')
+    assert snapshots
+    assert mes_actual not in snapshots
+    assert list(snapshots) == sorted(snapshots)
+    for segmentos in snapshots.values():
+        assert set(segmentos.values()) <= set(SEGMENTOS)
+
+
+def test_segmentos_por_mes_extiende_desde_el_ultimo_mes_guardado():
+    from services.rfm_engine import calcular_segmentos_por_mes
+    pedidos = _historial_varios_meses()
+    completo = calcular_segmentos_por_mes(pedidos)
+    meses = sorted(completo)
+    incremental = calcular_segmentos_por_mes(pedidos, desde_mes=meses[1])
+    assert sorted(incremental) == meses[2:]
+    for mes in incremental:
+        assert incremental[mes] == completo[mes]
+
+
+def test_matriz_transicion_cuenta_movimientos_entre_meses():
+    from services.rfm_engine import matriz_transicion_segmentos
+    snapshots = {
+        '2026-01': {'a': 'campeon', 'b': 'leal'},
+        '2026-02': {'a': 'en_riesgo', 'b': 'leal', 'c': 'nuevo'},
+    }
+    resultado = matriz_transicion_segmentos(snapshots)
+    assert resultado['meses'] == ['2026-01', '2026-02']
+    assert resultado['matriz']['campeon']['en_riesgo'] == 1
+    assert resultado['matriz']['leal']['leal'] == 1
+    assert resultado['matriz']['sin_historial']['nuevo'] == 1
+    assert resultado['transiciones_por_mes'][0]['desde'] == '2026-01'
@@ -46,3 +46,36 @@ def test_coincidencia_de_trimestre_en_anos_viejos_no_recientes_es_real():
     clientes_inactivos = [{'usuario': 'random@fluvi.cl'}]
     resultado = clasificar_churn_estacional(pedidos, clientes_inactivos)
     assert resultado['clientes'][0]['clasificacion'] == 'real'
+
+
+def test_clasifica_miles_de_inactivos_en_una_pasada():
+    # 1500 estacionales (Q0 en 2023 y 2024) + 1500 reales (trimestres
+    # distintos cada año) + un inactivo sin ningún pedido registrado.
+    pedidos = []
+    inactivos = []
+    for i in range(1500):
+        est = f'est{i}@fluvi.cl'
+        pedidos += [_pedido(est, '10-01-2023'), _pedido(est, '10-02-2024'), _pedido(est, '10-08-2024')]
+        real = f'real{i}@fluvi.cl'
+        pedidos += [_pedido(real, '10-01-2023'), _pedido(real, '10-05-2024'), _pedido(real, '10-08-2024')]
+        inactivos += [{'usuario': est}, {'usuario': real}]
+    inactivos.append({'usuario': 'fantasma@fluvi.cl'})
+
+    resultado = clasificar_churn_estacional(pedidos, inactivos)['clientes']
+
+    assert len(resultado) == len(inactivos)
+    assert [c['usuario'] for c in resultado] == [c['usuario'] for c in inactivos]
+    por_usuario = {c['usuario']: c['clasificacion'] for c in resultado}
+    assert all(por_usuario[f'est{i}@fluvi.cl'] == 'estacional' for i in range(1500))
+    assert all(por_usuario[f'real{i}@fluvi.cl'] == 'real' for i in range(1500))
+    assert por_usuario['fantasma@fluvi.cl'] == 'real'
+
+
+def test_pedidos_de_otro_local_no_cuentan():
+    pedidos = [
+        {**_pedido('otro@fluvi.cl', '15-12-2023'), 'nombrelocal': 'Otro Local'},
+        {**_pedido('otro@fluvi.cl', '18-12-2024'), 'nombrelocal': 'Otro Local'},
+        {**_pedido('otro@fluvi.cl', '20-12-2024'), 'nombrelocal': 'Otro Local'},
+    ]
+    resultado = clasificar_churn_estacional(pedidos, [{'usuario': 'otro@fluvi.cl'}])
+    assert resultado['clientes'][0]['clasificacion'] == 'real'
@@ -0,0 +1,73 @@
+import json
+
+from services import tool_output_service as tos
+
+
+def _clientes(n):
+    return [
+        {"usuario": f"cliente{i}@x.cl", "direccion": "calle larga 123, puente alto",
+         "gasto_promedio": 17777.777, "probabilidad_reorden": 0.123456, "dias_atraso": 30.0}
+        for i in range(n)
+    ]
+
+
+def test_quita_campos_recorta_top_k_y_compacta_numeros():
+    resultado = {"resumen": {"activos": 3}, "clientes": _clientes(100)}
+    formado = json.loads(tos.formar_resultado("get_customer_risk", resultado, presupuesto=100_000))
+
+    assert len(formado["clientes"]) == 25
+    assert formado["_recortes"] == {"clientes": {"mostrados": 25, "total": 100}}
+    assert formado["clientes"][0] == {
+        "usuario": "cliente0@x.cl", "gasto_promedio": 17778,
+        "probabilidad_reorden": 0.123, "dias_atraso": 30,
+    }
+    # El original queda intacto (recomendaciones y memo lo usan completo)
+    assert len(resultado["clientes"]) == 100
+    assert "direccion" in resultado["clientes"][0]
+
+
+def test_respeta_el_presupuesto_partiendo_la_lista_mas_larga():
+    resultado = {"total_clientes": 500, "lista_a": _clientes(200), "lista_b": _clientes(5)}
+    texto = tos.formar_resultado("tool_sin_forma", resultado, presupuesto=600)
+    formado = json.loads(texto)
+
+    assert tos.contar_tokens(texto) <= 600
+    assert formado["total_clientes"] == 500
+    assert formado["_recortes"]["lista_a"]["total"] == 200
+    assert len(formado["lista_a"]) < 200
+    assert tos.ESTADISTICAS_FORMA["tool_sin_forma"]["tokens_enviados"] < \
+        tos.ESTADISTICAS_FORMA["tool_sin_forma"]["tokens_originales"]
+
+
+def test_segmentos_sin_mapa_por_cliente_y_errores_sin_tocar():
+    rfm = {"total_clientes": 2, "segmento_por_cliente": {"a": "leal", "b": "perdido"}, "clientes_en_riesgo": []}
+    assert "segmento_por_cliente" not in json.loads(tos.formar_resultado("get_customer_segments", rfm))
+
+    error = {"error": "Inventario no disponible"}
+    assert json.loads(tos.formar_resultado("get_inventory", error)) == error
+
+
+def test_fracciones_chicas_no_se_redondean_a_cero():
+    formado = json.loads(tos.formar_resultado("tool_sin_forma", {"tasa": 0.004123, "elasticidad": -0.0072, "margen": 60.24}))
+    assert formado == {"tasa": 0.00412, "elasticidad": -0.0072, "margen": 60.2}
+
+
+def test_rentabilidad_quita_derivados_y_recorta_listas_anidadas():
+    insights = [{"tipo": "positivo", "titulo": f"Insight {i}", "descripcion": "..."} for i in range(6)]
+    resultado = {
+        "rentabilidad": {
+            "metricas_principales": {"ventas_mes": 708000, "margen_neto_porcentaje": 60.2},
+            "analisis_avanzado": {"escenarios_rentabilidad": {"optimista": {}}, "roi": {}, "proyecciones": {"mes_1": 1}},
+            "insights": insights,
+            "fecha_analisis": "2026-10-19T17:02:52",
+        },
+        "reporte_ejecutivo": {"metricas": {"ventas_mes": 656000}, "insights": insights[:2], "fecha_generacion": "x"},
+    }
+    formado = json.loads(tos.formar_resultado("get_rentabilidad_reportes", resultado))
+
+    assert formado["rentabilidad"]["analisis_avanzado"] == {"proyecciones": {"mes_1": 1}}
+    assert "fecha_analisis" not in formado["rentabilidad"]
+    assert "fecha_generacion" not in formado["reporte_ejecutivo"]
+    assert len(formado["rentabilidad"]["insights"]) == 3
+    assert formado["_recortes"] == {"rentabilidad.insights": {"mostrados": 3, "total": 6}}
+    assert len(resultado["rentabilidad"]["insights"]) == 6
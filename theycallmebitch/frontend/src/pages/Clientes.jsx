@@ -52,7 +52,7 @@ import {
   Notifications as NotificationsIcon,
   NotificationsActive as NotificationsActiveIcon
 } from '@mui/icons-material';
-import { getClientes, getPedidos } from '../services/api';
+import { getClientes, getPedidos, buscarClientes } from '../services/api';
 import './Clientes.css';
 
 // Los datos de clientes ahora se obtienen del backend
@@ -142,11 +142,31 @@ export default function Clientes({ refreshTrigger = 0 }) {
 
 
 
+  // Búsqueda tolerante a typos en el backend (índice de trigramas): desde
+  // 3 caracteres, con debounce. usuario -> puntaje de similitud.
+  const [puntajesBusqueda, setPuntajesBusqueda] = useState(null);
+  useEffect(() => {
+    const termino = searchTerm.trim();
+    if (termino.length < 3) {
+      setPuntajesBusqueda(null);
+      return undefined;
+    }
+    let cancelado = false;
+    const timer = setTimeout(async () => {
+      const resultados = await buscarClientes(termino);
+      if (!cancelado) {
+        setPuntajesBusqueda(new Map(resultados.map(r => [r.usuario, r.puntaje])));
+      }
+    }, 250);
+    return () => { cancelado = true; clearTimeout(timer); };
+  }, [searchTerm]);
+
   // Filtros de clientes (usar clientesConEstado) - Incluye búsqueda por dirección
   const filteredClientes = React.useMemo(() => {
     return clientesConEstado.filter(cliente => {
       const searchLower = searchTerm.toLowerCase();
       const matchesSearch = 
+        (puntajesBusqueda && puntajesBusqueda.has(cliente.email)) ||
         (cliente.nombre || '').toLowerCase().includes(searchLower) ||
         (cliente.email || '').toLowerCase().includes(searchLower) ||
         (cliente.direccion || '').toLowerCase().includes(searchLower);
@@ -154,13 +174,17 @@ export default function Clientes({ refreshTrigger = 0 }) {
       const matchesTipo = filterTipo === 'Todos' || cliente.tipo === filterTipo;
       return matchesSearch && matchesEstado && matchesTipo;
     })
-    // Ordenar: primero activos, luego inactivos
+    // Ordenar: con búsqueda, por similitud; si no, primero activos, luego inactivos
     .sort((a, b) => {
+      if (puntajesBusqueda) {
+        const diferencia = (puntajesBusqueda.get(b.email) || 0) - (puntajesBusqueda.get(a.email) || 0);
+        if (diferencia !== 0) return diferencia;
+      }
       if (a.estado === b.estado) return 0;
       if (a.estado === 'Activo') return -1;
       return 1;
     });
-  }, [clientesConEstado, searchTerm, filterEstado, filterTipo]);
+  }, [clientesConEstado, searchTerm, filterEstado, filterTipo, puntajesBusqueda]);
 
   // Estado para paginación (debe ir después de filteredClientes)
   const [pagina, setPagina] = useState(1);
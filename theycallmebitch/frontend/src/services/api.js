@@ -226,6 +226,20 @@ export const getPredictorClientesRiesgo = async () => {
 
 
 
+export const buscarClientes = async (q, limite = 50) => {
+  try {
+    const params = new URLSearchParams({ q, limite: String(limite) });
+    const response = await fetch(`${API_URL}/clientes/buscar?${params}`);
+    if (!response.ok) {
+      throw new Error('Error al buscar clientes');
+    }
+    return await response.json();
+  } catch (error) {
+    console.error('Error buscando clientes:', error);
+    return [];
+  }
+};
+
 export const getHeatmap = async (meses) => {
   try {
     const query = meses ? `?meses=${meses}` : '';